@@ -7,6 +7,8 @@ GitHub Pages 測試服務器
 python3 github-pages-server.py --mode=repo-root    # 整個倉庫為根目錄（預設）
 python3 github-pages-server.py --mode=docs         # 模擬 docs/ 目錄部署
 python3 github-pages-server.py --mode=flat         # 扁平結構部署
+python3 github-pages-server.py --no-image-proxy    # 停用延遲圖片取得（只提供已存在的圖片）
+python3 github-pages-server.py --no-image-pack     # 不使用圖片封裝檔（每張圖片各自開檔讀取）
 """
 
 import http.server
@@ -19,11 +21,40 @@ import shutil
 import tempfile
 from pathlib import Path
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+from image_proxy import LazyImageProxy
+from image_pack import ImagePack
+
 PORT = 8003
 
 class GitHubPagesHandler(http.server.SimpleHTTPRequestHandler):
     """自定義處理器，模擬 GitHub Pages 行為"""
 
+    image_proxy = None  # LazyImageProxy：圖片不存在但有來源對應時，第一次請求才向來源取得
+    image_pack = None   # ImagePack：已封裝的圖片直接由封裝檔送出
+
+    def do_GET(self):
+        if not self.send_packed_image():
+            super().do_GET()
+
+    def do_HEAD(self):
+        if not self.send_packed_image(head_only=True):
+            super().do_HEAD()
+
+    def send_packed_image(self, head_only=False):
+        """路徑在圖片封裝檔中時直接回應，返回是否已處理"""
+        if self.image_pack is None:
+            return False
+        return self.image_pack.send(self, self.translate_path(self.path), head_only)
+
+    def send_head(self):
+        # 延遲模式爬取的圖片在第一次被請求時才取得並存入內容儲存
+        if self.image_proxy is not None:
+            local_path = self.translate_path(self.path)
+            if not os.path.exists(local_path):
+                self.image_proxy.ensure(local_path)
+        return super().send_head()
+
     def end_headers(self):
         # 添加 CORS 頭，允許跨域請求（模擬 GitHub Pages）
         self.send_header('Access-Control-Allow-Origin', '*')
@@ -35,6 +66,11 @@ class GitHubPagesHandler(http.server.SimpleHTTPRequestHandler):
         """自定義日誌格式"""
         print(f"[{self.date_time_string()}] {format % args}")
 
+class ThreadingServer(socketserver.ThreadingTCPServer):
+    """每個請求一個執行緒（等待來源圖片時不阻塞其他請求）"""
+    allow_reuse_address = True
+    daemon_threads = True
+
 def setup_repo_root_mode():
     """配置 A: 整個倉庫為根目錄"""
     print("🔧 設定模式：整個倉庫為根目錄")
@@ -90,6 +126,12 @@ def setup_flat_mode():
         shutil.rmtree(temp_dir, ignore_errors=True)
         sys.exit(1)
 
+def images_root_for_mode(mode, work_dir):
+    """各模式下圖片根目錄的本機路徑"""
+    if mode == "repo-root":
+        return os.path.join(work_dir, 'web', 'images')
+    return os.path.join(work_dir, 'images')
+
 def print_test_urls(mode, port):
     """打印測試 URL"""
     base_url = f"http://localhost:{port}"
@@ -166,6 +208,8 @@ def main():
     parser.add_argument('--port', type=int, default=PORT, help='服務器端口')
     parser.add_argument('--no-browser', action='store_true', help='不自動打開瀏覽器')
     parser.add_argument('--test-only', action='store_true', help='只執行測試，不啟動互動式服務器')
+    parser.add_argument('--no-image-proxy', action='store_true', help='停用延遲圖片取得')
+    parser.add_argument('--no-image-pack', action='store_true', help='不使用圖片封裝檔')
 
     args = parser.parse_args()
 
@@ -188,8 +232,14 @@ def main():
         # 打印測試 URL
         print_test_urls(args.mode, args.port)
 
+        images_root = images_root_for_mode(args.mode, work_dir)
+        if not args.no_image_proxy:
+            GitHubPagesHandler.image_proxy = LazyImageProxy(images_root)
+        if not args.no_image_pack:
+            GitHubPagesHandler.image_pack = ImagePack(images_root)
+
         # 啟動服務器
-        with socketserver.TCPServer(("", args.port), GitHubPagesHandler) as httpd:
+        with ThreadingServer(("", args.port), GitHubPagesHandler) as httpd:
             print(f"\n📡 服務器啟動成功！")
             print(f"   - 模式：{args.mode}")
             print(f"   - 地址：http://localhost:{args.port}")
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Google Maps 多店家並行爬蟲
+功能: 讀取店家清單，以多個行程各自啟動無頭 Chrome 並行爬取（評論逐則寫入各店家的 NDJSON），
+      所有工作行程結束後由主行程依序產生每個店家獨立的 JSON（含圖片處理與已保存評論索引），
+      最後產生一份合併摘要
+
+使用方法:
+    python batch_crawl.py places.json --workers 4
+
+places.json 格式:
+    [
+        {"url": "https://www.google.com/maps/place/...", "business_name": "築宜系統傢俱", "location": "桃園店"},
+        {"url": "...", "business_name": "...", "location": "...", "keyword": "Nick", "wanted_reviews": 50}
+    ]
+"""
+
+import os
+import re
+import sys
+import json
+import queue
+import argparse
+import multiprocessing
+from datetime import datetime
+
+from google_reviews_scraper import (GoogleReviewsScraper, ScrapingMode, ScrapingConfig, UserConfig, finalize_run,
+                                    optimize_stored_images)
+from browser_service import BrowserPool, blocked_url_patterns
+from image_pack import build_pack
+from rate_limiter import RateLimiterManager
+from review_index import SeenReviewIndex
+from review_store import ReviewStore
+
+DATA_DIR = "../web/data"
+POLL_SECONDS = 5  # 等待佇列時每隔幾秒檢查一次工作行程是否仍在執行
+
+
+def place_slug(place, index):
+    """產生店家的檔名代稱（保留中英文、數字與底線）"""
+    name = f"{place.get('business_name', '')}_{place.get('location', '')}".strip('_')
+    slug = re.sub(r'\W+', '_', name).strip('_')
+    return f"{index:02d}_{slug}" if slug else f"{index:02d}_place"
+
+
+def failed_summary(place, error):
+    """爬取失敗（或未取得結果）的店家摘要"""
+    return {
+        'business_name': place.get('business_name', ''),
+        'location': place.get('location', ''),
+        'url': place.get('url', ''),
+        'file': None,
+        'total_reviews': 0,
+        'error': error
+    }
+
+
+def crawl_place(place, output_name, browser_pool=None, rate_limiter=None, review_store=None):
+    """爬取單一店家（評論逐則寫入 NDJSON），返回摘要；網站 JSON 由主行程在所有工作行程結束後產生"""
+    scraping_mode = ScrapingMode()
+    if place.get('keyword'):
+        scraping_mode.mode = 1
+        scraping_mode.filter_keyword = place['keyword']
+
+    scraper = GoogleReviewsScraper(
+        headless=True,
+        scraping_mode=scraping_mode,
+        business_name=place.get('business_name', ''),
+        location=place.get('location', ''),
+        wanted_reviews=place.get('wanted_reviews'),
+        output_name=output_name,
+        browser_pool=browser_pool,
+        rate_limiter=rate_limiter,
+        review_store=review_store
+    )
+
+    try:
+        start_time = datetime.now()
+        review_count = scraper.scrape_reviews(place['url'])
+        duration = (datetime.now() - start_time).total_seconds()
+    finally:
+        scraper.close()
+
+    return {
+        'business_name': place.get('business_name', ''),
+        'location': place.get('location', ''),
+        'url': place['url'],
+        'ndjson': scraper.ndjson_path if review_count else None,
+        'file': None,
+        'total_reviews': review_count,
+        'total_images': 0,
+        'average_rating': None,
+        'duration_seconds': round(duration, 1),
+        'error': None if review_count else '未能成功爬取評論'
+    }
+
+
+def worker(worker_id, task_queue, result_queue, rate_limiter=None):
+    """工作行程：從有界佇列取出店家依序爬取，直到收到結束訊號（同一個 Chrome 保溫重複使用，
+    rate_limiter 為所有工作行程共用的限制器代理）"""
+    print(f"[worker {worker_id}] 已啟動")
+    try:
+        browser_pool = BrowserPool(
+            size=1, headless=True,
+            performance_logging=ScrapingConfig.EXTRACTION_MODE.value == 'network',
+            lean=ScrapingConfig.LEAN_PROFILE.value,
+            blocked_patterns=blocked_url_patterns(
+                ScrapingConfig.BLOCKED_URL_PATTERNS.value, ScrapingConfig.BLOCKED_RESOURCE_TYPES.value
+            )
+        ).start()
+    except Exception as e:
+        print(f"[worker {worker_id}] 預先啟動 Chrome 失敗，改為每個店家各自啟動: {e}")
+        browser_pool = None
+    review_store = ReviewStore(ScrapingConfig.REVIEW_DB_PATH.value)  # 同一工作行程的所有店家共用一個連線
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+
+        place, output_name = task
+        print(f"[worker {worker_id}] 開始爬取 {output_name}")
+        try:
+            summary = crawl_place(place, output_name, browser_pool, rate_limiter, review_store)
+        except Exception as e:
+            summary = failed_summary(place, str(e))
+        summary['worker'] = worker_id
+        summary['output_name'] = output_name
+        result_queue.put(summary)
+        print(f"[worker {worker_id}] 完成 {output_name}: {summary['total_reviews']} 則評論")
+
+    if browser_pool:
+        browser_pool.close()
+    review_store.close()
+    print(f"[worker {worker_id}] 已結束")
+
+
+def run_batch(places, workers, queue_size):
+    """以 workers 個行程並行爬取所有店家，返回各店家摘要"""
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    task_queue = multiprocessing.Queue(maxsize=queue_size)
+    result_queue = multiprocessing.Queue()
+
+    # 所有工作行程共用同一份主機分組節流，總請求速率維持設定值，不隨 workers 倍增
+    manager = RateLimiterManager()
+    manager.start()
+    rate_limiter = manager.HostRateLimiter(ScrapingConfig.RATE_LIMITS.value)
+
+    processes = [
+        multiprocessing.Process(target=worker, args=(i + 1, task_queue, result_queue, rate_limiter), daemon=True)
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    def any_alive():
+        return any(process.is_alive() for process in processes)
+
+    def put_task(task):
+        """佇列有上限，工作行程忙碌時 put 會阻塞；所有工作行程都已結束時放棄，返回是否放入"""
+        while True:
+            try:
+                task_queue.put(task, timeout=POLL_SECONDS)
+                return True
+            except queue.Full:
+                if not any_alive():
+                    return False
+
+    # 輸出名稱 -> 店家，尚未取得結果的任務
+    pending = {f"{timestamp}_{place_slug(place, index)}": place for index, place in enumerate(places, 1)}
+    for output_name, place in pending.items():
+        if not put_task((place, output_name)):
+            break
+    for _ in processes:
+        if not put_task(None):
+            break
+
+    # 工作行程異常結束（例如 Chrome 使行程崩潰）時不會回傳結果，不能無限等待
+    results = []
+    while pending:
+        try:
+            summary = result_queue.get(timeout=POLL_SECONDS)
+        except queue.Empty:
+            if any_alive():
+                continue
+            try:
+                summary = result_queue.get(timeout=1)  # 行程結束前送出、仍在管道中的結果
+            except queue.Empty:
+                break
+        pending.pop(summary.get('output_name'), None)
+        results.append(summary)
+
+    if pending:
+        exit_codes = ', '.join(f"worker {i + 1}: {process.exitcode}" for i, process in enumerate(processes))
+        print(f"⚠️  {len(pending)} 個店家未取得結果，工作行程結束代碼: {exit_codes}")
+        for output_name, place in pending.items():
+            summary = failed_summary(place, f"工作行程異常結束，未取得結果 ({exit_codes})")
+            summary['output_name'] = output_name
+            results.append(summary)
+        task_queue.cancel_join_thread()  # 尚未被取走的任務不再送出，避免主行程結束時卡住
+
+    for process in processes:
+        process.join()
+    manager.shutdown()
+
+    return timestamp, results
+
+
+def finalize_places(results):
+    """所有工作行程結束後，在主行程依序由各店家的 NDJSON 產生網站 JSON 並更新摘要：圖片最佳化只執行一次，
+    衍生圖片、拼接圖、評論資料庫與已保存評論索引都在這一步完成（工作行程是 daemon，不能再開行程池，
+    索引也是單一 JSON 檔，只由主行程寫入）"""
+    process_images = UserConfig.ENABLE_IMAGES.value and not ScrapingConfig.LAZY_IMAGES.value
+    if process_images:
+        optimize_stored_images()
+
+    review_store = ReviewStore(ScrapingConfig.REVIEW_DB_PATH.value)
+    review_index = SeenReviewIndex(ScrapingConfig.REVIEW_INDEX_PATH.value)
+    try:
+        for summary in results:
+            ndjson_path = summary.pop('ndjson', None)
+            if not ndjson_path:
+                continue
+            json_filename = os.path.join(DATA_DIR, f"{summary['output_name']}.json")
+            try:
+                stats = finalize_run(
+                    ndjson_path, json_filename, review_store, review_index, process_images=process_images,
+                    incremental=UserConfig.INCREMENTAL_MODE.value, optimize=False
+                )
+            except Exception as e:
+                print(f"產生 {json_filename} 時發生錯誤: {e}")
+                summary['error'] = f"產生 JSON 時發生錯誤: {e}"
+                continue
+            summary['file'] = json_filename if stats['reviews'] else None
+            summary['total_reviews'] = stats['reviews']
+            summary['total_images'] = stats['total_images']
+            summary['average_rating'] = round(stats['rating_total'] / stats['rated'], 2) if stats['rated'] else None
+    finally:
+        review_store.close()
+
+    if process_images and ScrapingConfig.BUILD_IMAGE_PACK.value:
+        build_pack('../web/images')
+
+
+def write_summary(timestamp, results, places_file):
+    """寫入合併摘要"""
+    summary = {
+        'generated_at': datetime.now().isoformat(),
+        'places_file': places_file,
+        'total_places': len(results),
+        'succeeded_places': sum(1 for r in results if not r.get('error')),
+        'total_reviews': sum(r.get('total_reviews', 0) for r in results),
+        'total_images': sum(r.get('total_images', 0) for r in results),
+        'places': sorted(results, key=lambda r: r.get('file') or '')
+    }
+    summary_filename = os.path.join(DATA_DIR, f"{timestamp}_summary.json")
+    with open(summary_filename, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    print(f"合併摘要已保存到 {summary_filename}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Google Maps 多店家並行爬蟲')
+    parser.add_argument('places_file', help='店家清單 JSON 檔案')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help='並行的瀏覽器行程數（預設為 CPU 核心數的一半）')
+    parser.add_argument('--queue-size', type=int, default=None, help='任務佇列上限（預設為 workers 的兩倍）')
+    args = parser.parse_args()
+
+    with open(args.places_file, 'r', encoding='utf-8') as f:
+        places = json.load(f)
+    if not places:
+        print("❌ 店家清單為空")
+        return 1
+
+    workers = max(1, min(args.workers, len(places)))
+    queue_size = args.queue_size or workers * 2
+    print(f"🚀 開始並行爬取 {len(places)} 個店家，工作行程: {workers}，佇列上限: {queue_size}")
+
+    start_time = datetime.now()
+    timestamp, results = run_batch(places, workers, queue_size)
+    finalize_places(results)
+    summary = write_summary(timestamp, results, args.places_file)
+
+    print(f"\n=== 批次爬取統計結果 ===")
+    print(f"執行時間: {datetime.now() - start_time}")
+    print(f"成功店家: {summary['succeeded_places']}/{summary['total_places']}")
+    print(f"總評論數: {summary['total_reviews']}")
+    print(f"總圖片數: {summary['total_images']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
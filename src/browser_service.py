@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Chrome 瀏覽器服務模組
+功能: 從本機快取解析 chromedriver 路徑（只在快取失效時才連網），
+      並預先啟動、保溫、重設與出借 Chrome 工作階段，避免每次爬取都冷啟動
+"""
+
+import os
+import json
+import random
+import threading
+from queue import Queue, Empty
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.chrome.options import Options
+from selenium.common.exceptions import SessionNotCreatedException
+from webdriver_manager.chrome import ChromeDriverManager
+from network_capture import NetworkReviewCapture
+
+# chromedriver 路徑快取檔案
+DRIVER_CACHE_FILE = os.path.join(os.path.expanduser('~'), '.cache', 'map_info', 'chromedriver.json')
+
+USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/118.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36'
+]
+
+# 精簡模式：依資源類型封鎖的 URL 樣式（評論文字與圖片 URL 字串都不需要這些資源）
+RESOURCE_TYPE_PATTERNS = {
+    'font': ['*.woff', '*.woff2', '*.ttf', '*.otf', '*fonts.gstatic.com*'],
+    'image': ['*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico',
+              '*googleusercontent.com/*', '*gstatic.com/images*'],
+    'media': ['*.mp4', '*.webm', '*.m3u8'],
+    'map_tile': ['*/maps/vt*', '*/vt/pb=*', '*khms*.google.com*', '*/kh/v=*'],
+    'street_view': ['*streetviewpixels*', '*/cbk?*', '*geo0.ggpht.com*'],
+}
+
+LEAN_WINDOW_SIZE = '1024,768'  # 精簡模式的視窗大小
+
+_driver_path_lock = threading.Lock()
+_resolved_driver_path = None
+
+
+def resolve_chromedriver_path(cache_file=DRIVER_CACHE_FILE):
+    """取得 chromedriver 路徑：環境變數 > 行程內快取 > 本機快取檔案 > ChromeDriverManager 下載"""
+    global _resolved_driver_path
+
+    with _driver_path_lock:
+        if _resolved_driver_path and os.path.exists(_resolved_driver_path):
+            return _resolved_driver_path
+
+        env_path = os.environ.get('CHROMEDRIVER_PATH')
+        if env_path and os.path.exists(env_path):
+            _resolved_driver_path = env_path
+            return env_path
+
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                cached_path = json.load(f).get('path')
+            if cached_path and os.path.exists(cached_path):
+                _resolved_driver_path = cached_path
+                return cached_path
+        except (OSError, ValueError):
+            pass
+
+        print("正在解析 chromedriver 版本（僅在本機快取失效時執行）...")
+        driver_path = ChromeDriverManager().install()
+        try:
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            with open(cache_file, 'w', encoding='utf-8') as f:
+                json.dump({'path': driver_path}, f)
+        except OSError as e:
+            print(f"寫入 chromedriver 快取時發生錯誤: {e}")
+
+        _resolved_driver_path = driver_path
+        return driver_path
+
+
+def invalidate_chromedriver_path(cache_file=DRIVER_CACHE_FILE):
+    """清除行程內與本機快取的 chromedriver 路徑（Chrome 自動更新後快取的版本不再相符）"""
+    global _resolved_driver_path
+
+    with _driver_path_lock:
+        _resolved_driver_path = None
+        try:
+            os.remove(cache_file)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"清除 chromedriver 快取時發生錯誤: {e}")
+
+
+def build_chrome_options(headless, performance_logging=False, lean=False):
+    """建立 Chrome 啟動參數（lean=True 時使用精簡設定）"""
+    options = Options()
+    if headless:
+        options.add_argument('--headless=new' if lean else '--headless')
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-dev-shm-usage')
+    options.add_argument('--disable-gpu')
+
+    if lean:
+        # DOMContentLoaded 即返回，不等待圖片與地圖圖磚；畫面較小、不解碼圖片
+        options.page_load_strategy = 'eager'
+        options.add_argument(f'--window-size={LEAN_WINDOW_SIZE}')
+        options.add_argument('--blink-settings=imagesEnabled=false')
+        options.add_argument('--disable-extensions')
+    else:
+        options.add_argument('--window-size=1920,1080')
+
+    # 隨機 User-Agent
+    options.add_argument(f'--user-agent={random.choice(USER_AGENTS)}')
+
+    # 網路擷取模式需要 performance 日誌
+    if performance_logging:
+        NetworkReviewCapture.enable_logging(options)
+
+    return options
+
+
+def blocked_url_patterns(url_patterns=(), resource_types=()):
+    """合併自訂 URL 樣式與資源類型對應的樣式"""
+    patterns = list(url_patterns)
+    for resource_type in resource_types:
+        for pattern in RESOURCE_TYPE_PATTERNS.get(resource_type, []):
+            if pattern not in patterns:
+                patterns.append(pattern)
+    return patterns
+
+
+def apply_resource_blocking(driver, patterns):
+    """透過 DevTools Protocol 封鎖符合樣式的請求"""
+    if not patterns:
+        return
+    try:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': patterns})
+        print(f"已封鎖 {len(patterns)} 種資源樣式")
+    except Exception as e:
+        print(f"設定資源封鎖時發生錯誤: {e}")
+
+
+def launch_chrome(headless, performance_logging=False, lean=False, blocked_patterns=()):
+    """以快取的 chromedriver 啟動一個 Chrome 工作階段；版本不符時清除快取、重新解析後重試一次"""
+    options = build_chrome_options(headless, performance_logging, lean)
+    try:
+        driver = webdriver.Chrome(service=Service(resolve_chromedriver_path()), options=options)
+    except SessionNotCreatedException as e:
+        print(f"無法建立 Chrome 工作階段（Chrome 可能已自動更新），重新解析 chromedriver: {e.msg}")
+        invalidate_chromedriver_path()
+        driver = webdriver.Chrome(service=Service(resolve_chromedriver_path()), options=options)
+    if lean:
+        apply_resource_blocking(driver, blocked_patterns)
+    return driver
+
+
+class BrowserPool:
+    """常駐的 Chrome 工作階段池：預先啟動、出借、重設後歸還"""
+
+    def __init__(self, size=1, headless=True, performance_logging=False, lean=False, blocked_patterns=()):
+        """初始化瀏覽器池（尚未啟動任何瀏覽器）"""
+        self.size = size
+        self.headless = headless
+        self.performance_logging = performance_logging
+        self.lean = lean
+        self.blocked_patterns = list(blocked_patterns)
+        self.idle = Queue()
+        self.all_drivers = []
+        self.lock = threading.Lock()
+        self.starter = None  # 背景啟動的執行緒（lease 前會等待其完成）
+
+    def start(self, background=False):
+        """預先啟動 size 個 Chrome 工作階段；background=True 時在背景執行緒啟動，呼叫端可同時做其他準備"""
+        if background:
+            self.starter = threading.Thread(target=self._start_quietly, name='browser-pool-start', daemon=True)
+            self.starter.start()
+            return self
+        print(f"正在預先啟動 {self.size} 個 Chrome 工作階段...")
+        for _ in range(self.size):
+            self.idle.put(self._launch())
+        print("✅ Chrome 工作階段已就緒")
+        return self
+
+    def _start_quietly(self):
+        """背景啟動；失敗時留給 lease 自行啟動"""
+        try:
+            self.start()
+        except Exception as e:
+            print(f"背景啟動 Chrome 失敗，將在使用時重新啟動: {e}")
+
+    def _launch(self):
+        """啟動新的工作階段並登記"""
+        driver = launch_chrome(self.headless, self.performance_logging, self.lean, self.blocked_patterns)
+        with self.lock:
+            self.all_drivers.append(driver)
+        return driver
+
+    def _discard(self, driver):
+        """關閉並移除故障的工作階段"""
+        with self.lock:
+            if driver in self.all_drivers:
+                self.all_drivers.remove(driver)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def lease(self):
+        """借出一個工作階段；池中沒有閒置的就另外啟動"""
+        if self.starter:
+            self.starter.join()
+            self.starter = None
+        try:
+            return self.idle.get_nowait()
+        except Empty:
+            return self._launch()
+
+    def release(self, driver):
+        """重設工作階段狀態後歸還；重設失敗則換一個新的保溫"""
+        try:
+            handles = driver.window_handles
+            for handle in handles[1:]:
+                driver.switch_to.window(handle)
+                driver.close()
+            driver.switch_to.window(handles[0])
+            driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
+            driver.get('about:blank')
+            if self.performance_logging:
+                driver.get_log('performance')  # 清空上一個任務留下的網路事件
+            self.idle.put(driver)
+        except Exception as e:
+            print(f"重設 Chrome 工作階段失敗，改為重新啟動: {e}")
+            self._discard(driver)
+            try:
+                self.idle.put(self._launch())
+            except Exception as launch_error:
+                print(f"重新啟動 Chrome 工作階段失敗: {launch_error}")
+
+    def close(self):
+        """關閉池中所有工作階段"""
+        if self.starter:
+            self.starter.join()
+            self.starter = None
+        with self.lock:
+            drivers = list(self.all_drivers)
+            self.all_drivers.clear()
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+        print(f"已關閉 {len(drivers)} 個 Chrome 工作階段")
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
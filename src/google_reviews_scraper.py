@@ -8,35 +8,80 @@ Google Maps 評論爬蟲
 
 from enum import Enum
 import time
-import json
+import itertools
 import pandas as pd
 import re
 from datetime import datetime
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.keys import Keys
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
-from webdriver_manager.chrome import ChromeDriverManager
 import random
 import os
 from image_handler import ReviewImageHandler
+from image_pipeline import ImageDownloadPipeline, image_filename
+from image_proxy import LazySourceMap
+from image_store import ImageStore
+from image_url_cache import ImageUrlCache
+from image_derivatives import DerivativeBuilder
+from image_sprites import SpriteBuilder
+from image_pack import build_pack
+from image_optimizer import ImageOptimizer
+from image_phash import PerceptualIndex
+from review_extractors import BatchReviewExtractor, SnapshotReviewExtractor, SEEN_MARKER_ATTRIBUTE
+from page_waits import PageWaiter
+from network_capture import NetworkReviewCapture
+from review_index import SeenReviewIndex, content_digest
+from review_store import ReviewStore
+from review_writer import NdjsonReviewWriter, write_json_atomic, finalize, iter_review_batches, read_ndjson
+from browser_service import BrowserPool, launch_chrome, blocked_url_patterns
+from rate_limiter import HostRateLimiter
 
 class UserConfig(Enum):
     """用戶層配置 - 簡單直觀"""
     WANTED_REVIEWS = 10      # 期望的評論數量
     ENABLE_IMAGES = True      # 是否下載圖片
+    INCREMENTAL_MODE = False  # 增量模式 (依最新排序，遇到已保存過的評論即停止滾動)
 
 class ScrapingConfig(Enum):
     """技術層設定參數"""
     MAX_SCROLLS = 15          # 最大滾動次數 (影響評論數量: 約 5-10則/次滾動)
     HEADLESS_MODE = False     # 是否無頭模式 (True=背景執行, False=顯示瀏覽器)
     DOWNLOAD_IMAGES = True    # 是否下載圖片 (True=下載前3張圖片, False=僅文字)
-    SCROLL_DELAY = (1, 2)     # 滾動延遲秒數範圍 (min, max)
+    SCROLL_WAIT_MAX = 2       # 滾動後等待新評論的最長秒數 (新評論出現即提前返回)
+    MAX_WAIT = 10             # 所有事件驅動等待的最長秒數上限
+    WAIT_POLL_INTERVAL = 0.2  # 條件輪詢間隔秒數
     SCROLL_DISTANCE = 300     # 每次滾動距離 (像素)
+    EXTRACTION_MODE = 'batch' # 評論提取方式 ('batch'=每循環單次腳本批次提取, 'snapshot'=HTML 快照背景解析, 'network'=解析評論 RPC 回應, 'element'=逐欄位 Selenium 提取)
+    NETWORK_DUMP_DIR = None   # network 模式下保存原始回應的目錄 (None=不保存)
+    REVIEW_INDEX_PATH = '../web/data/review_index.json'  # 已保存評論索引檔案
+    STREAM_OUTPUT_DIR = '../web/data/_store'  # 爬取中逐則附加評論的 NDJSON 目錄 (<時間戳記>.ndjson，網站 JSON 由此產生)
+    STREAM_FSYNC_BATCH = 20   # NDJSON 每寫入幾則評論 fsync 一次
+    REVIEW_DB_PATH = '../web/data/_store/reviews.sqlite3'  # SQLite 評論資料庫 (底線開頭的目錄不會被 GitHub Pages 發佈)
+    INCREMENTAL_KNOWN_STREAK = 5  # 增量模式下連續遇到幾則已保存評論即停止
+    IMAGE_DOWNLOAD_WORKERS = 4  # 並行下載圖片的執行緒數
+    IMAGE_QUEUE_SIZE = 32     # 圖片下載佇列上限 (滿了會讓提取端等待)
+    USE_IMAGE_STORE = True    # 圖片以 SHA-256 內容定址保存於 web/images/_store，快照目錄使用硬連結
+    IMAGE_URL_CACHE_PATH = '../web/images/_store/url_cache.sqlite3'  # 跨執行的圖片 URL 索引 (None=停用，需搭配 USE_IMAGE_STORE)
+    IMAGE_CACHE_FRESHNESS = 7 * 24 * 3600  # URL 索引的新鮮期 (秒)，期內不發出請求，過期後以 ETag / Last-Modified 條件式請求驗證
+    IMAGE_SIZE_PROFILE = 'display'  # 圖片下載尺寸 ('display'=最長邊 1600, 'thumbnail'=480, 'original'=原始大小，或直接填最長邊像素數)
+    RATE_LIMITS = {}          # 覆寫各主機分組的速率，例如 {'googleusercontent': {'rate': 4.0, 'burst': 8}} (預設見 rate_limiter.DEFAULT_LIMITS)
+    PHASH_DEDUPE = True       # 以感知雜湊 (dHash) 偵測近似重複的圖片，改為連結既有內容 (需搭配 USE_IMAGE_STORE)
+    PHASH_THRESHOLD = 6       # 近似重複的漢明距離上限 (64 位元中)
+    OPTIMIZE_IMAGES = True    # 保存 JSON 前最佳化新下載的原圖 (去除 EXIF、套用方向、漸進式 JPEG，變小才取代；需搭配 USE_IMAGE_STORE)
+    OPTIMIZE_QUALITY = 85     # 需要旋轉而必須重新壓縮時的 JPEG 品質下限
+    GENERATE_DERIVATIVES = True  # 保存 JSON 前為圖片產生多種寬度的衍生檔並寫入 srcset 資訊
+    DERIVATIVE_WIDTHS = [320, 640, 1024]  # 衍生圖片寬度 (像素，不會放大超過原圖)
+    DERIVATIVE_FORMAT = 'webp'  # 衍生圖片格式 ('webp' 或 'avif'，avif 需要支援的 Pillow 版本)
+    DERIVATIVE_QUALITY = 75   # 衍生圖片品質
+    DERIVATIVE_WORKERS = None # 產生衍生圖片的行程數 (None=CPU 核心數)
+    GENERATE_SPRITES = True   # 保存 JSON 前將每則評論的縮圖拼成一張拼接圖，列表只需一個圖片請求
+    SPRITE_HEIGHT = 240       # 拼接圖中縮圖的高度 (像素)
+    SPRITE_QUALITY = 80       # 拼接圖 JPEG 品質
+    BUILD_IMAGE_PACK = False  # 爬取完成後重新產生圖片封裝檔，供 server.py 以 mmap / sendfile 提供圖片 (會多佔一份圖片空間)
+    LAZY_IMAGES = False       # 延遲模式: 爬取時不下載圖片，只記錄來源 URL，由 server.py 在第一次被請求時取得並快取
+    LEAN_PROFILE = False      # 精簡模式 (eager 載入、新版無頭、較小視窗、封鎖下列資源；只擷取文字與圖片 URL 時使用)
+    BLOCKED_URL_PATTERNS = [] # 精簡模式額外封鎖的 URL 樣式 (支援 * 萬用字元)
+    BLOCKED_RESOURCE_TYPES = ['font', 'image', 'media', 'map_tile', 'street_view']  # 精簡模式封鎖的資源類型
 
 class ScrapingMode:
     """爬取模式配置"""
@@ -116,54 +161,110 @@ class ScrapingMode:
             return keyword.lower() in text.lower()
 
 class GoogleReviewsScraper:
-    def __init__(self, headless=None, download_images=None, scraping_mode=None):
-        """初始化爬蟲"""
+    def __init__(self, headless=None, download_images=None, scraping_mode=None, incremental=None,
+                 business_name='築宜系統傢俱', location='桃園店', wanted_reviews=None, output_name=None,
+                 browser_pool=None, rate_limiter=None, review_store=None):
+        """初始化爬蟲（rate_limiter 可傳入多個行程共用的限制器代理，review_store 可傳入同一行程共用的
+        評論資料庫；未傳入時自行建立，自行開啟的資料庫由 close 關閉）"""
         self.headless = headless if headless is not None else ScrapingConfig.HEADLESS_MODE.value
         self.download_images = download_images if download_images is not None else UserConfig.ENABLE_IMAGES.value
+        self.incremental = incremental if incremental is not None else UserConfig.INCREMENTAL_MODE.value
+        self.review_index = SeenReviewIndex(ScrapingConfig.REVIEW_INDEX_PATH.value)  # 跨執行的已保存評論索引
+        # 所有爬取過的評論（增量合併與匯出 JSON）
+        self.owns_review_store = review_store is None
+        self.review_store = review_store or ReviewStore(ScrapingConfig.REVIEW_DB_PATH.value)
+        self.known_review_streak = 0  # 增量模式下連續遇到的已保存評論數
         self.driver = None
+        self.browser_pool = browser_pool  # 常駐瀏覽器池 (None=每次自行啟動 Chrome)
         self.reviews_data = []
         self.image_handler = None
+        self.image_pipeline = None  # 圖片下載管線（與 DOM 走訪並行）
+        self.lazy_sources = None    # 延遲模式的 快照圖片路徑 -> 來源 URL 對應表
+        self.review_writer = None   # 逐則附加完成評論的 NDJSON 輸出
+        # 頁面與圖片請求共用的主機分組節流
+        self.rate_limiter = rate_limiter or HostRateLimiter(ScrapingConfig.RATE_LIMITS.value)
         self.processed_reviews = set()  # 用於去重的集合
         self.downloaded_images = {}  # URL -> 檔案路徑的映射，用於圖片去重
         self.scraping_mode = scraping_mode if scraping_mode is not None else ScrapingMode()  # 爬取模式
         self.timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')  # 統一的時間戳記
+        self.output_name = output_name or self.timestamp  # 圖片目錄與 JSON 檔名（多店家並行時需各自不同）
+        self.ndjson_path = os.path.join(ScrapingConfig.STREAM_OUTPUT_DIR.value, f"{self.output_name}.ndjson")
+        self.business_name = business_name  # 商家名稱
+        self.location = location  # 分店名稱
+        self.wanted_reviews = wanted_reviews if wanted_reviews is not None else UserConfig.WANTED_REVIEWS.value
         self.global_review_counter = 0  # 全域評論計數器
         
+    def close(self):
+        """關閉圖片 URL 索引（不論圖片模式）與爬蟲自行開啟的評論資料庫（外部傳入的由呼叫端關閉）"""
+        if self.image_handler and self.image_handler.url_index:
+            self.image_handler.url_index.close()
+        if self.owns_review_store:
+            self.review_store.close()
+    
     def setup_driver(self):
         """設定 Chrome WebDriver"""
-        options = Options()
-        if self.headless:
-            options.add_argument('--headless')
-        options.add_argument('--no-sandbox')
-        options.add_argument('--disable-dev-shm-usage')
-        options.add_argument('--disable-gpu')
-        options.add_argument('--window-size=1920,1080')
-        
-        # 隨機 User-Agent
-        user_agents = [
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36',
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/118.0.0.0 Safari/537.36',
-            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36'
-        ]
-        options.add_argument(f'--user-agent={random.choice(user_agents)}')
-        
-        service = Service(ChromeDriverManager().install())
-        self.driver = webdriver.Chrome(service=service, options=options)
+        performance_logging = ScrapingConfig.EXTRACTION_MODE.value == 'network'
+        if self.browser_pool:
+            # 向常駐瀏覽器池借用已保溫的工作階段
+            self.driver = self.browser_pool.lease()
+        else:
+            # chromedriver 路徑由本機快取解析，不必每次連網查詢版本
+            self.driver = launch_chrome(
+                self.headless, performance_logging, ScrapingConfig.LEAN_PROFILE.value,
+                blocked_url_patterns(ScrapingConfig.BLOCKED_URL_PATTERNS.value, ScrapingConfig.BLOCKED_RESOURCE_TYPES.value)
+            )
         self.wait = WebDriverWait(self.driver, 10)
+        self.batch_extractor = BatchReviewExtractor(self.driver)
+        self.snapshot_extractor = None
+        if ScrapingConfig.EXTRACTION_MODE.value == 'snapshot':
+            self.snapshot_extractor = SnapshotReviewExtractor(self.driver)
+        self.network_capture = None
+        if ScrapingConfig.EXTRACTION_MODE.value == 'network':
+            self.network_capture = NetworkReviewCapture(self.driver, ScrapingConfig.NETWORK_DUMP_DIR.value)
+        self.page_waiter = PageWaiter(
+            self.driver, ScrapingConfig.MAX_WAIT.value, ScrapingConfig.WAIT_POLL_INTERVAL.value
+        )
         
-        # 初始化圖片處理器
+        # 逐則附加完成評論的 NDJSON（中途當機時已完成的評論仍保留，網站 JSON 由 finalize_run 以此產生）
+        self.review_writer = NdjsonReviewWriter(self.ndjson_path, ScrapingConfig.STREAM_FSYNC_BATCH.value)
+        
+        # 初始化圖片處理器與下載管線
         if self.download_images:
-            self.image_handler = ReviewImageHandler(self.driver)
+            workers = ScrapingConfig.IMAGE_DOWNLOAD_WORKERS.value
+            image_store = ImageStore('../web/images') if ScrapingConfig.USE_IMAGE_STORE.value else None
+            url_index = None
+            if image_store and ScrapingConfig.IMAGE_URL_CACHE_PATH.value:
+                url_index = ImageUrlCache(
+                    ScrapingConfig.IMAGE_URL_CACHE_PATH.value, ScrapingConfig.IMAGE_CACHE_FRESHNESS.value
+                )
+            phash_index = None
+            if image_store and ScrapingConfig.PHASH_DEDUPE.value:
+                phash_index = PerceptualIndex(image_store, ScrapingConfig.PHASH_THRESHOLD.value)
+            self.image_handler = ReviewImageHandler(
+                self.driver, pool_size=workers, image_store=image_store,
+                url_index=url_index, phash_index=phash_index, rate_limiter=self.rate_limiter,
+                size_profile=ScrapingConfig.IMAGE_SIZE_PROFILE.value
+            )
+            if ScrapingConfig.LAZY_IMAGES.value:
+                self.lazy_sources = LazySourceMap('../web/images')
+            else:
+                self.image_pipeline = ImageDownloadPipeline(
+                    self.image_handler, self.downloaded_images, workers, ScrapingConfig.IMAGE_QUEUE_SIZE.value,
+                    on_review_complete=self.stream_review
+                )
         
     def navigate_to_main_page(self, url):
         """導航到主頁面（不跳轉到評論頁面）"""
         try:
             print(f"正在打開主頁面: {url}")
+            self.rate_limiter.acquire(url)
             self.driver.get(url)
             
-            # 等待頁面載入
-            time.sleep(5)
-            print("主頁面載入完成")
+            # 等待頁面載入（就緒即返回）
+            if self.page_waiter.wait_for_page_ready():
+                print("主頁面載入完成")
+            else:
+                print(f"⚠️  主頁面在 {ScrapingConfig.MAX_WAIT.value} 秒內未完全就緒，繼續執行")
             
             return True
             
@@ -182,7 +283,7 @@ class GoogleReviewsScraper:
         
         try:
             # 等待頁面完全載入
-            time.sleep(3)
+            self.page_waiter.wait_for_page_ready()
             
             # 尋找可滾動的評論容器，嘗試更多選擇器
             scrollable_selectors = [
@@ -242,7 +343,6 @@ class GoogleReviewsScraper:
                 try:
                     old_scroll_top = self.driver.execute_script("return arguments[0].scrollTop", scrollable_element)
                     self.driver.execute_script(f"arguments[0].scrollTop += {ScrapingConfig.SCROLL_DISTANCE.value}", scrollable_element)
-                    time.sleep(1)
                     new_scroll_top = self.driver.execute_script("return arguments[0].scrollTop", scrollable_element)
                     
                     if new_scroll_top != old_scroll_top:
@@ -258,7 +358,6 @@ class GoogleReviewsScraper:
                     try:
                         old_page_scroll = self.driver.execute_script("return window.pageYOffset")
                         self.driver.execute_script(f"window.scrollBy(0, {ScrapingConfig.SCROLL_DISTANCE.value})")
-                        time.sleep(1)
                         new_page_scroll = self.driver.execute_script("return window.pageYOffset")
                         
                         if new_page_scroll != old_page_scroll:
@@ -282,11 +381,9 @@ class GoogleReviewsScraper:
                     except Exception as e:
                         print(f"❌ 鍵盤滾動異常: {e}")
                 
-                # 等待新內容載入
-                delay_range = ScrapingConfig.SCROLL_DELAY.value
-                sleep_time = random.uniform(delay_range[0], delay_range[1])
-                print(f"等待 {sleep_time:.1f} 秒載入新內容...")
-                time.sleep(sleep_time)
+                # 等待新內容載入（新評論出現即返回）
+                print(f"等待新內容載入（最長 {ScrapingConfig.SCROLL_WAIT_MAX.value} 秒）...")
+                self.page_waiter.wait_for_review_count_increase(before_scroll_count, ScrapingConfig.SCROLL_WAIT_MAX.value)
                 
                 # 檢查評論數量變化
                 after_scroll_count = self.get_current_review_count()
@@ -370,12 +467,11 @@ class GoogleReviewsScraper:
                         try:
                             # 滾動到按鈕位置
                             self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", button)
-                            time.sleep(0.5)
+                            self.page_waiter.wait_for_clickable(button, 2)
                             
                             # 點擊按鈕
                             button.click()
                             print(f"已點擊第 {i+1} 個更多按鈕")
-                            time.sleep(0.5)
                         except Exception as e:
                             print(f"點擊第 {i+1} 個更多按鈕時發生錯誤: {e}")
                     break
@@ -620,45 +716,52 @@ class GoogleReviewsScraper:
             return f"element_{hash(str(review_element))}"
     
     def save_to_json(self, reviews, filename):
-        """保存為 JSON 格式"""
+        """保存為 JSON 格式（逐則寫入暫存檔後替換，中斷時不會留下寫到一半的檔案）"""
         try:
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(reviews, f, ensure_ascii=False, indent=2)
+            write_json_atomic(reviews, filename)
             print(f"評論已保存到 {filename}")
         except Exception as e:
             print(f"保存 JSON 檔案時發生錯誤: {e}")
     
     
     def scrape_reviews(self, url):
-        """主要爬蟲流程（新的循環邏輯）"""
+        """主要爬蟲流程（新的循環邏輯）；評論逐則寫入 self.ndjson_path，返回本次取得的評論數"""
         try:
             # 設定 WebDriver
             self.setup_driver()
             
             # 導航到主頁面
             if not self.navigate_to_main_page(url):
-                return []
+                return 0
             
             # 執行新的循環式爬取邏輯
-            reviews = self.scrape_with_scroll_and_download_loop()
-            
-            return reviews
+            return self.scrape_with_scroll_and_download_loop()
             
         except Exception as e:
             print(f"爬蟲過程發生錯誤: {e}")
-            return []
+            return 0
         
         finally:
-            if self.driver:
+            # 發生錯誤時也等待背景下載並保存圖片索引，已完成的評論仍落盤，可用 review_writer.py finalize 產生 JSON
+            self.finish_image_downloads()
+            if self.review_writer:
+                self.review_writer.close()
+            if getattr(self, 'snapshot_extractor', None):
+                self.snapshot_extractor.shutdown()
+            if self.driver and self.browser_pool:
+                self.browser_pool.release(self.driver)
+                self.driver = None
+                print("已歸還瀏覽器工作階段")
+            elif self.driver:
                 self.driver.quit()
                 print("已關閉瀏覽器")
     
     def scrape_with_scroll_and_download_loop(self):
-        """新的循環邏輯：滾動→檢查→下載→判斷"""
-        target_reviews = UserConfig.WANTED_REVIEWS.value
+        """新的循環邏輯：滾動→檢查→下載→判斷（完成的評論已寫入 NDJSON，只記錄數量），返回取得的評論數"""
+        target_reviews = self.wanted_reviews
         max_no_new_reviews = 20  # 連續無新評論的最大次數
         no_new_reviews_counter = 0
-        downloaded_reviews = []
+        downloaded_count = 0
         processed_review_ids = set()
         scroll_count = 0
         max_total_scrolls = 50  # 總滾動次數上限
@@ -667,7 +770,7 @@ class GoogleReviewsScraper:
         print(f"無新評論觸底判斷: 連續 {max_no_new_reviews} 次無新評論則停止")
         
         # 等待頁面載入
-        time.sleep(3)
+        self.page_waiter.wait_for_page_ready()
         
         # 前置作業：先滾動左側區塊20次
         print("前置作業：開始滾動左側區塊20次")
@@ -677,37 +780,57 @@ class GoogleReviewsScraper:
         print("步驟0：嘗試點擊「更多評論」按鈕展開所有評論")
         self.click_show_more_reviews_button()
         
+        # 增量模式：改為最新排序，新評論會排在最前面；序號接續先前快照
+        if self.incremental:
+            self.global_review_counter = self.previous_max_review_id()
+            print(f"增量模式：評論資料庫已有 {len(self.review_store)} 則評論，切換為依最新排序")
+            self.sort_reviews_by_newest()
+        
         # 找到可滾動元素
         scrollable_element = self.find_scrollable_element()
         if not scrollable_element:
             print("❌ 無法找到可滾動元素")
-            return []
+            return 0
         
-        while len(downloaded_reviews) < target_reviews and scroll_count < max_total_scrolls:
-            cycle_start_count = len(downloaded_reviews)
+        while downloaded_count < target_reviews and scroll_count < max_total_scrolls:
+            cycle_start_count = downloaded_count
             scroll_count += 1
             
             print(f"\n=== 循環第 {scroll_count} 次 ===")
-            print(f"目前已下載: {len(downloaded_reviews)}/{target_reviews} 則評論")
+            print(f"目前已下載: {downloaded_count}/{target_reviews} 則評論")
             
             # 步驟一：滾動頁面
             print("步驟一：滾動頁面載入更多內容")
             scroll_success = self.perform_scroll(scrollable_element, scroll_count)
             
-            # 步驟二：檢查目前頁面上有多少評論
-            print("步驟二：檢查頁面上的評論數量")
-            current_review_elements = self.get_current_review_elements()
-            print(f"頁面上發現 {len(current_review_elements)} 個評論元素")
-            
-            # 步驟三：處理尚未下載的評論
-            print("步驟三：處理尚未下載的評論")
-            new_reviews_in_cycle = self.process_new_reviews(
-                current_review_elements, 
-                processed_review_ids, 
-                target_reviews - len(downloaded_reviews)
-            )
+            if ScrapingConfig.EXTRACTION_MODE.value != 'element':
+                # 步驟二：批次取得新評論紀錄（瀏覽器內腳本或網路回應）
+                print("步驟二：批次提取新評論資料")
+                review_records = self.collect_review_records()
+                print(f"本次取得 {len(review_records)} 則評論紀錄")
+                
+                # 步驟三：處理尚未下載的評論
+                print("步驟三：處理尚未下載的評論")
+                new_reviews_in_cycle = self.process_review_records(
+                    review_records,
+                    processed_review_ids,
+                    target_reviews - downloaded_count
+                )
+            else:
+                # 步驟二：只向頁面索取尚未處理過的評論節點
+                print("步驟二：檢查頁面上新載入的評論")
+                current_review_elements = self.get_current_review_elements()
+                print(f"頁面上發現 {len(current_review_elements)} 個新評論元素")
+                
+                # 步驟三：處理尚未下載的評論
+                print("步驟三：處理尚未下載的評論")
+                new_reviews_in_cycle = self.process_new_reviews(
+                    current_review_elements, 
+                    processed_review_ids, 
+                    target_reviews - downloaded_count
+                )
             
-            downloaded_reviews.extend(new_reviews_in_cycle)
+            downloaded_count += len(new_reviews_in_cycle)
             print(f"本次循環新增 {len(new_reviews_in_cycle)} 則評論")
             
             # 步驟四：判斷是否繼續
@@ -724,12 +847,51 @@ class GoogleReviewsScraper:
                 print(f"✅ 有新評論，重置無效計數器")
                 
                 # 檢查是否已達到目標
-                if len(downloaded_reviews) >= target_reviews:
+                if downloaded_count >= target_reviews:
                     print(f"🎯 已達到目標評論數量 {target_reviews}，停止爬取")
                     break
+            
+            # 增量模式：已接上先前保存過的評論，後面都是舊評論
+            if self.incremental and self.known_review_streak >= ScrapingConfig.INCREMENTAL_KNOWN_STREAK.value:
+                print(f"🛑 連續遇到 {self.known_review_streak} 則已保存的評論，增量爬取完成")
+                break
+        
+        # 最後一個循環才展開的評論還沒讀取，離開前補收（先等待展開後的文字渲染）
+        if ScrapingConfig.EXTRACTION_MODE.value != 'element' and downloaded_count < target_reviews:
+            final_records = self.collect_final_records()
+            if final_records:
+                print(f"補收 {len(final_records)} 則已展開但尚未讀取的評論")
+                downloaded_count += len(self.process_review_records(
+                    final_records,
+                    processed_review_ids,
+                    target_reviews - downloaded_count
+                ))
         
-        print(f"\n爬取完成！共獲得 {len(downloaded_reviews)} 則評論")
-        return downloaded_reviews[:target_reviews]  # 確保不超過目標數量
+        # 等待背景圖片下載完成，評論資料的圖片欄位才會完整
+        self.finish_image_downloads()
+        if self.review_writer:
+            self.review_writer.close()
+        
+        print(f"\n爬取完成！共獲得 {downloaded_count} 則評論")
+        return downloaded_count
+    
+    def finish_image_downloads(self):
+        """等待背景圖片下載完成並保存內容儲存與感知雜湊索引、延遲圖片來源（可重複呼叫）"""
+        try:
+            if self.image_pipeline:
+                print("等待背景圖片下載完成...")
+                self.image_pipeline.join()
+                self.image_pipeline = None
+                if self.image_handler.image_store:
+                    self.image_handler.image_store.save_manifest()
+                if self.image_handler.phash_index:
+                    self.image_handler.phash_index.save()
+            if self.lazy_sources is not None:
+                self.lazy_sources.save()
+                print(f"已記錄 {len(self.lazy_sources.sources)} 張延遲取得圖片的來源")
+                self.lazy_sources = None
+        except Exception as e:
+            print(f"結束圖片下載時發生錯誤: {e}")
     
     def pre_scroll_left_panel(self):
         """前置作業：滾動左側區塊30次，每次滾動後檢查並點擊「更多評論」按鈕"""
@@ -776,14 +938,15 @@ class GoogleReviewsScraper:
                 try:
                     print(f"前置滾動 {i+1}/30")
                     
-                    # 記錄滾動前位置
+                    # 記錄滾動前位置與評論數量
                     old_scroll_top = self.driver.execute_script("return arguments[0].scrollTop", scrollable_element)
+                    before_count = self.page_waiter.get_review_count()
                     
                     # 執行滾動
                     self.driver.execute_script(f"arguments[0].scrollTop += {scroll_distance}", scrollable_element)
                     
-                    # 等待內容載入
-                    time.sleep(random.uniform(0.5, 1.0))
+                    # 等待內容載入（新評論出現或無載入指示器即返回）
+                    self.page_waiter.wait_for_review_count_increase(before_count, 1.0)
                     
                     # 檢查滾動是否成功
                     new_scroll_top = self.driver.execute_script("return arguments[0].scrollTop", scrollable_element)
@@ -809,7 +972,7 @@ class GoogleReviewsScraper:
             print(f"✅ 前置滾動作業完成，已滾動30次，點擊「更多評論」按鈕{more_button_clicks}次")
             
             # 等待頁面穩定
-            time.sleep(2)
+            self.page_waiter.wait_for_spinner_gone()
             
         except Exception as e:
             print(f"前置滾動作業發生錯誤: {e}")
@@ -839,13 +1002,14 @@ class GoogleReviewsScraper:
                         if button.is_displayed() and button.is_enabled():
                             # 滾動到按鈕位置
                             self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", button)
-                            time.sleep(0.5)
+                            self.page_waiter.wait_for_clickable(button, 1)
                             
                             # 點擊按鈕
+                            before_count = self.page_waiter.get_review_count()
                             button.click()
                             
                             # 等待頁面載入更多評論
-                            time.sleep(1.5)
+                            self.page_waiter.wait_for_review_count_increase(before_count, 1.5)
                             return True
                     
                 except Exception as e:
@@ -865,9 +1029,10 @@ class GoogleReviewsScraper:
                         button = buttons[0]
                         if button.is_displayed() and button.is_enabled():
                             self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", button)
-                            time.sleep(0.5)
+                            self.page_waiter.wait_for_clickable(button, 1)
+                            before_count = self.page_waiter.get_review_count()
                             button.click()
-                            time.sleep(1.5)
+                            self.page_waiter.wait_for_review_count_increase(before_count, 1.5)
                             return True
             except:
                 pass
@@ -908,7 +1073,7 @@ class GoogleReviewsScraper:
                         if button.is_displayed() and button.is_enabled():
                             # 滾動到按鈕位置
                             self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", button)
-                            time.sleep(1)
+                            self.page_waiter.wait_for_clickable(button, 1)
                             
                             # 獲取按鈕的aria-label或文字內容用於確認
                             aria_label = button.get_attribute('aria-label')
@@ -917,11 +1082,12 @@ class GoogleReviewsScraper:
                             print(f"找到「更多評論」按鈕: {aria_label or button_text}")
                             
                             # 點擊按鈕
+                            before_count = self.page_waiter.get_review_count()
                             button.click()
                             print("✅ 成功點擊「更多評論」按鈕")
                             
                             # 等待頁面載入更多評論
-                            time.sleep(3)
+                            self.page_waiter.wait_for_review_count_increase(before_count, 3)
                             button_found = True
                             break
                         else:
@@ -943,9 +1109,10 @@ class GoogleReviewsScraper:
                         
                         if ('更多' in button_text or '更多' in aria_label) and ('評論' in button_text or '評論' in aria_label):
                             print(f"備用方案找到按鈕: {button_text} / {aria_label}")
+                            before_count = self.page_waiter.get_review_count()
                             button.click()
                             print("✅ 使用備用方案成功點擊按鈕")
-                            time.sleep(3)
+                            self.page_waiter.wait_for_review_count_increase(before_count, 3)
                             button_found = True
                             break
                 except Exception as e:
@@ -957,6 +1124,59 @@ class GoogleReviewsScraper:
             print(f"點擊「更多評論」按鈕時發生錯誤: {e}")
             return False
     
+    def sort_reviews_by_newest(self):
+        """將評論排序切換為「最新」"""
+        sort_button_selectors = [
+            "button[aria-label*='排序']",
+            "button[aria-label*='Sort']",
+            "button[data-value='排序']",
+            "button[data-value='Sort']"
+        ]
+        
+        try:
+            for selector in sort_button_selectors:
+                buttons = self.driver.find_elements(By.CSS_SELECTOR, selector)
+                if not buttons:
+                    continue
+                
+                self.page_waiter.wait_for_clickable(buttons[0], 2)
+                buttons[0].click()
+                
+                # 等待排序選單出現並選擇「最新」
+                menu_items = self.page_waiter.wait_until(
+                    lambda d: d.find_elements(By.CSS_SELECTOR, "div[role='menuitemradio']"), 3
+                )
+                for item in menu_items or []:
+                    if any(label in item.text for label in ['最新', 'Newest']):
+                        before_count = self.page_waiter.get_review_count()
+                        item.click()
+                        self.page_waiter.wait_for_spinner_gone(3)
+                        print(f"✅ 已切換為最新排序 (原有評論節點 {before_count} 個)")
+                        return True
+                
+                print("⚠️  找到排序按鈕但未找到「最新」選項")
+                return False
+            
+            print("⚠️  未找到排序按鈕，維持預設排序")
+            return False
+            
+        except Exception as e:
+            print(f"切換最新排序時發生錯誤: {e}")
+            return False
+    
+    def previous_max_review_id(self):
+        """由評論資料庫查詢本店家已保存評論的最大序號；資料庫是空的時先匯入已保存評論索引記錄的快照"""
+        snapshots = []
+        if len(self.review_store) == 0:
+            snapshots = [path for path in self.review_index.snapshots if os.path.exists(path)]
+        if snapshots:
+            try:
+                print(f"評論資料庫是空的，匯入先前的 {len(snapshots)} 份快照")
+                self.review_store.import_json(snapshots)
+            except Exception as e:
+                print(f"匯入先前快照時發生錯誤: {e}")
+        return self.review_store.max_review_id(self.business_name, self.location)
+    
     def find_scrollable_element(self):
         """找到可滾動的評論容器元素"""
         scrollable_selectors = [
@@ -993,17 +1213,18 @@ class GoogleReviewsScraper:
     def perform_scroll(self, scrollable_element, scroll_count):
         """執行滾動操作"""
         try:
-            # 記錄滾動前位置
+            # 記錄滾動前位置與評論數量
             old_scroll_top = self.driver.execute_script("return arguments[0].scrollTop", scrollable_element)
+            before_count = self.page_waiter.get_review_count()
             
             # 滾動
             self.driver.execute_script(f"arguments[0].scrollTop += {ScrapingConfig.SCROLL_DISTANCE.value}", scrollable_element)
             
-            # 等待載入
-            delay_range = ScrapingConfig.SCROLL_DELAY.value
-            sleep_time = random.uniform(delay_range[0], delay_range[1])
-            print(f"滾動完成，等待 {sleep_time:.1f} 秒載入新內容...")
-            time.sleep(sleep_time)
+            # 等待載入（新評論出現即返回，最長 SCROLL_WAIT_MAX 秒）
+            after_count = self.page_waiter.wait_for_review_count_increase(
+                before_count, ScrapingConfig.SCROLL_WAIT_MAX.value
+            )
+            print(f"滾動完成，評論節點 {before_count} -> {after_count}")
             
             # 檢查滾動是否成功
             new_scroll_top = self.driver.execute_script("return arguments[0].scrollTop", scrollable_element)
@@ -1020,7 +1241,7 @@ class GoogleReviewsScraper:
             return False
     
     def get_current_review_elements(self):
-        """獲取當前頁面上的所有評論元素"""
+        """獲取當前頁面上尚未標記為已處理的評論元素（增量游標）"""
         review_selectors = [
             "div[data-review-id]",
             "div[jsaction*='review']", 
@@ -1029,31 +1250,55 @@ class GoogleReviewsScraper:
         
         for selector in review_selectors:
             try:
-                elements = self.driver.find_elements(By.CSS_SELECTOR, selector)
+                elements = self.driver.find_elements(By.CSS_SELECTOR, f"{selector}:not([{SEEN_MARKER_ATTRIBUTE}])")
                 if elements:
-                    print(f"使用選擇器 {selector} 找到 {len(elements)} 個評論元素")
+                    print(f"使用選擇器 {selector} 找到 {len(elements)} 個新評論元素")
                     return elements
             except:
                 continue
         
-        print("❌ 未找到任何評論元素")
+        print("❌ 未找到任何新評論元素")
         return []
     
+    def mark_reviews_seen(self, review_elements):
+        """以單次腳本為已處理的評論節點（含內層同 ID 節點）加上標記屬性"""
+        if not review_elements:
+            return
+        try:
+            self.driver.execute_script(
+                """
+                const marker = arguments[1];
+                for (const node of arguments[0]) {
+                    node.setAttribute(marker, '1');
+                    node.querySelectorAll('[data-review-id]').forEach(inner => inner.setAttribute(marker, '1'));
+                }
+                """,
+                review_elements, SEEN_MARKER_ATTRIBUTE
+            )
+        except Exception as e:
+            print(f"標記已處理評論時發生錯誤: {e}")
+    
     def process_new_reviews(self, review_elements, processed_review_ids, remaining_target):
         """處理頁面上尚未下載的新評論"""
         new_reviews = []
         processed_count = 0  # 記錄已處理的評論總數（包含過濾掉的）
+        handled_elements = []  # 本次循環處理過的節點，結束時統一標記
         
         for i, review_element in enumerate(review_elements):
             if len(new_reviews) >= remaining_target:
                 print(f"已達到剩餘目標數量 {remaining_target}，停止處理新評論")
                 break
+            
+            handled_elements.append(review_element)
                 
             try:
                 # 生成評論ID用於去重
                 review_id = self.generate_review_id(review_element)
                 if review_id in processed_review_ids:
                     continue  # 跳過已處理的評論
+                if self.check_known_review(review_id):
+                    processed_review_ids.add(review_id)
+                    continue  # 增量模式：跳過先前已保存的評論
                 
                 processed_count += 1  # 增加處理計數
                 
@@ -1064,30 +1309,109 @@ class GoogleReviewsScraper:
                 self.global_review_counter += 1
                 current_review_number = self.global_review_counter
                 
-                # 先提取評論資料（不下載圖片）
-                review_data = self.extract_single_review_data(review_element, current_review_number, should_download_images=False)
+                # 單次提取評論資料
+                review_data = self.extract_single_review_data(review_element, current_review_number, review_id)
                 if review_data:
+                    processed_review_ids.add(review_id)
+                    
                     # 檢查是否符合過濾條件
                     if self.scraping_mode.should_include_review(review_data['review_text']):
-                        # 符合條件才下載圖片
-                        if UserConfig.ENABLE_IMAGES.value:
-                            review_data_with_images = self.extract_single_review_data(review_element, current_review_number, should_download_images=True)
-                            if review_data_with_images:
-                                review_data = review_data_with_images  # 更新為包含圖片的版本
+                        # 符合條件才提取圖片 URL 並交給圖片處理階段
+                        image_urls = None
+                        if self.download_images and self.image_handler:
+                            image_urls = self.image_handler.extract_image_urls(review_element)
                         
-                        processed_review_ids.add(review_id)
                         new_reviews.append(review_data)
+                        self.accept_review(review_data, image_urls)
                         print(f"✅ 已處理第 {len(new_reviews)} 則新評論: {review_data['reviewer_name']} (序號: {current_review_number})")
                     else:
-                        processed_review_ids.add(review_id)  # 標記為已處理但不加入結果
                         print(f"⏭️  評論不符合過濾條件，跳過: {review_data['reviewer_name']} (序號: {current_review_number})")
                 
             except Exception as e:
                 print(f"處理評論 {i+1} 時發生錯誤: {e}")
                 continue
         
+        self.mark_reviews_seen(handled_elements)
         return new_reviews
     
+    def collect_review_records(self):
+        """依提取模式取得本循環的評論紀錄"""
+        if ScrapingConfig.EXTRACTION_MODE.value == 'network':
+            return self.network_capture.collect()
+        if ScrapingConfig.EXTRACTION_MODE.value == 'snapshot':
+            # 本循環的快照在背景解析，先取回先前循環已完成的結果；積壓超過一份快照時才等待較早的快照
+            self.snapshot_extractor.capture()
+            return self.snapshot_extractor.drain(max_pending=1)
+        return self.batch_extractor.extract_visible_reviews()
+    
+    def collect_final_records(self):
+        """爬取迴圈結束前取回已點擊「更多」、留待下個循環讀取的評論紀錄，以及尚未解析完成的快照"""
+        if ScrapingConfig.EXTRACTION_MODE.value == 'batch':
+            time.sleep(self.page_waiter.grace_period)
+            return self.batch_extractor.extract_visible_reviews(pending_only=True)
+        if ScrapingConfig.EXTRACTION_MODE.value == 'snapshot':
+            # 尚在背景解析的快照在關閉解析執行緒時會被取消，且節點已標記無法重新讀取，必須在此等待完成
+            time.sleep(self.page_waiter.grace_period)
+            self.snapshot_extractor.capture(pending_only=True)
+            return self.snapshot_extractor.drain(wait=True)
+        return []
+    
+    def process_review_records(self, review_records, processed_review_ids, remaining_target):
+        """處理批次提取得到的評論紀錄（不再對每個欄位發出 WebDriver 請求）"""
+        new_reviews = []
+        
+        for record in review_records:
+            if len(new_reviews) >= remaining_target:
+                print(f"已達到剩餘目標數量 {remaining_target}，停止處理新評論")
+                break
+            
+            try:
+                review_id = f"review_id_{record['dom_id']}"
+                if review_id in processed_review_ids:
+                    continue  # 跳過已處理的評論
+                processed_review_ids.add(review_id)
+                if self.check_known_review(review_id):
+                    continue  # 增量模式：跳過先前已保存的評論
+                
+                # 使用全域計數器作為序號
+                self.global_review_counter += 1
+                current_review_number = self.global_review_counter
+                
+                review_data = self.build_review_data(
+                    record['reviewer_name'], record['rating'], record['review_text'],
+                    record['review_date'], current_review_number, review_id
+                )
+                
+                # 檢查是否符合過濾條件
+                if not self.scraping_mode.should_include_review(review_data['review_text']):
+                    print(f"⏭️  評論不符合過濾條件，跳過: {review_data['reviewer_name']} (序號: {current_review_number})")
+                    continue
+                
+                # 符合條件才下載圖片（圖片 URL 已在批次提取時取得）
+                image_urls = None
+                if self.download_images and self.image_handler:
+                    image_urls = [self.image_handler.convert_to_high_res_url(url) for url in record.get('photo_urls', [])]
+                
+                new_reviews.append(review_data)
+                self.accept_review(review_data, image_urls)
+                print(f"✅ 已處理第 {len(new_reviews)} 則新評論: {review_data['reviewer_name']} (序號: {current_review_number})")
+                
+            except Exception as e:
+                print(f"處理評論紀錄 {record.get('dom_id', '?')} 時發生錯誤: {e}")
+                continue
+        
+        return new_reviews
+    
+    def check_known_review(self, review_id):
+        """增量模式：以評論資料庫的主鍵判斷評論是否已在先前執行中保存過，並更新連續已知評論計數"""
+        if not self.incremental:
+            return False
+        if review_id in self.review_store:
+            self.known_review_streak += 1
+            return True
+        self.known_review_streak = 0
+        return False
+    
     def generate_review_id(self, review_element):
         """生成評論的唯一ID用於去重"""
         try:
@@ -1096,9 +1420,9 @@ class GoogleReviewsScraper:
             if review_id:
                 return f"review_id_{review_id}"
             
-            # 備用方案：使用評論文字的hash
+            # 備用方案：使用評論文字的內容摘要（跨執行穩定）
             review_text = review_element.text[:100] if review_element.text else ""
-            return f"review_hash_{hash(review_text)}"
+            return f"review_hash_{content_digest(review_text)}"
             
         except:
             return f"review_fallback_{random.randint(10000, 99999)}"
@@ -1119,17 +1443,17 @@ class GoogleReviewsScraper:
                     if buttons:
                         button = buttons[0]
                         self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", button)
-                        time.sleep(0.3)
+                        self.page_waiter.wait_for_clickable(button, 1)
                         button.click()
-                        time.sleep(0.3)
+                        self.page_waiter.wait_for_element_gone(button, 1)
                         break
                 except:
                     continue
         except:
             pass  # 如果展開失敗也不影響整體流程
     
-    def extract_single_review_data(self, review_element, review_sequence, should_download_images=False):
-        """從單個評論元素中提取數據，只有符合條件時才下載圖片"""
+    def extract_single_review_data(self, review_element, review_sequence, review_key=None):
+        """從單個評論元素中提取數據（只讀取一次欄位，不處理圖片）"""
         try:
             # 提取基本評論資訊
             reviewer_name = self.extract_reviewer_name(review_element)
@@ -1140,47 +1464,8 @@ class GoogleReviewsScraper:
             review_text = self.extract_review_text(review_element)
             review_date = self.extract_review_date(review_element)
             
-            # 處理圖片（只有符合條件時才下載）
-            image_files = []
-            total_images = 0
-            images_downloaded = False
-            image_directory = ""
-            
-            if UserConfig.ENABLE_IMAGES.value and should_download_images:
-                image_directory = f"../web/images/{self.timestamp}"
-                
-                # 提取圖片URL並下載
-                image_handler = ReviewImageHandler(self.driver)
-                # 初始化 downloaded_images 快取如果不存在
-                if not hasattr(self, 'downloaded_images'):
-                    self.downloaded_images = {}
-                
-                downloaded_files = image_handler.process_review_images(
-                    review_element, review_sequence, image_directory, self.downloaded_images
-                )
-                
-                if downloaded_files:
-                    image_files = downloaded_files
-                    total_images = len(downloaded_files)
-                    images_downloaded = True
-            
-            # 組裝評論資料
-            return {
-                'business_name': '築宜系統傢俱',
-                'location': '桃園店',
-                'search_keyword': self.scraping_mode.filter_keyword if self.scraping_mode.mode == 1 else '',
-                'scraping_mode': self.scraping_mode.mode,
-                'reviewer_name': reviewer_name,
-                'rating': rating,
-                'review_text': review_text,
-                'review_date': review_date,
-                'scraped_at': datetime.now().isoformat(),
-                'review_id': review_sequence,
-                'images': image_files,
-                'total_images': total_images,
-                'images_downloaded': images_downloaded,
-                'image_directory': image_directory
-            }
+            # 組裝評論資料（圖片由 attach_review_images 在過濾後處理）
+            review_data = self.build_review_data(reviewer_name, rating, review_text, review_date, review_sequence, review_key)
             
             return review_data
             
@@ -1188,6 +1473,77 @@ class GoogleReviewsScraper:
             print(f"提取評論數據時發生錯誤: {e}")
             return None
     
+    def accept_review(self, review_data, image_urls=None):
+        """依頁面順序在 NDJSON 保留位置後處理圖片（image_urls 為 None 表示不下載圖片）：
+        交給背景下載管線的評論由管線完成後寫入，其餘立即寫入"""
+        if self.review_writer:
+            self.review_writer.reserve(review_data)
+        if image_urls is not None and self.attach_review_images(review_data, image_urls):
+            return
+        self.stream_review(review_data)
+    
+    def attach_review_images(self, review_data, image_urls):
+        """將已提取的圖片 URL 交給背景下載管線，下載完成後由管線回填評論資料並寫入 NDJSON；
+        返回是否已交給管線（交出後評論資料只由管線執行緒修改與寫入）"""
+        image_directory = f"../web/images/{self.output_name}"
+        review_data['image_directory'] = image_directory
+        
+        if not image_urls:
+            return False
+        
+        if self.lazy_sources is not None:
+            self.register_lazy_images(review_data, image_urls)
+            return False
+        
+        try:
+            self.image_pipeline.submit(review_data, image_urls, image_directory)
+        except Exception as e:
+            print(f"處理評論 {review_data['review_id']} 圖片時發生錯誤: {e}")
+            review_data['images_error'] = str(e)
+            return False
+        
+        return True
+    
+    def register_lazy_images(self, review_data, image_urls):
+        """延遲模式：預先決定圖片檔名並記錄來源 URL，圖片在網頁第一次請求時才由 server.py 取得"""
+        filenames = [image_filename(review_data['review_id'], i) for i, _ in enumerate(image_urls)]
+        for filename, url in zip(filenames, image_urls):
+            self.lazy_sources.add(f"{self.output_name}/{filename}", url)
+        
+        review_data['images'] = filenames
+        review_data['image_sources'] = [self.image_handler.original_image_url(url) for url in image_urls]
+        review_data['total_images'] = len(filenames)
+        review_data['images_downloaded'] = False
+        return review_data
+    
+    def stream_review(self, review_data):
+        """評論完成時寫入 NDJSON（依保留的頁面順序）；圖片交給背景下載的評論只由下載管線完成後呼叫，
+        不會在管線執行緒回填欄位時被其他執行緒讀取（同一則只會寫入一次）"""
+        if self.review_writer:
+            self.review_writer.write(review_data)
+    
+    def build_review_data(self, reviewer_name, rating, review_text, review_date, review_sequence, review_key=None):
+        """組裝評論資料（與 save_to_json 輸出的欄位一致，圖片欄位預設為空）"""
+        if not review_key:
+            review_key = f"review_hash_{content_digest(reviewer_name, review_text)}"
+        return {
+            'business_name': self.business_name,
+            'location': self.location,
+            'search_keyword': self.scraping_mode.filter_keyword if self.scraping_mode.mode == 1 else '',
+            'scraping_mode': self.scraping_mode.mode,
+            'reviewer_name': reviewer_name,
+            'rating': rating,
+            'review_text': review_text,
+            'review_date': review_date,
+            'scraped_at': datetime.now().isoformat(),
+            'review_id': review_sequence,
+            'review_key': review_key,
+            'images': [],
+            'total_images': 0,
+            'images_downloaded': False,
+            'image_directory': ''
+        }
+    
     def extract_reviewer_name(self, review_element):
         """提取評論者姓名"""
         name_selectors = [
@@ -1309,17 +1665,99 @@ class GoogleReviewsScraper:
         
         return "未知日期"
 
+def optimize_stored_images():
+    """最佳化內容儲存中新下載的原圖（依內容雜湊判斷，已處理過的會跳過）"""
+    if ScrapingConfig.USE_IMAGE_STORE.value and ScrapingConfig.OPTIMIZE_IMAGES.value:
+        ImageOptimizer(
+            '../web/images', ScrapingConfig.OPTIMIZE_QUALITY.value, ScrapingConfig.DERIVATIVE_WORKERS.value
+        ).run()
+
+def finalize_run(ndjson_path, json_filename, review_store=None, review_index=None, process_images=True,
+                 incremental=False, optimize=True):
+    """由爬取時寫入的 NDJSON 產生網站 JSON（爬取正常結束與中斷後以 review_writer.py finalize 補產生
+    走同一流程，結果相同）：先最佳化新圖片，再逐批補上衍生圖片與拼接圖、寫入評論資料庫與已保存評論索引；
+    增量模式改由評論資料庫匯出該店家的所有評論。記憶體中最多只保留一批評論，返回本次評論的統計
+    （一次產生多個店家時由呼叫端先執行 optimize_stored_images，再傳入 optimize=False）"""
+    own_store = review_store is None
+    if own_store:
+        review_store = ReviewStore(ScrapingConfig.REVIEW_DB_PATH.value)
+    
+    # 最佳化會替換內容儲存中的原圖，必須在產生衍生圖片之前一次完成
+    stages = []
+    if process_images and optimize:
+        optimize_stored_images()
+    if process_images and ScrapingConfig.GENERATE_DERIVATIVES.value:
+        stages.append(DerivativeBuilder(
+            '../web/images',
+            ScrapingConfig.DERIVATIVE_WIDTHS.value,
+            ScrapingConfig.DERIVATIVE_FORMAT.value,
+            ScrapingConfig.DERIVATIVE_QUALITY.value,
+            ScrapingConfig.DERIVATIVE_WORKERS.value
+        ).build)
+    if process_images and ScrapingConfig.GENERATE_SPRITES.value:
+        stages.append(SpriteBuilder(
+            '../web/images',
+            ScrapingConfig.SPRITE_HEIGHT.value,
+            ScrapingConfig.SPRITE_QUALITY.value,
+            workers=ScrapingConfig.DERIVATIVE_WORKERS.value
+        ).build)
+    
+    stats = {'reviews': 0, 'total_images': 0, 'reviews_with_images': 0, 'rating_total': 0, 'rated': 0}
+    places = []  # 增量模式匯出的 (店家, 分店)
+    
+    def process_batch(batch):
+        for stage in stages:
+            stage(batch)
+        review_store.upsert(batch)  # 已存在的評論更新內容與最後出現時間
+        if review_index is not None:
+            review_index.record(batch, json_filename)
+        for review in batch:
+            stats['reviews'] += 1
+            stats['total_images'] += review.get('total_images', 0)
+            stats['reviews_with_images'] += 1 if review.get('total_images') else 0
+            if isinstance(review.get('rating'), (int, float)):
+                stats['rating_total'] += review['rating']
+                stats['rated'] += 1
+            if (review.get('business_name'), review.get('location')) not in places:
+                places.append((review.get('business_name'), review.get('location')))
+    
+    try:
+        if incremental:
+            for batch in iter_review_batches(ndjson_path):
+                process_batch(batch)
+            for business_name, location in places[:1]:
+                exported = review_store.export_json(json_filename, business_name=business_name, location=location)
+                print(f"合併評論: 新評論 {stats['reviews']} 則，共匯出 {exported} 則")
+        else:
+            finalize(ndjson_path, json_filename, process_batch)
+        if review_index is not None:
+            review_index.save()
+    finally:
+        if own_store:
+            review_store.close()
+    return stats
+
 def main():
     """主程式"""
     # 築宜系統傢俱-桃園店的 Google Maps URL
     url = "https://www.google.com/maps/place/%E7%AF%89%E5%AE%9C%E7%B3%BB%E7%B5%B1%E5%82%A2%E4%BF%B1-%E6%A1%83%E5%9C%92%E5%BA%97/@24.9948316,121.2836128,3a,75y,90t/data=!3m8!1e2!3m6!1sCIHM0ogKEICAgMDI_JbaNw!2e10!3e12!6shttps:%2F%2Flh3.googleusercontent.com%2Fgeougc-cs%2FAB3l90BQ0Z3Ft45dwrZpZ3dAesq9EZc92j1JF1ZzwDmybfFROE6vD1Xva0dZiFykQOuB_p46fUs8_g5LWTN_7q90gQPktgMXn3038OwdnbxfL6oxG7jLtM6LxBJViBJPhsUdjZhLhe2z!7i1477!8i1108!4m8!3m7!1s0x34681f295669592d:0xd8650cf553030107!8m2!3d24.9948316!4d121.2836128!9m1!1b1!16s%2Fg%2F11rb4r3796?entry=ttu&g_ep=EgoyMDI1MDkwOS4wIKXMDSoASAFQAw%3D%3D"
     
+    # 等待使用者選擇模式的同時在背景啟動 Chrome，選完即可開始爬取，不必再等冷啟動
+    browser_pool = BrowserPool(
+        size=1, headless=ScrapingConfig.HEADLESS_MODE.value,
+        performance_logging=ScrapingConfig.EXTRACTION_MODE.value == 'network',
+        lean=ScrapingConfig.LEAN_PROFILE.value,
+        blocked_patterns=blocked_url_patterns(
+            ScrapingConfig.BLOCKED_URL_PATTERNS.value, ScrapingConfig.BLOCKED_RESOURCE_TYPES.value
+        )
+    ).start(background=True)
+    
     # 創建並設定爬取模式
     scraping_mode = ScrapingMode()
     selected_mode = scraping_mode.select_mode()
     
     # 創建爬蟲實例（使用 ENUM 預設值和選定的模式）
-    scraper = GoogleReviewsScraper(scraping_mode=scraping_mode)
+    scraper = GoogleReviewsScraper(scraping_mode=scraping_mode, browser_pool=browser_pool)
     
     print(f"\n開始爬取築宜系統傢俱-桃園店的 Google Maps 評論")
     if selected_mode == 0:
@@ -1327,40 +1765,53 @@ def main():
     else:
         print(f"🎯 模式: 關鍵字過濾模式 - 搜尋包含 '{scraping_mode.filter_keyword}' 的評論")
     print(f"📷 下載圖片: {UserConfig.ENABLE_IMAGES.value}")
+    print(f"🔁 增量模式: {UserConfig.INCREMENTAL_MODE.value}")
     
     # 記錄開始時間
     start_time = datetime.now()
     
     # 執行爬蟲（使用 UserConfig 設定）
-    reviews = scraper.scrape_reviews(url)
+    try:
+        review_count = scraper.scrape_reviews(url)
+    finally:
+        browser_pool.close()
     
-    # 計算執行時間
-    end_time = datetime.now()
-    execution_time = end_time - start_time
-    
-    if reviews:
-        print(f"\n成功爬取 {len(reviews)} 個評論!")
+    if review_count:
+        print(f"\n成功爬取 {review_count} 個評論!")
+        
+        # 由 NDJSON 產生網站 JSON（衍生圖片、拼接圖、評論資料庫、已保存評論索引都在這一步逐批完成）
+        json_filename = f"../web/data/{scraper.timestamp}.json"
+        lazy_images = ScrapingConfig.LAZY_IMAGES.value
+        print(f"\n正在保存結果到: {json_filename}")
+        stats = finalize_run(
+            scraper.ndjson_path, json_filename, scraper.review_store, scraper.review_index,
+            process_images=scraper.download_images and not lazy_images, incremental=scraper.incremental
+        )
+        
+        if scraper.download_images and not lazy_images and ScrapingConfig.BUILD_IMAGE_PACK.value:
+            build_pack('../web/images')
+        
+        # 計算執行時間
+        execution_time = datetime.now() - start_time
         
         # 統計去重和圖片下載結果
-        total_images = sum(r['total_images'] for r in reviews)
-        reviews_with_images = sum(1 for r in reviews if r['total_images'] > 0)
         processed_reviews_count = len(scraper.processed_reviews)
         downloaded_images_count = len(scraper.downloaded_images)
         
         print(f"\n=== 爬取統計結果 ===")
         print(f"執行時間: {execution_time}")
-        print(f"成功爬取評論: {len(reviews)} 則")
+        print(f"成功爬取評論: {stats['reviews']} 則")
         print(f"處理過的評論總數（含重複）: {processed_reviews_count}")
-        print(f"去重評論: {processed_reviews_count - len(reviews)} 則")
+        print(f"去重評論: {processed_reviews_count - stats['reviews']} 則")
         
         print(f"\n圖片下載統計:")
-        print(f"總共獲取圖片: {total_images} 張")
+        print(f"總共獲取圖片: {stats['total_images']} 張")
         print(f"唯一圖片URL: {downloaded_images_count} 個")
-        print(f"包含圖片的評論: {reviews_with_images} 則")
+        print(f"包含圖片的評論: {stats['reviews_with_images']} 則")
         
         # 顯示部分結果
         print("\n前 3 個評論預覽:")
-        for i, review in enumerate(reviews[:3]):
+        for i, review in enumerate(itertools.islice(read_ndjson(scraper.ndjson_path), 3)):
             print(f"\n評論 {i+1}:")
             print(f"姓名: {review['reviewer_name']}")
             print(f"評分: {review['rating']}")
@@ -1368,22 +1819,23 @@ def main():
             print(f"圖片數: {review['total_images']} 張")
             print(f"內容: {review['review_text'][:100]}...")
         
-        # 保存JSON結果
-        json_filename = f"../web/data/{scraper.timestamp}.json"
-        
-        print(f"\n正在保存結果到: {json_filename}")
-        scraper.save_to_json(reviews, json_filename)
         print(f"✅ 爬取任務完成！")
         
+    elif scraper.incremental:
+        print("✅ 增量爬取完成，沒有新的評論，不需產生新快照")
+        print(f"執行時間: {datetime.now() - start_time}")
+        
     else:
         print("❌ 未能成功爬取評論，請檢查網路連線或頁面結構是否改變")
-        print(f"執行時間: {execution_time}")
+        print(f"執行時間: {datetime.now() - start_time}")
         
         # 即使沒有評論，也檢查是否有其他統計信息
         if hasattr(scraper, 'processed_reviews'):
             processed_count = len(scraper.processed_reviews)
             if processed_count > 0:
                 print(f"處理了 {processed_count} 個元素，但未能成功提取評論數據")
+    
+    scraper.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Google Maps 評論圖片衍生尺寸產生模組
+功能: 為每張評論圖片產生多種寬度的 WebP 版本（以行程池並行縮圖），衍生檔依原圖 SHA-256
+      保存於內容儲存中、已產生過的直接沿用，再連結到快照目錄並把 srcset 資訊寫入評論 JSON
+
+使用方法（為既有的評論 JSON 補上衍生圖片）:
+    python image_derivatives.py ../web/data/20250101_120000.json --workers 4
+"""
+
+import os
+import sys
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageOps, features
+from image_store import ImageStore, link_file, resolve_image_directory
+
+DERIVATIVES_DIRNAME = 'derivatives'
+DEFAULT_WIDTHS = [320, 640, 1024]
+
+# 輸出格式設定（AVIF 需要 Pillow 11.3 以上且編譯時含 libavif）
+FORMAT_SETTINGS = {
+    'webp': {'pil_format': 'WEBP', 'mime': 'image/webp', 'options': {'method': 4}},
+    'avif': {'pil_format': 'AVIF', 'mime': 'image/avif', 'options': {}},
+}
+
+
+def render_derivatives(source_path, output_prefix, widths, image_format, quality):
+    """產生單張圖片的各寬度衍生檔（行程池工作函式），已存在的輸出直接沿用；
+    返回 [{'width', 'height', 'path'}]，不放大超過原圖寬度"""
+    settings = FORMAT_SETTINGS[image_format]
+    largest = max(widths)
+    results = []
+
+    with Image.open(source_path) as source:
+        # JPEG 可直接以較低解析度解碼（仍不小於最大輸出寬度），大幅減少解碼時間
+        source.draft('RGB', (largest, largest))
+        img = ImageOps.exif_transpose(source)
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGB')
+        source_width, source_height = img.size
+
+        for width in sorted({min(w, source_width) for w in widths}):
+            height = max(1, round(source_height * width / source_width))
+            path = f"{output_prefix}_w{width}.{image_format}"
+            if not os.path.exists(path):
+                resized = img if width == source_width else img.resize((width, height), Image.LANCZOS)
+                temp_path = f"{path}.tmp"
+                resized.save(temp_path, settings['pil_format'], quality=quality, **settings['options'])
+                os.replace(temp_path, path)
+            results.append({'width': width, 'height': height, 'path': path})
+
+    return results
+
+
+class DerivativeBuilder:
+    """為評論圖片產生並連結各寬度的衍生檔"""
+
+    def __init__(self, images_root='../web/images', widths=None, image_format='webp', quality=75, workers=None):
+        """初始化產生器（衍生檔保存於 images_root/_store/derivatives）"""
+        self.store = ImageStore(images_root)
+        self.widths = sorted(widths or DEFAULT_WIDTHS)
+        self.quality = quality
+        self.workers = workers or os.cpu_count() or 2
+        self.root = os.path.join(self.store.root, DERIVATIVES_DIRNAME)
+        self.index_path = os.path.join(self.root, 'index.json')
+        self.index = {}  # 原圖 SHA-256 -> {格式: {'widths': 要求的寬度, 'variants': [...]}}
+
+        if image_format not in FORMAT_SETTINGS or not features.check(image_format):
+            print(f"目前的 Pillow 不支援 {image_format} 輸出，改用 webp")
+            image_format = 'webp'
+        self.image_format = image_format
+
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    self.index = json.load(f)
+            except Exception as e:
+                print(f"載入衍生圖片索引時發生錯誤，改用空索引: {e}")
+
+    def output_prefix(self, sha256):
+        """衍生檔路徑前綴（依原圖內容命名，可跨快照共用）"""
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def lookup(self, sha256):
+        """查詢已產生且檔案仍存在的衍生檔，沒有時返回 None"""
+        entry = self.index.get(sha256, {}).get(self.image_format)
+        if not entry or entry['widths'] != self.widths:
+            return None
+        for variant in entry['variants']:
+            if not os.path.exists(os.path.join(self.root, variant['file'])):
+                return None
+        return entry['variants']
+
+    def build(self, reviews):
+        """為評論中的所有圖片產生衍生檔，並在評論資料加入 image_srcsets（與 images 一一對應）"""
+        references = []  # (review, 圖片序號, 原圖路徑, SHA-256)
+        pending = {}     # SHA-256 -> 原圖路徑（尚未產生衍生檔的內容）
+
+        for review in reviews:
+            if not review.get('image_directory') or not review.get('images'):
+                continue
+            directory = resolve_image_directory(self.store.images_root, review['image_directory'])
+            for i, filename in enumerate(review['images']):
+                path = os.path.join(directory, filename)
+                if not os.path.exists(path):
+                    continue
+                sha256 = self.store.sha_for_path(path)
+                references.append((review, i, path, sha256))
+                if sha256 not in pending and self.lookup(sha256) is None:
+                    pending[sha256] = path
+
+        if pending:
+            print(f"正在以 {self.workers} 個行程產生 {len(pending)} 張圖片的衍生尺寸...")
+            self.render_pending(pending)
+
+        for review, i, path, sha256 in references:
+            if 'image_srcsets' not in review or len(review['image_srcsets']) != len(review['images']):
+                review['image_srcsets'] = [None] * len(review['images'])
+            variants = self.lookup(sha256)
+            if variants:
+                review['image_srcsets'][i] = self.link_variants(path, variants)
+
+        self.save_index()
+        print(f"✅ 衍生圖片完成: 新產生 {len(pending)} 張，共連結 {len(references)} 張圖片")
+        return len(pending)
+
+    def render_pending(self, pending):
+        """以行程池產生衍生檔並更新索引"""
+        for sha256 in pending:
+            os.makedirs(os.path.dirname(self.output_prefix(sha256)), exist_ok=True)
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = {
+                sha256: executor.submit(
+                    render_derivatives, path, self.output_prefix(sha256),
+                    self.widths, self.image_format, self.quality
+                )
+                for sha256, path in pending.items()
+            }
+            for sha256, future in futures.items():
+                try:
+                    variants = [
+                        {'width': v['width'], 'height': v['height'],
+                         'file': os.path.relpath(v['path'], self.root).replace(os.sep, '/')}
+                        for v in future.result()
+                    ]
+                except Exception as e:
+                    print(f"產生衍生圖片 {pending[sha256]} 時發生錯誤: {e}")
+                    continue
+                self.index.setdefault(sha256, {})[self.image_format] = {
+                    'widths': self.widths, 'variants': variants
+                }
+
+    def link_variants(self, source_path, variants):
+        """將衍生檔連結到原圖所在的快照目錄，返回寫入 JSON 的 srcset 資訊"""
+        directory = os.path.dirname(source_path)
+        stem = os.path.splitext(os.path.basename(source_path))[0]
+        srcset = []
+        for variant in variants:
+            filename = f"{stem}_w{variant['width']}.{self.image_format}"
+            link_file(os.path.join(self.root, variant['file']), os.path.join(directory, filename))
+            srcset.append({'file': filename, 'width': variant['width'], 'height': variant['height']})
+        return {'type': FORMAT_SETTINGS[self.image_format]['mime'], 'srcset': srcset}
+
+    def save_index(self):
+        """以暫存檔 + 替換的方式寫入衍生圖片索引"""
+        os.makedirs(self.root, exist_ok=True)
+        temp_path = f"{self.index_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.index_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='為評論 JSON 中的圖片產生衍生尺寸')
+    parser.add_argument('json_files', nargs='+', help='評論 JSON 檔案')
+    parser.add_argument('--images-root', default='../web/images')
+    parser.add_argument('--widths', type=int, nargs='+', default=DEFAULT_WIDTHS)
+    parser.add_argument('--format', default='webp', choices=sorted(FORMAT_SETTINGS))
+    parser.add_argument('--quality', type=int, default=75)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    builder = DerivativeBuilder(args.images_root, args.widths, args.format, args.quality, args.workers)
+    for json_file in args.json_files:
+        with open(json_file, 'r', encoding='utf-8') as f:
+            reviews = json.load(f)
+        print(f"\n處理 {json_file} ({len(reviews)} 則評論)")
+        builder.build(reviews)
+
+        temp_path = f"{json_file}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(reviews, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, json_file)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,23 +6,99 @@ Google Maps 評論圖片處理模組
 """
 
 import os
-import time
+import shutil
+import hashlib
+import threading
 import requests
-from PIL import Image
+from requests.adapters import HTTPAdapter
+from PIL import ImageFile
+from rate_limiter import HostRateLimiter
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
-import random
 from urllib.parse import urlparse, parse_qs
 import re
 
+DOWNLOAD_CHUNK_SIZE = 64 * 1024      # 串流下載的區塊大小
+MAX_IMAGE_BYTES = 20 * 1024 * 1024   # 單張圖片大小上限
+HEADER_SNIFF_BYTES = 256 * 1024      # 最多讀取多少位元組來解析圖片標頭（尺寸）
+
+# 下載尺寸設定檔: googleusercontent 的 =sN 參數（最長邊 N 像素，0 為原始大小）
+SIZE_PROFILES = {
+    'original': 0,
+    'display': 1600,
+    'thumbnail': 480,
+}
+
+# 允許的圖片格式（檔頭魔術位元組）
+IMAGE_SIGNATURES = [
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'GIF87a', 'GIF'),
+    (b'GIF89a', 'GIF'),
+]
+
+
+def canonical_image_url(url):
+    """去除 googleusercontent 圖片 URL 的尺寸參數（=s120-..., =w400-h300-...），同一張照片得到相同的鍵"""
+    if url and 'googleusercontent' in url:
+        return re.sub(r'=[swh]\d+[^/]*$', '', url)
+    return url
+
+
+def sized_image_url(url, max_edge):
+    """將 googleusercontent 圖片 URL 的尺寸參數改為 =s{max_edge}（0 為原始大小）；
+    帶查詢字串的 URL 不是尺寸參數格式，維持原樣"""
+    if not url or 'googleusercontent' not in url or '?' in url:
+        return url
+    return f"{canonical_image_url(url)}=s{max_edge}"
+
+
+def resolve_size_profile(size_profile):
+    """將尺寸設定（SIZE_PROFILES 名稱、最長邊像素數或數字字串）轉為最長邊像素數；
+    無法辨識時提示並改用 display"""
+    if isinstance(size_profile, str):
+        if size_profile in SIZE_PROFILES:
+            return SIZE_PROFILES[size_profile]
+        if size_profile.isdigit():
+            return int(size_profile)
+    elif isinstance(size_profile, int) and not isinstance(size_profile, bool) and size_profile >= 0:
+        return size_profile
+    print(f"⚠️  未知的圖片尺寸設定 {size_profile!r}（可用: {', '.join(SIZE_PROFILES)} 或最長邊像素數），改用 display")
+    return SIZE_PROFILES['display']
+
+
+def sniff_image_format(head):
+    """依檔頭判斷圖片格式，無法辨識返回 None"""
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'WEBP'
+    for signature, image_format in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return image_format
+    return None
+
+
 class ReviewImageHandler:
-    def __init__(self, driver, wait_timeout=10):
-        """初始化圖片處理器"""
+    def __init__(self, driver, wait_timeout=10, pool_size=16, image_store=None, url_index=None, phash_index=None,
+                 rate_limiter=None, size_profile='display'):
+        """初始化圖片處理器（image_store 設定時，圖片以內容定址保存並以連結放入快照目錄；
+        url_index 為跨執行的 ImageUrlCache、phash_index 為近似重複索引，兩者都需搭配 image_store 使用；
+        所有下載共用 rate_limiter 的主機分組節流；size_profile 為 SIZE_PROFILES 名稱或最長邊像素數）"""
         self.driver = driver
+        self.max_edge = resolve_size_profile(size_profile)
+        self.rate_limiter = rate_limiter or HostRateLimiter()
+        self.image_store = image_store
+        self.url_index = url_index if image_store else None
+        self.phash_index = phash_index if image_store else None
         self.wait = WebDriverWait(driver, wait_timeout)
         self.session = requests.Session()
+        self.cache_lock = threading.Lock()  # 多執行緒下載時保護 url_cache
+        
+        # 連線池大小需容納並行下載的執行緒數
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
         
         # 設定 requests session 的 headers
         self.session.headers.update({
@@ -98,8 +174,8 @@ class ReviewImageHandler:
                         import re
                         url_match = re.search(r'background-image:\s*url\("([^"]+)"\)', style)
                         if url_match:
-                            bg_url = url_match.group(1)
-                            # 只添加未見過的URL對應的按鈕
+                            bg_url = canonical_image_url(url_match.group(1))
+                            # 只添加未見過的URL對應的按鈕（忽略尺寸參數）
                             if bg_url not in seen_urls:
                                 seen_urls.add(bg_url)
                                 valid_buttons.append(button)
@@ -156,38 +232,17 @@ class ReviewImageHandler:
             return []
     
     def convert_to_high_res_url(self, original_url):
-        """將縮圖 URL 轉換為高解析度 URL"""
+        """將縮圖 URL 轉換為下載尺寸設定檔對應的 URL（例如 =s120-c0x00ffffff-no-rj 改為 =s1600）"""
         try:
-            if not original_url or 'googleusercontent' not in original_url:
-                return original_url
-            
-            # Google 圖片 URL 通常包含尺寸參數，我們可以移除或修改這些參數
-            # 例如: =s120-c0x00ffffff-no-rj 改為 =s0 (原始大小)
-            
-            # 移除尺寸限制參數
-            patterns_to_remove = [
-                r'=s\d+-.*',  # 移除 =s120-c0x00ffffff-no-rj 這類參數
-                r'=w\d+-.*',  # 移除寬度限制
-                r'=h\d+-.*'   # 移除高度限制
-            ]
-            
-            high_res_url = original_url
-            for pattern in patterns_to_remove:
-                high_res_url = re.sub(pattern, '=s0', high_res_url)
-            
-            # 如果URL沒有尺寸參數，嘗試加上 =s0
-            if '=s' not in high_res_url and 'googleusercontent' in high_res_url:
-                if '?' in high_res_url:
-                    high_res_url += '&s=0'
-                else:
-                    high_res_url += '=s0'
-            
-            return high_res_url
-            
+            return sized_image_url(original_url, self.max_edge)
         except Exception as e:
             print(f"轉換高解析度 URL 時發生錯誤: {e}")
             return original_url
     
+    def original_image_url(self, url):
+        """取得原始大小圖片的 URL（=s0），保存於評論資料供需要時再取得原圖"""
+        return sized_image_url(url, 0)
+    
     def is_avatar_image(self, img_url):
         """判斷圖片是否為頭像"""
         try:
@@ -222,66 +277,25 @@ class ReviewImageHandler:
     def download_images(self, image_urls, save_dir, review_id, url_cache=None, max_retries=3):
         """下載圖片到指定目錄（支持URL去重）"""
         try:
-            # 建立保存目錄
-            if not os.path.exists(save_dir):
-                os.makedirs(save_dir)
-                print(f"已建立圖片目錄: {save_dir}")
-            
             downloaded_files = []
             duplicate_count = 0
             
             for i, url in enumerate(image_urls, 1):
                 try:
-                    # 檢查URL是否已經下載過
-                    if url_cache is not None and url in url_cache:
-                        existing_file = url_cache[url]
-                        # 生成目前評論的檔名
-                        filename = f"review_{review_id:03d}_img_{i:02d}.jpg"
-                        filepath = os.path.join(save_dir, filename)
-                        
-                        # 複製已存在的檔案
-                        if os.path.exists(existing_file):
-                            import shutil
-                            shutil.copy2(existing_file, filepath)
-                            downloaded_files.append(filename)
-                            duplicate_count += 1
-                            print(f"圖片 {filename} 複製自已下載的檔案 (去重)")
-                            continue
-                        else:
-                            # 如果原檔案不存在，從快取中移除這個URL
-                            del url_cache[url]
-                    
-                    # 生成檔名
                     filename = f"review_{review_id:03d}_img_{i:02d}.jpg"
-                    filepath = os.path.join(save_dir, filename)
-                    
-                    # 如果檔案已存在，跳過
-                    if os.path.exists(filepath):
-                        print(f"圖片 {filename} 已存在，跳過下載")
-                        downloaded_files.append(filename)
-                        continue
+                    print(f"正在處理圖片 {i}/{len(image_urls)}: {filename}")
                     
-                    print(f"正在下載圖片 {i}/{len(image_urls)}: {filename}")
-                    
-                    # 下載圖片
-                    success = self.download_single_image(url, filepath, max_retries)
-                    
-                    if success:
+                    status = self.fetch_review_image(url, save_dir, filename, url_cache, max_retries)
+                    if status:
                         downloaded_files.append(filename)
-                        print(f"圖片下載成功: {filename}")
-                        # 將URL和檔案路徑添加到快取中
-                        if url_cache is not None:
-                            url_cache[url] = filepath
-                    else:
-                        print(f"圖片下載失敗: {filename}")
-                    
-                    # 隨機延遲避免被封鎖
-                    time.sleep(random.uniform(0.5, 1.5))
+                        if status in ('copied', 'cached', 'revalidated', 'near_duplicate'):
+                            duplicate_count += 1
                     
                 except Exception as e:
                     print(f"下載圖片 {i} 時發生錯誤: {e}")
                     continue
             
+            downloaded_files = self.distinct_images(save_dir, downloaded_files)
             print(f"圖片處理完成，成功獲取 {len(downloaded_files)} 張圖片")
             if duplicate_count > 0:
                 print(f"其中 {duplicate_count} 張圖片通過去重複製獲得")
@@ -291,40 +305,196 @@ class ReviewImageHandler:
             print(f"下載圖片時發生錯誤: {e}")
             return []
     
-    def download_single_image(self, url, filepath, max_retries=3):
-        """下載單張圖片"""
+    def fetch_review_image(self, url, save_dir, filename, url_cache=None, max_retries=3):
+        """取得單張評論圖片，返回 'copied' / 'exists' / 'cached' / 'revalidated' / 'near_duplicate' / 'downloaded'，
+        失敗返回 None（可由多執行緒同時呼叫）"""
+        os.makedirs(save_dir, exist_ok=True)
+        filepath = os.path.join(save_dir, filename)
+        
+        # 檢查URL是否已經下載過
+        if url_cache is not None:
+            with self.cache_lock:
+                existing_file = url_cache.get(url)
+                if existing_file and not os.path.exists(existing_file):
+                    # 如果原檔案不存在，從快取中移除這個URL
+                    del url_cache[url]
+                    existing_file = None
+            if existing_file:
+                if os.path.abspath(existing_file) != os.path.abspath(filepath):
+                    if self.image_store:
+                        self.image_store.link_like(existing_file, filepath)
+                    else:
+                        shutil.copy2(existing_file, filepath)
+                print(f"圖片 {filename} 連結自已下載的檔案 (去重)")
+                return 'copied'
+        
+        # 如果檔案已存在，跳過
+        if os.path.exists(filepath):
+            print(f"圖片 {filename} 已存在，跳過下載")
+            return 'exists'
+        
+        # 查詢跨執行的 URL 索引：新鮮期內直接連結，過期則發出條件式請求
+        entry = self.url_index.lookup(url) if self.url_index else None
+        if entry and not self.image_store.has(entry['sha256']):
+            entry = None
+        if entry and self.url_index.is_fresh(entry):
+            self.image_store.link_into(entry['sha256'], filepath)
+            self.remember_download(url_cache, url, filepath)
+            print(f"圖片 {filename} 沿用先前下載的內容 (URL 快取)")
+            return 'cached'
+        
+        headers = self.url_index.conditional_headers(entry) if entry else None
+        result = self.download_single_image(url, filepath, max_retries, headers)
+        if not result:
+            print(f"圖片下載失敗: {filename}")
+            return None
+        
+        if result['status'] == 304:
+            self.url_index.touch(url)
+            self.image_store.link_into(entry['sha256'], filepath)
+            self.remember_download(url_cache, url, filepath)
+            print(f"圖片 {filename} 未變更 (304)，沿用先前下載的內容")
+            return 'revalidated'
+        
+        status = 'downloaded'
+        print(f"圖片下載成功: {filename}")
+        # 存入內容定址儲存，快照目錄中的檔案改為連結
+        if self.image_store:
+            sha256 = result['sha256']
+            if self.phash_index and not self.image_store.has(sha256):
+                # 由索引存入並連結（查詢與存入不可分開，否則並行下載的近似圖片會各存一份）；
+                # 同一張照片已以其他尺寸或壓縮保存過時只保留解析度較高的一份
+                linked_sha256 = self.phash_index.store_or_match(filepath, sha256)
+                if linked_sha256 != sha256:
+                    # 既有內容解析度較高，沿用既有內容（已下載的流量無法省下，只省儲存空間）
+                    sha256 = linked_sha256
+                    status = 'near_duplicate'
+                    print(f"圖片 {filename} 與已保存的圖片近似，改為連結 {linked_sha256[:12]}")
+            else:
+                self.image_store.store_and_link(filepath, sha256)
+            
+            if self.url_index:
+                self.url_index.record(url, sha256, result['etag'], result['last_modified'],
+                                      result['size'], result['content_type'])
+        
+        self.remember_download(url_cache, url, filepath)
+        return status
+    
+    def distinct_images(self, save_dir, filenames):
+        """去除同一則評論中內容相同（含近似重複後連結到同一份內容）的圖片，保留先出現的"""
+        if not self.image_store:
+            return filenames
+        seen = set()
+        distinct = []
+        for filename in filenames:
+            sha256 = self.image_store.sha_for_path(os.path.join(save_dir, filename))
+            if sha256 not in seen:
+                seen.add(sha256)
+                distinct.append(filename)
+        return distinct
+    
+    def remember_download(self, url_cache, url, filepath):
+        """將URL和檔案路徑添加到本次執行的快取中"""
+        if url_cache is not None:
+            with self.cache_lock:
+                url_cache[url] = filepath
+    
+    def download_single_image(self, url, filepath, max_retries=3, headers=None):
+        """串流下載單張圖片，返回回應資訊（status / etag / last_modified / content_type / sha256 / size /
+        width / height），失敗返回 None；headers 帶有條件式請求標頭時，伺服器可能回應 304 且不寫入檔案"""
         for attempt in range(max_retries):
             try:
-                response = self.session.get(url, timeout=30)
-                response.raise_for_status()
-                
-                # 檢查是否為有效的圖片內容
-                if 'image' not in response.headers.get('content-type', ''):
-                    print(f"URL 不是有效的圖片: {url[:80]}...")
-                    return False
-                
-                # 保存圖片
-                with open(filepath, 'wb') as f:
-                    f.write(response.content)
+                self.rate_limiter.acquire(url)
+                with self.session.get(url, timeout=30, headers=headers, stream=True) as response:
+                    # 429 / 5xx 由限制器暫停整個主機分組，下一次嘗試會等到暫停結束
+                    pause = self.rate_limiter.record_response(
+                        url, response.status_code, response.headers.get('Retry-After')
+                    )
+                    if pause is not None:
+                        print(f"下載嘗試 {attempt + 1}/{max_retries} 被限流 (HTTP {response.status_code})，"
+                              f"暫停 {pause:.1f} 秒")
+                        continue
+                    if response.status_code == 304 and headers:
+                        return {'status': 304, 'etag': None, 'last_modified': None, 'content_type': None}
+                    if response.status_code >= 400:
+                        print(f"圖片請求失敗 (HTTP {response.status_code}): {url[:80]}...")
+                        return None
+                    
+                    # 檢查是否為有效的圖片內容
+                    content_type = response.headers.get('content-type', '')
+                    if 'image' not in content_type:
+                        print(f"URL 不是有效的圖片: {url[:80]}...")
+                        return None
+                    
+                    content_length = int(response.headers.get('content-length') or 0)
+                    if content_length > MAX_IMAGE_BYTES:
+                        print(f"圖片超過大小上限 ({content_length} bytes): {url[:80]}...")
+                        return None
+                    
+                    result = self.stream_to_file(response, filepath)
+                    if not result:
+                        return None
+                    if content_length and result['size'] != content_length:
+                        raise IOError(f"圖片內容不完整 ({result['size']}/{content_length} bytes)")
                 
-                # 驗證圖片檔案
-                try:
-                    with Image.open(filepath) as img:
-                        img.verify()
-                    return True
-                except:
-                    print(f"下載的圖片檔案損壞: {filepath}")
-                    if os.path.exists(filepath):
-                        os.remove(filepath)
-                    return False
+                result.update({
+                    'status': response.status_code,
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'content_type': content_type
+                })
+                return result
                 
             except Exception as e:
-                print(f"下載嘗試 {attempt + 1}/{max_retries} 失敗: {e}")
-                if attempt < max_retries - 1:
-                    time.sleep(2 ** attempt)  # 指數退避
+                pause = self.rate_limiter.record_error(url)
+                print(f"下載嘗試 {attempt + 1}/{max_retries} 失敗: {e}，暫停 {pause:.1f} 秒")
                 continue
         
-        return False
+        return None
+    
+    def stream_to_file(self, response, filepath):
+        """將回應逐塊寫入暫存檔，同時計算 SHA-256 並由開頭區塊解析格式與尺寸，
+        全部通過後才以 os.replace 放到 filepath；返回 sha256 / size / width / height，失敗返回 None"""
+        temp_path = f"{filepath}.part"
+        digest = hashlib.sha256()
+        parser = ImageFile.Parser()
+        size = 0
+        image_format = None
+        
+        try:
+            with open(temp_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    if not chunk:
+                        continue
+                    if image_format is None:
+                        image_format = sniff_image_format(chunk)
+                        if image_format is None:
+                            print(f"下載內容不是可辨識的圖片格式: {os.path.basename(filepath)}")
+                            return None
+                    
+                    size += len(chunk)
+                    if size > MAX_IMAGE_BYTES:
+                        print(f"圖片超過大小上限 ({MAX_IMAGE_BYTES} bytes): {os.path.basename(filepath)}")
+                        return None
+                    
+                    # 只用開頭的位元組解析標頭取得尺寸，不解碼整張圖片
+                    if parser.image is None and size - len(chunk) < HEADER_SNIFF_BYTES:
+                        parser.feed(chunk)
+                    
+                    digest.update(chunk)
+                    f.write(chunk)
+            
+            if parser.image is None:
+                print(f"下載的圖片檔案損壞 (無法解析標頭): {os.path.basename(filepath)}")
+                return None
+            
+            width, height = parser.image.size
+            os.replace(temp_path, filepath)
+            return {'sha256': digest.hexdigest(), 'size': size, 'width': width, 'height': height}
+        
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
     
     def process_review_images(self, review_element, review_id, save_dir, url_cache=None):
         """處理單則評論的所有圖片（提取 + 下載）"""
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Google Maps 評論圖片最佳化模組
+功能: 將內容儲存中的 JPEG 原圖去除 EXIF 等中繼資料、套用拍攝方向，重新編碼為最佳化的
+      漸進式 JPEG（方向不需調整時沿用原量化表，近乎無損；否則使用品質下限），
+      只有結果較小時才取代原內容，並把所有快照連結改指向新內容
+
+使用方法:
+    python image_optimizer.py ../web/images --quality 85 --workers 4
+"""
+
+import os
+import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageOps
+from image_store import ImageStore, hash_file
+
+DEFAULT_QUALITY = 85  # 需要旋轉而無法沿用原量化表時的 JPEG 品質下限
+
+
+def optimize_jpeg(source_path, output_path, quality=DEFAULT_QUALITY):
+    """重新編碼單張 JPEG（行程池工作函式），較原檔小時寫入 output_path 並返回新大小，否則返回 None"""
+    with Image.open(source_path) as img:
+        if img.format != 'JPEG':
+            return None
+        orientation = img.getexif().get(0x0112, 1)  # EXIF Orientation
+
+        if orientation == 1:
+            # 不需旋轉：沿用原本的量化表與色度取樣，只重建霍夫曼表並改為漸進式
+            options = {'quality': 'keep', 'subsampling': 'keep'}
+            if 'icc_profile' in img.info:
+                options['icc_profile'] = img.info['icc_profile']
+            img.save(output_path, 'JPEG', optimize=True, progressive=True, **options)
+        else:
+            rotated = ImageOps.exif_transpose(img)
+            if rotated.mode not in ('RGB', 'L'):
+                rotated = rotated.convert('RGB')
+            rotated.save(output_path, 'JPEG', quality=quality, optimize=True, progressive=True,
+                         icc_profile=img.info.get('icc_profile'))
+
+    new_size = os.path.getsize(output_path)
+    if new_size >= os.path.getsize(source_path):
+        os.remove(output_path)
+        return None
+    return new_size
+
+
+class ImageOptimizer:
+    """對內容儲存中尚未處理的原圖執行最佳化"""
+
+    def __init__(self, images_root='../web/images', quality=DEFAULT_QUALITY, workers=None):
+        """初始化最佳化器"""
+        self.store = ImageStore(images_root)
+        self.quality = quality
+        self.workers = workers or os.cpu_count() or 2
+
+    def pending_blobs(self):
+        """列出尚未處理過的 JPEG 內容（以內容雜湊判斷，已處理或本身就是最佳化結果的都跳過）"""
+        pending = []
+        for sha256, blob in self.store.manifest['blobs'].items():
+            if 'optimized' in blob or 'optimized_from' in blob or 'optimized_to' in blob or 'superseded_by' in blob:
+                continue
+            if blob.get('ext') in ('.jpg', '.jpeg') and os.path.exists(self.store.blob_path(sha256)):
+                pending.append(sha256)
+        return pending
+
+    def run(self):
+        """並行最佳化所有待處理內容，返回節省的位元組數"""
+        pending = self.pending_blobs()
+        if not pending:
+            print("沒有需要最佳化的圖片")
+            return 0
+
+        print(f"正在以 {self.workers} 個行程最佳化 {len(pending)} 張圖片...")
+        saved_bytes = 0
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = {
+                sha256: executor.submit(
+                    optimize_jpeg, self.store.blob_path(sha256), f"{self.store.blob_path(sha256)}.opt.jpg", self.quality
+                )
+                for sha256 in pending
+            }
+            for sha256, future in futures.items():
+                try:
+                    new_size = future.result()
+                except Exception as e:
+                    print(f"最佳化圖片 {sha256[:12]} 時發生錯誤: {e}")
+                    continue
+                if new_size is None:
+                    self.store.mark_optimized(sha256, None)
+                    continue
+                saved_bytes += self.store.manifest['blobs'][sha256]['size'] - new_size
+                self.replace_blob(sha256, f"{self.store.blob_path(sha256)}.opt.jpg")
+
+        self.store.save_manifest()
+        print(f"✅ 最佳化完成: 節省 {saved_bytes / 1024 / 1024:.1f} MB")
+        return saved_bytes
+
+    def replace_blob(self, sha256, optimized_path):
+        """把最佳化結果存為新內容，原內容的快照連結全部改指向新內容後刪除原檔"""
+        original_path = self.store.blob_path(sha256)
+        new_sha256 = self.store.put_file(optimized_path, hash_file(optimized_path), move=True)
+        if os.path.exists(optimized_path):
+            os.remove(optimized_path)  # 相同內容已存在時 put_file 不會移動暫存檔
+        self.store.mark_optimized(sha256, new_sha256)
+
+        for link, linked_sha in list(self.store.manifest['links'].items()):
+            if linked_sha == sha256:
+                self.store.link_into(new_sha256, os.path.join(self.store.images_root, link))
+        os.remove(original_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='最佳化內容儲存中的評論圖片')
+    parser.add_argument('images_root', nargs='?', default='../web/images')
+    parser.add_argument('--quality', type=int, default=DEFAULT_QUALITY, help='需要旋轉時的 JPEG 品質下限')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    ImageOptimizer(args.images_root, args.quality, args.workers).run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Google Maps 評論圖片封裝檔模組
+功能: 將各快照目錄中的圖片（含衍生尺寸檔與拼接圖）依序寫入單一封裝檔，並以索引記錄
+      每個網頁路徑的 位移 / 長度 / 內容類型；硬連結到同一份內容的路徑只寫入一次。
+      本機伺服器以 mmap 開啟封裝檔，回應圖片時直接以 sendfile 從封裝檔送出對應片段
+      （不支援時改寫出 mmap 切片），不必為每個請求開啟一個小檔案
+
+使用方法（整理完圖片後重新產生封裝檔）:
+    python image_pack.py build ../web/images
+"""
+
+import os
+import sys
+import json
+import mmap
+import time
+import hashlib
+import argparse
+import tempfile
+import threading
+import mimetypes
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+from image_store import STORE_DIRNAME
+
+PACK_DIRNAME = 'pack'
+INDEX_FILENAME = 'index.json'
+PACKED_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.avif', '.gif')
+COPY_CHUNK_SIZE = 1024 * 1024
+SENDFILE_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def iter_packable_images(images_root):
+    """列出各快照目錄中要放入封裝檔的圖片（略過儲存目錄）"""
+    for dirpath, dirnames, filenames in os.walk(images_root):
+        dirnames[:] = sorted(d for d in dirnames if d != STORE_DIRNAME)
+        for filename in sorted(filenames):
+            if filename.lower().endswith(PACKED_EXTENSIONS):
+                yield os.path.join(dirpath, filename)
+
+
+def build_pack(images_root):
+    """產生新一代的封裝檔與索引（先寫入新檔再替換索引，舊封裝檔最後才刪除）；
+    檔名含時間與內容雜湊，同一秒內重新產生也不會覆寫伺服器可能仍在使用的封裝檔"""
+    images_root = os.path.abspath(images_root)
+    pack_root = os.path.join(images_root, STORE_DIRNAME, PACK_DIRNAME)
+    os.makedirs(pack_root, exist_ok=True)
+
+    entries = {}        # 網頁路徑（相對於圖片根目錄）-> [位移, 長度, 內容類型]
+    written = {}        # (裝置, inode) -> [位移, 長度]，硬連結只寫入一次
+    offset = 0
+    digest = hashlib.sha256()
+
+    # 檔名要等內容寫完才知道，先寫入唯一的暫存檔
+    fd, temp_path = tempfile.mkstemp(suffix='.tmp', prefix='images-', dir=pack_root)
+    with os.fdopen(fd, 'wb') as pack:
+        for path in iter_packable_images(images_root):
+            stat = os.stat(path)
+            key = (stat.st_dev, stat.st_ino)
+            if key not in written:
+                with open(path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b''):
+                        pack.write(chunk)
+                        digest.update(chunk)
+                written[key] = [offset, stat.st_size]
+                offset += stat.st_size
+            relative_path = os.path.relpath(path, images_root).replace(os.sep, '/')
+            content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            entries[relative_path] = written[key] + [content_type]
+    pack_name = f"images-{time.strftime('%Y%m%d_%H%M%S')}-{digest.hexdigest()[:12]}.pack"
+    pack_path = os.path.join(pack_root, pack_name)
+    if os.path.exists(pack_path):
+        os.remove(temp_path)  # 同一秒內內容相同，沿用既有的封裝檔（位移也相同）
+    else:
+        os.replace(temp_path, pack_path)
+
+    index_path = os.path.join(pack_root, INDEX_FILENAME)
+    with open(f"{index_path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump({'pack': pack_name, 'size': offset, 'entries': entries}, f, ensure_ascii=False)
+    os.replace(f"{index_path}.tmp", index_path)
+
+    # 伺服器仍開著的舊封裝檔在關閉前都還能讀取（POSIX 刪除只移除名稱）
+    for filename in os.listdir(pack_root):
+        if filename.endswith('.pack') and filename != pack_name:
+            try:
+                os.remove(os.path.join(pack_root, filename))
+            except OSError as e:
+                print(f"刪除舊封裝檔 {filename} 時發生錯誤: {e}")
+
+    print(f"✅ 封裝完成: {len(entries)} 個路徑、{len(written)} 份內容、{offset / 1024 / 1024:.1f} MB -> {pack_name}")
+    return pack_path
+
+
+def not_modified_since(header_value, mtime):
+    """If-Modified-Since 是否不早於封裝檔的修改時間（以秒為單位比較）"""
+    if not header_value:
+        return False
+    try:
+        since = parsedate_to_datetime(header_value)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return int(mtime) <= since.timestamp()
+
+
+class PackGeneration:
+    """一代已開啟的封裝檔；以參考計數記錄正在送出的回應，被替換且回應都送完後才關閉 mmap 與檔案"""
+
+    def __init__(self, pack_file, mapped, entries, mtime):
+        self.pack_file = pack_file
+        self.mapped = mapped
+        self.entries = entries  # 網頁路徑 -> [位移, 長度, 內容類型]
+        self.mtime = mtime
+        self.refs = 0           # 正在使用這一代的回應數（由 ImagePack.lock 保護）
+        self.retired = False    # 已被新一代取代
+
+    def close(self):
+        """關閉 mmap 與檔案"""
+        if self.mapped is not None:
+            self.mapped.close()
+        self.pack_file.close()
+
+
+class ImagePack:
+    """以 mmap 讀取封裝檔並回應圖片請求（可由多個執行緒共用，索引更新後自動切換）"""
+
+    def __init__(self, images_root):
+        """初始化讀取器；封裝檔不存在時 lookup 一律返回 None"""
+        self.images_root = os.path.abspath(images_root)
+        self.pack_root = os.path.join(self.images_root, STORE_DIRNAME, PACK_DIRNAME)
+        self.index_path = os.path.join(self.pack_root, INDEX_FILENAME)
+        self.lock = threading.Lock()
+        self.current = None  # 目前的 PackGeneration
+        self.loaded_mtime = None
+        self.reload()
+
+    def reload(self):
+        """索引檔有更新時重新開啟封裝檔"""
+        try:
+            mtime = os.path.getmtime(self.index_path)
+        except OSError:
+            return
+        if mtime == self.loaded_mtime:
+            return
+        with self.lock:
+            if mtime == self.loaded_mtime:
+                return
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    index = json.load(f)
+                pack_path = os.path.join(self.pack_root, index['pack'])
+                pack_file = open(pack_path, 'rb')
+                mapped = mmap.mmap(pack_file.fileno(), 0, access=mmap.ACCESS_READ) if index['size'] else None
+            except Exception as e:
+                print(f"載入圖片封裝檔時發生錯誤: {e}")
+                return
+            previous = self.current
+            self.current = PackGeneration(pack_file, mapped, index['entries'], os.path.getmtime(pack_path))
+            self.loaded_mtime = mtime
+            # 其他執行緒可能仍在送出舊封裝檔的片段，由最後一個回應在送完後關閉
+            if previous is not None:
+                previous.retired = True
+                if previous.refs == 0:
+                    previous.close()
+            print(f"已載入圖片封裝檔 {index['pack']} ({len(index['entries'])} 個路徑)")
+
+    def relative_path(self, local_path):
+        """本機路徑相對於圖片根目錄的表示，不在圖片根目錄內時返回 None"""
+        local_path = os.path.abspath(local_path)
+        if os.path.commonpath([local_path, self.images_root]) != self.images_root:
+            return None
+        return os.path.relpath(local_path, self.images_root).replace(os.sep, '/')
+
+    def lookup(self, relative_path):
+        """查詢路徑在封裝檔中的位置，返回 (PackGeneration, 位移, 長度, 內容類型) 或 None；
+        找到時會增加該代的參考計數，使用完畢必須呼叫 release"""
+        self.reload()
+        with self.lock:
+            current = self.current
+            if current is None or relative_path not in current.entries:
+                return None
+            current.refs += 1
+        offset, length, content_type = current.entries[relative_path]
+        return current, offset, length, content_type
+
+    def release(self, generation):
+        """結束使用一代封裝檔；已被取代且沒有其他回應使用時關閉"""
+        with self.lock:
+            generation.refs -= 1
+            if not (generation.retired and generation.refs == 0):
+                return
+        generation.close()
+
+    def send(self, handler, local_path, head_only=False):
+        """以封裝檔回應 http.server 的請求；路徑不在封裝檔中時返回 False 交由一般檔案處理"""
+        relative_path = self.relative_path(local_path)
+        entry = self.lookup(relative_path) if relative_path else None
+        if entry is None:
+            return False
+        generation, offset, length, content_type = entry
+
+        try:
+            if not_modified_since(handler.headers.get('If-Modified-Since'), generation.mtime):
+                handler.send_response(304)
+                handler.end_headers()
+                return True
+
+            handler.send_response(200)
+            handler.send_header('Content-Type', content_type)
+            handler.send_header('Content-Length', str(length))
+            handler.send_header('Last-Modified', handler.date_time_string(generation.mtime))
+            handler.end_headers()
+            if head_only or length == 0:
+                return True
+
+            try:
+                self.send_slice(handler, generation.pack_file, generation.mapped, offset, length)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # 瀏覽器在傳送途中取消請求
+            return True
+        finally:
+            self.release(generation)
+
+    @staticmethod
+    def send_slice(handler, pack_file, mapped, offset, length):
+        """優先以 sendfile 由核心直接送出（零複製），不支援時寫出 mmap 切片"""
+        end = offset + length
+        if hasattr(os, 'sendfile'):
+            try:
+                socket_fd = handler.connection.fileno()
+                while offset < end:
+                    sent = os.sendfile(socket_fd, pack_file.fileno(), offset, min(SENDFILE_CHUNK_SIZE, end - offset))
+                    if sent == 0:
+                        raise BrokenPipeError("連線已關閉")
+                    offset += sent
+                return
+            except (BrokenPipeError, ConnectionResetError):
+                raise
+            except OSError:
+                pass  # 例如 socket 不支援 sendfile，從尚未送出的部分改用 mmap
+        # 釋放 memoryview 後 mmap 才能關閉
+        with memoryview(mapped) as view, view[offset:end] as part:
+            handler.wfile.write(part)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='評論圖片封裝檔工具')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser('build', help='由快照目錄產生封裝檔與索引')
+    build_parser.add_argument('images_root', nargs='?', default='../web/images')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        build_pack(args.images_root)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Google Maps 評論圖片感知雜湊模組
+功能: 以 dHash 為內容儲存中的每份圖片建立感知雜湊索引，透過 BK 樹依漢明距離快速查詢
+      近似重複的圖片（不同尺寸參數、重新上傳、重新壓縮的同一張照片）
+
+使用方法（為既有圖片庫建立索引並列出近似重複群組）:
+    python image_phash.py report ../web/images --threshold 6 --workers 4
+"""
+
+import os
+import sys
+import json
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageOps
+from image_store import ImageStore, file_lock
+
+HASH_SIZE = 8              # dHash 邊長，8 -> 64 位元
+DEFAULT_THRESHOLD = 6      # 漢明距離小於等於此值視為同一張照片
+
+
+def dhash(path, hash_size=HASH_SIZE):
+    """計算圖片的 dHash（縮成 (hash_size+1) x hash_size 灰階後比較相鄰像素），返回整數"""
+    with Image.open(path) as img:
+        img.draft('L', (hash_size * 8, hash_size * 8))
+        img = ImageOps.exif_transpose(img).convert('L').resize((hash_size + 1, hash_size), Image.LANCZOS)
+        pixels = img.tobytes()  # 灰階每個像素一個位元組
+
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def image_area(path):
+    """以 (像素數, 檔案大小) 比較近似圖片的解析度（只讀取檔頭，不解碼）"""
+    with Image.open(path) as img:
+        width, height = img.size
+    return width * height, os.path.getsize(path)
+
+
+def hamming_distance(a, b):
+    """兩個雜湊值的漢明距離"""
+    return bin(a ^ b).count('1')
+
+
+class BKTree:
+    """以漢明距離為度量的 BK 樹，查詢時只走訪距離可能符合的分支"""
+
+    def __init__(self):
+        self.root = None  # 節點格式: [雜湊值, 內容 SHA-256, {距離: 子節點}]
+
+    def add(self, hash_value, key):
+        """加入一個雜湊值"""
+        if self.root is None:
+            self.root = [hash_value, key, {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming_distance(hash_value, node[0])
+            if distance == 0 and node[1] == key:
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [hash_value, key, {}]
+                return
+            node = child
+
+    def search(self, hash_value, max_distance):
+        """返回距離不超過 max_distance 的 [(距離, key)]，依距離排序"""
+        results = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(hash_value, node[0])
+            if distance <= max_distance:
+                results.append((distance, node[1]))
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return sorted(results)
+
+
+class PerceptualIndex:
+    """內容儲存的感知雜湊索引（保存於 _store/phash.json）"""
+
+    def __init__(self, image_store, threshold=DEFAULT_THRESHOLD):
+        """載入索引並建立 BK 樹"""
+        self.store = image_store
+        self.threshold = threshold
+        self.path = os.path.join(image_store.root, 'phash.json')
+        self.lock = threading.Lock()
+        self.hashes = self._read_hashes()  # 內容 SHA-256 -> dHash 十六進位字串
+        self.dirty = set()  # 本行程新登記的內容，保存時只把這些合併進檔案
+        self.removed = set()  # 本行程中被解析度較高的近似內容取代的內容，保存時自檔案移除
+        self.tree = BKTree()
+        for sha256, hex_hash in self.hashes.items():
+            self.tree.add(int(hex_hash, 16), sha256)
+
+    def _read_hashes(self, default=None):
+        """讀取索引檔案，不存在或無法解析時返回 default（未指定時為空索引）"""
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"載入感知雜湊索引時發生錯誤，改用{'記憶體中的' if default else '空'}索引: {e}")
+        return default or {}
+
+    def add(self, sha256, hash_value):
+        """登記一份內容的感知雜湊"""
+        with self.lock:
+            self._add_locked(sha256, hash_value)
+
+    def _add_locked(self, sha256, hash_value):
+        """add 的本體（呼叫端需持有 self.lock）"""
+        if sha256 not in self.hashes:
+            self.hashes[sha256] = f"{hash_value:016x}"
+            self.tree.add(hash_value, sha256)
+            self.dirty.add(sha256)
+        self.removed.discard(sha256)
+
+    def _remove_locked(self, sha256):
+        """移除一份內容的登記（BK 樹不支援刪除，節點保留，查詢時以 self.hashes 過濾；呼叫端需持有 self.lock）"""
+        self.hashes.pop(sha256, None)
+        self.dirty.discard(sha256)
+        self.removed.add(sha256)
+
+    def find_near_duplicate(self, sha256, hash_value):
+        """查詢與 hash_value 近似、且不是 sha256 本身的已保存內容，返回其 SHA-256，沒有時返回 None"""
+        with self.lock:
+            return self._find_locked(sha256, hash_value)
+
+    def _find_locked(self, sha256, hash_value):
+        """find_near_duplicate 的本體（呼叫端需持有 self.lock）"""
+        for _, match in self.tree.search(hash_value, self.threshold):
+            if match != sha256 and match in self.hashes and self.store.has(match):
+                return match
+        return None
+
+    def store_or_match(self, path, sha256):
+        """將剛下載的檔案存入內容儲存並連結到原位置，返回該位置最終對應的 SHA-256。
+        有近似內容時保留解析度較高的一份：新檔較小則刪除並改為連結既有內容（返回既有內容的 SHA-256）；
+        新檔較大則存入新內容，既有內容的連結與索引登記都改指向新內容後刪除舊檔。
+        查詢、存入與取代在同一個鎖內完成，並行下載同一張照片的不同尺寸時只會留下一份
+        （檢查在下載完成後進行，只節省儲存空間，不節省流量）"""
+        # 解碼圖片較慢，在鎖外計算
+        hash_value = dhash(path)
+        new_area = image_area(path)
+        with self.lock:
+            match = self._find_locked(sha256, hash_value)
+            if match is not None and image_area(self.store.blob_path(match)) >= new_area:
+                os.remove(path)
+                self.store.link_into(match, path)
+                return match
+
+            self.store.store_and_link(path, sha256)
+            if match is not None:
+                self.store.supersede(match, sha256)
+                self._remove_locked(match)
+                print(f"近似圖片 {match[:12]} 解析度較低，已由 {sha256[:12]} 取代")
+            self._add_locked(sha256, hash_value)
+        return sha256
+
+    def save(self):
+        """在跨行程檔案鎖內重新讀取索引，合併本行程新登記的內容後以暫存檔 + 替換的方式寫入
+        （其他行程登記的內容同時加入記憶體中的 BK 樹）"""
+        with self.lock:
+            with file_lock(self.path):
+                merged = self._read_hashes(default=dict(self.hashes))
+                for sha256 in self.dirty:
+                    merged[sha256] = self.hashes[sha256]
+                for sha256 in self.removed:
+                    merged.pop(sha256, None)
+
+                temp_path = f"{self.path}.tmp"
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump(merged, f, indent=0)
+                os.replace(temp_path, self.path)
+            for sha256, hex_hash in merged.items():
+                if sha256 not in self.hashes:
+                    self.tree.add(int(hex_hash, 16), sha256)
+            self.hashes = merged
+            self.dirty.clear()
+            self.removed.clear()
+
+
+def hash_blob(path):
+    """行程池工作函式：計算單份內容的 dHash，失敗返回 None"""
+    try:
+        return dhash(path)
+    except Exception as e:
+        print(f"計算感知雜湊失敗 {path}: {e}")
+        return None
+
+
+def report(images_root, threshold, workers):
+    """為所有內容建立感知雜湊，並列出近似重複的群組與可節省的空間"""
+    store = ImageStore(images_root)
+    index = PerceptualIndex(store, threshold)
+    blobs = store.manifest['blobs']
+    missing = [sha for sha in blobs if sha not in index.hashes and store.resolve(sha) == sha and store.has(sha)]
+
+    if missing:
+        print(f"正在以 {workers} 個行程計算 {len(missing)} 份內容的感知雜湊...")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for sha256, hash_value in zip(missing, executor.map(hash_blob, [store.blob_path(s) for s in missing])):
+                if hash_value is not None:
+                    index.add(sha256, hash_value)
+        index.save()
+
+    # 依 BK 樹查詢把近似內容分成群組（每份內容只歸入第一個群組）
+    grouped = set()
+    groups = []
+    for sha256 in sorted(index.hashes):
+        if sha256 in grouped:
+            continue
+        members = [s for _, s in index.tree.search(int(index.hashes[sha256], 16), threshold) if s not in grouped]
+        grouped.update(members)
+        if len(members) > 1:
+            groups.append(members)
+
+    links_by_blob = {}
+    for link, sha256 in store.manifest['links'].items():
+        links_by_blob.setdefault(sha256, []).append(link)
+
+    reclaimable = 0
+    for i, members in enumerate(groups, 1):
+        members.sort(key=lambda s: -blobs.get(s, {}).get('size', 0))
+        reclaimable += sum(blobs.get(s, {}).get('size', 0) for s in members[1:])
+        print(f"\n群組 {i}: {len(members)} 份近似內容")
+        for sha256 in members:
+            links = links_by_blob.get(sha256, [])
+            print(f"  {sha256[:12]} {blobs.get(sha256, {}).get('size', 0) / 1024:.0f} KB, "
+                  f"{len(links)} 個連結 {', '.join(links[:3])}")
+
+    print(f"\n共 {len(index.hashes)} 份內容，{len(groups)} 個近似重複群組，"
+          f"只保留每組最大的一份可節省 {reclaimable / 1024 / 1024:.1f} MB")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='評論圖片感知雜湊索引')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    report_parser = subparsers.add_parser('report', help='建立索引並列出近似重複群組')
+    report_parser.add_argument('images_root', nargs='?', default='../web/images')
+    report_parser.add_argument('--threshold', type=int, default=DEFAULT_THRESHOLD)
+    report_parser.add_argument('--workers', type=int, default=os.cpu_count() or 4)
+    args = parser.parse_args()
+
+    return report(args.images_root, args.threshold, args.workers)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
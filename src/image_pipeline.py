@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Google Maps 評論圖片下載管線
+功能: 將圖片 URL 放入有界佇列，由執行緒池共用同一個連線池下載，
+      下載完成後回填評論資料，瀏覽器執行緒不必等待圖片下載
+"""
+
+import os
+import queue
+import threading
+from image_placeholders import image_metadata
+
+
+def image_filename(review_id, index):
+    """評論圖片在快照目錄中的檔名（index 從 0 開始）"""
+    return f"review_{review_id:03d}_img_{index + 1:02d}.jpg"
+
+
+class ImageDownloadPipeline:
+    """與 DOM 走訪解耦的並行圖片下載管線"""
+
+    def __init__(self, image_handler, url_cache=None, max_workers=4, queue_size=32, on_review_complete=None):
+        """初始化下載管線並啟動工作執行緒（on_review_complete 在一則評論的圖片全部完成時呼叫）"""
+        self.image_handler = image_handler
+        self.url_cache = url_cache
+        self.on_review_complete = on_review_complete
+        self.tasks = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.inflight = {}  # URL -> threading.Event，避免同一張圖同時被下載兩次
+        self.stats = {'downloaded': 0, 'copied': 0, 'exists': 0, 'cached': 0, 'revalidated': 0,
+                      'near_duplicate': 0, 'failed': 0}
+
+        self.workers = [
+            threading.Thread(target=self._worker, name=f"image-download-{i + 1}", daemon=True)
+            for i in range(max_workers)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, review_data, image_urls, save_dir):
+        """排入一則評論的所有圖片；佇列已滿時會阻塞，形成背壓"""
+        if not image_urls:
+            return
+
+        review_id = review_data['review_id']
+        with self.lock:
+            review_data['_pending_images'] = len(image_urls)
+            review_data['_image_results'] = [None] * len(image_urls)
+            review_data['_image_urls'] = list(image_urls)
+            review_data['_image_meta'] = [None] * len(image_urls)
+
+        for i, url in enumerate(image_urls):
+            self.tasks.put((review_data, i, url, save_dir, image_filename(review_id, i)))
+
+    def _worker(self):
+        """工作執行緒：持續取出下載任務"""
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                self.tasks.task_done()
+                break
+            try:
+                self._process(*task)
+            finally:
+                self.tasks.task_done()
+
+    def _process(self, review_data, index, url, save_dir, filename):
+        """下載單張圖片並回報結果"""
+        # 同一 URL 正在下載時，等待它完成後再走快取複製
+        with self.lock:
+            pending_event = self.inflight.get(url)
+            if pending_event is None:
+                self.inflight[url] = threading.Event()
+        if pending_event is not None:
+            pending_event.wait()
+
+        status = None
+        try:
+            status = self.image_handler.fetch_review_image(url, save_dir, filename, self.url_cache)
+        except Exception as e:
+            print(f"下載圖片 {filename} 時發生錯誤: {e}")
+        finally:
+            if pending_event is None:
+                with self.lock:
+                    self.inflight.pop(url).set()
+
+        # 下載完成即以草稿解碼計算寬高、主色與 BlurHash，網頁可先保留版面
+        meta = image_metadata(os.path.join(save_dir, filename)) if status else None
+        self._complete(review_data, index, save_dir, filename, status, meta)
+
+    def _complete(self, review_data, index, save_dir, filename, status, meta=None):
+        """回填單張圖片的結果；整則評論的圖片都完成時更新評論欄位"""
+        with self.lock:
+            self.stats[status or 'failed'] += 1
+            review_data['_image_results'][index] = filename if status else None
+            review_data['_image_meta'][index] = meta
+            review_data['_pending_images'] -= 1
+            if review_data['_pending_images'] > 0:
+                return
+
+            results = review_data.pop('_image_results')
+            source_urls = dict(zip(results, review_data.pop('_image_urls')))
+            metadata = dict(zip(results, review_data.pop('_image_meta')))
+            downloaded_files = self.image_handler.distinct_images(save_dir, [name for name in results if name])
+            review_data.pop('_pending_images')
+            review_data['images'] = downloaded_files
+            # 原圖 URL（與 images 一一對應），網站需要完整解析度時再取得
+            review_data['image_sources'] = [
+                self.image_handler.original_image_url(source_urls[name]) for name in downloaded_files
+            ]
+            review_data['image_meta'] = [metadata[name] for name in downloaded_files]
+            review_data['total_images'] = len(downloaded_files)
+            review_data['images_downloaded'] = bool(downloaded_files)
+
+        print(f"評論 {review_data['review_id']} 圖片完成: {len(downloaded_files)} 張")
+        if self.on_review_complete:
+            try:
+                self.on_review_complete(review_data)
+            except Exception as e:
+                print(f"評論 {review_data['review_id']} 完成後續處理時發生錯誤: {e}")
+
+    def join(self):
+        """等待所有圖片下載完成並結束工作執行緒"""
+        for _ in self.workers:
+            self.tasks.put(None)
+        for worker in self.workers:
+            worker.join()
+        print(f"圖片下載管線結束: 下載 {self.stats['downloaded']} 張、去重複製 {self.stats['copied']} 張、"
+              f"已存在 {self.stats['exists']} 張、URL 快取 {self.stats['cached']} 張、"
+              f"304 未變更 {self.stats['revalidated']} 張、近似重複 {self.stats['near_duplicate']} 張、"
+              f"失敗 {self.stats['failed']} 張")
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Google Maps 評論圖片佔位資訊模組
+功能: 以草稿解碼（只解碼縮小的版本）計算圖片的實際寬高、主色與 BlurHash 佔位字串，
+      寫入評論 JSON 的 image_meta（與 images 一一對應），網頁可先保留版面並顯示模糊預覽
+
+使用方法（為既有的評論 JSON 補上佔位資訊）:
+    python image_placeholders.py ../web/data/20250101_120000.json --workers 4
+"""
+
+import os
+import sys
+import json
+import math
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+from image_store import resolve_image_directory
+
+PLACEHOLDER_SIZE = 32          # 計算主色與 BlurHash 時使用的縮圖邊長
+BLURHASH_COMPONENTS = (4, 3)   # BlurHash 的水平、垂直分量數
+BASE83_CHARS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+
+# EXIF 方向對應的轉換（與 ImageOps.exif_transpose 相同）；5-8 需要旋轉 90 度，寬高互換
+ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+def _base83(value, length):
+    """BlurHash 使用的 base83 編碼"""
+    return ''.join(BASE83_CHARS[(value // 83 ** (length - i)) % 83] for i in range(1, length + 1))
+
+
+def _srgb_to_linear(value):
+    value = value / 255
+    return value / 12.92 if value <= 0.04045 else ((value + 0.055) / 1.055) ** 2.4
+
+
+def _linear_to_srgb(value):
+    value = max(0.0, min(1.0, value))
+    if value <= 0.0031308:
+        return int(value * 12.92 * 255 + 0.5)
+    return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def _sign_pow(value, exponent):
+    return math.copysign(abs(value) ** exponent, value)
+
+
+def blurhash_encode(img, x_components=BLURHASH_COMPONENTS[0], y_components=BLURHASH_COMPONENTS[1]):
+    """將（已縮小的）RGB 圖片編碼為 BlurHash 字串"""
+    width, height = img.size
+    data = img.tobytes()
+    linear = [_srgb_to_linear(v) for v in range(256)]
+    pixels = [(linear[data[i]], linear[data[i + 1]], linear[data[i + 2]]) for i in range(0, len(data), 3)]
+
+    factors = []
+    for j in range(y_components):
+        for i in range(x_components):
+            normalisation = 1 if i == 0 and j == 0 else 2
+            r = g = b = 0.0
+            for y in range(height):
+                cos_y = math.cos(math.pi * j * y / height)
+                for x in range(width):
+                    basis = normalisation * math.cos(math.pi * i * x / width) * cos_y
+                    pr, pg, pb = pixels[y * width + x]
+                    r += basis * pr
+                    g += basis * pg
+                    b += basis * pb
+            scale = 1 / (width * height)
+            factors.append((r * scale, g * scale, b * scale))
+
+    dc, ac = factors[0], factors[1:]
+    result = _base83((x_components - 1) + (y_components - 1) * 9, 1)
+    if ac:
+        actual_max = max(abs(c) for factor in ac for c in factor)
+        quantised_max = max(0, min(82, int(actual_max * 166 - 0.5)))
+        max_value = (quantised_max + 1) / 166
+        result += _base83(quantised_max, 1)
+    else:
+        max_value = 1
+        result += _base83(0, 1)
+
+    result += _base83((_linear_to_srgb(dc[0]) << 16) + (_linear_to_srgb(dc[1]) << 8) + _linear_to_srgb(dc[2]), 4)
+
+    def quantise(value):
+        return max(0, min(18, int(math.floor(_sign_pow(value / max_value, 0.5) * 9 + 9.5))))
+
+    for r, g, b in ac:
+        result += _base83(quantise(r) * 19 * 19 + quantise(g) * 19 + quantise(b), 2)
+    return result
+
+
+def dominant_color(img):
+    """以調色盤量化取得縮圖中出現最多的顏色（#rrggbb）"""
+    quantized = img.quantize(colors=5)
+    palette = quantized.getpalette()
+    count, index = max(quantized.getcolors())
+    return '#{:02x}{:02x}{:02x}'.format(*palette[index * 3:index * 3 + 3])
+
+
+def image_metadata(path):
+    """計算單張圖片的佔位資訊: width / height（已套用 EXIF 方向）、color、blurhash；失敗返回 None"""
+    try:
+        with Image.open(path) as img:
+            width, height = img.size  # 只讀標頭即可取得
+            orientation = img.getexif().get(0x0112, 1)
+            if orientation in TRANSPOSED_ORIENTATIONS:
+                width, height = height, width
+
+            # JPEG 以 1/8 等比例草稿解碼，不需解碼完整圖片
+            img.draft('RGB', (PLACEHOLDER_SIZE * 4, PLACEHOLDER_SIZE * 4))
+            thumbnail = img.convert('RGB')
+            thumbnail.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+            if orientation in ORIENTATION_TRANSPOSE:
+                thumbnail = thumbnail.transpose(ORIENTATION_TRANSPOSE[orientation])
+
+        return {
+            'width': width,
+            'height': height,
+            'color': dominant_color(thumbnail),
+            'blurhash': blurhash_encode(thumbnail)
+        }
+    except Exception as e:
+        print(f"計算圖片佔位資訊失敗 {path}: {e}")
+        return None
+
+
+def backfill(json_files, images_root, workers):
+    """為既有的評論 JSON 補上 image_meta"""
+    for json_file in json_files:
+        with open(json_file, 'r', encoding='utf-8') as f:
+            reviews = json.load(f)
+
+        targets = []
+        for review in reviews:
+            if review.get('image_directory') and review.get('images'):
+                directory = resolve_image_directory(images_root, review['image_directory'])
+                targets.append((review, [os.path.join(directory, name) for name in review['images']]))
+
+        paths = [path for _, review_paths in targets for path in review_paths]
+        print(f"處理 {json_file}: {len(paths)} 張圖片")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            metadata = iter(list(executor.map(image_metadata, paths)))
+        for review, review_paths in targets:
+            review['image_meta'] = [next(metadata) for _ in review_paths]
+
+        temp_path = f"{json_file}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(reviews, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, json_file)
+    print("✅ 佔位資訊補齊完成")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='為評論 JSON 中的圖片補上寬高、主色與 BlurHash')
+    parser.add_argument('json_files', nargs='+', help='評論 JSON 檔案')
+    parser.add_argument('--images-root', default='../web/images')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4)
+    args = parser.parse_args()
+    return backfill(args.json_files, args.images_root, args.workers)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Google Maps 評論圖片延遲取得模組
+功能: 爬蟲在延遲模式下只記錄 快照圖片路徑 -> 來源 URL 的對應（lazy_sources.json），
+      網頁第一次請求某張圖片時才由本機伺服器向來源取得、存入內容儲存並連結到快照目錄，
+      同一張圖片的並行請求只會觸發一次下載，之後直接由磁碟提供。
+      下載沿用爬蟲的 ReviewImageHandler（同一個 requests session、主機分組節流、重試與圖片驗證），
+      只在第一次實際取得圖片時才載入，沒有延遲圖片時 server.py 不需額外套件
+"""
+
+import os
+import json
+import tempfile
+import threading
+from image_store import ImageStore, file_lock
+from rate_limiter import HostRateLimiter
+
+SOURCES_FILENAME = 'lazy_sources.json'
+FETCH_TIMEOUT = 30
+FETCH_POOL_SIZE = 8  # 連線池大小（同時向來源取得圖片的請求數）
+
+
+class LazySourceMap:
+    """快照圖片相對路徑（相對於圖片根目錄）-> 來源 URL 的對應表"""
+
+    def __init__(self, images_root='../web/images'):
+        """載入對應表（保存於 images_root/_store/lazy_sources.json）"""
+        self.store_root = os.path.join(os.path.abspath(images_root), '_store')
+        self.path = os.path.join(self.store_root, SOURCES_FILENAME)
+        self.lock = threading.Lock()
+        self.sources = {}
+        self.loaded_mtime = None
+        self.reload()
+
+    def reload(self):
+        """檔案有更新時重新載入（伺服器執行期間爬蟲可能寫入新的對應）"""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime == self.loaded_mtime:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                sources = json.load(f)
+        except Exception as e:
+            print(f"載入圖片來源對應表時發生錯誤: {e}")
+            return
+        with self.lock:
+            self.sources = sources
+            self.loaded_mtime = mtime
+
+    def get(self, relative_path):
+        """查詢來源 URL"""
+        self.reload()
+        with self.lock:
+            return self.sources.get(relative_path)
+
+    def add(self, relative_path, url):
+        """加入一筆對應（呼叫 save 後寫入檔案）"""
+        with self.lock:
+            self.sources[relative_path] = url
+
+    def save(self):
+        """在跨行程檔案鎖內與檔案中既有的對應合併後，以暫存檔 + 替換的方式寫入"""
+        with self.lock, file_lock(self.path):
+            merged = {}
+            if os.path.exists(self.path):
+                try:
+                    with open(self.path, 'r', encoding='utf-8') as f:
+                        merged = json.load(f)
+                except Exception as e:
+                    print(f"讀取既有圖片來源對應表時發生錯誤，將覆寫: {e}")
+            merged.update(self.sources)
+            self.sources = merged
+
+            os.makedirs(self.store_root, exist_ok=True)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(merged, f, ensure_ascii=False, indent=2)
+            os.replace(temp_path, self.path)
+            self.loaded_mtime = os.path.getmtime(self.path)
+
+
+class LazyImageProxy:
+    """第一次請求時向來源取得圖片並存入內容儲存（可由多個執行緒同時呼叫）"""
+
+    def __init__(self, images_root, source_map=None, timeout=FETCH_TIMEOUT, rate_limiter=None):
+        """初始化代理（rate_limiter 未傳入時建立預設分組速率的限制器）"""
+        self.images_root = os.path.abspath(images_root)
+        self.store = ImageStore(self.images_root)
+        self.source_map = source_map or LazySourceMap(self.images_root)
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter or HostRateLimiter()
+        self.handler = None  # ReviewImageHandler，第一次取得圖片時建立
+        self.lock = threading.Lock()
+        self.inflight = {}  # 相對路徑 -> threading.Event，合併同一張圖片的並行請求
+        self.stats = {'fetched': 0, 'shared': 0, 'failed': 0}
+
+    def relative_path(self, local_path):
+        """本機路徑相對於圖片根目錄的表示，不在圖片根目錄內時返回 None"""
+        local_path = os.path.abspath(local_path)
+        if os.path.commonpath([local_path, self.images_root]) != self.images_root:
+            return None
+        return os.path.relpath(local_path, self.images_root).replace(os.sep, '/')
+
+    def ensure(self, local_path):
+        """確保 local_path 存在：已存在直接返回 True，有來源對應則取得後返回 True，否則返回 False"""
+        if os.path.exists(local_path):
+            return True
+        relative_path = self.relative_path(local_path)
+        if relative_path is None or relative_path.startswith('_store/'):
+            return False
+        url = self.source_map.get(relative_path)
+        if not url:
+            return False
+
+        with self.lock:
+            pending_event = self.inflight.get(relative_path)
+            if pending_event is None:
+                self.inflight[relative_path] = threading.Event()
+        if pending_event is not None:
+            # 其他執行緒正在取得同一張圖片，等待完成後由磁碟提供
+            pending_event.wait(self.timeout + 5)
+            with self.lock:
+                self.stats['shared'] += 1
+            return os.path.exists(local_path)
+
+        try:
+            self.fetch_into(url, local_path)
+            with self.lock:
+                self.stats['fetched'] += 1
+            return True
+        except Exception as e:
+            print(f"取得圖片失敗 {relative_path}: {e}")
+            with self.lock:
+                self.stats['failed'] += 1
+            return False
+        finally:
+            with self.lock:
+                self.inflight.pop(relative_path).set()
+
+    def downloader(self):
+        """取得共用的圖片下載器（不需要瀏覽器，只使用其 requests session 與節流設定）"""
+        with self.lock:
+            if self.handler is None:
+                # 需要 requests / Pillow / selenium，只在實際取得圖片時才載入
+                from image_handler import ReviewImageHandler
+                self.handler = ReviewImageHandler(None, pool_size=FETCH_POOL_SIZE, rate_limiter=self.rate_limiter)
+            return self.handler
+
+    def fetch_into(self, url, local_path):
+        """串流下載到儲存目錄的暫存檔（由下載器驗證圖片並計算 SHA-256），存入內容儲存後連結到 local_path"""
+        os.makedirs(self.store.root, exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(suffix=os.path.splitext(local_path)[1] or '.jpg', dir=self.store.root)
+        os.close(handle)
+
+        try:
+            result = self.downloader().download_single_image(url, temp_path)
+            if not result:
+                raise IOError("來源無法取得有效的圖片")
+
+            sha256 = result['sha256']
+            if self.store.has(sha256):
+                os.remove(temp_path)
+            else:
+                self.store.put_file(temp_path, sha256, move=True)
+            self.store.link_into(sha256, local_path)
+            self.store.save_manifest()
+            print(f"已取得圖片 {os.path.basename(local_path)} ({result['size'] / 1024:.0f} KB)")
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Google Maps 評論圖片拼接圖（sprite）模組
+功能: 將每則評論列表中顯示的縮圖拼成一張等高的橫向 JPEG，網頁只需一個請求即可顯示整則評論的縮圖，
+      各縮圖在拼接圖中的位置寫入評論 JSON 的 image_sprite；點擊後燈箱仍載入完整原圖。
+      拼接圖依組成圖片的 SHA-256 與設定命名並保存於內容儲存，內容不變時直接沿用
+
+使用方法（為既有的評論 JSON 補上拼接圖）:
+    python image_sprites.py ../web/data/20250101_120000.json --height 240 --workers 4
+"""
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageOps
+from image_store import ImageStore, link_file, resolve_image_directory
+
+SPRITES_DIRNAME = 'sprites'
+DEFAULT_HEIGHT = 240      # 縮圖高度（像素，約為列表顯示高度的 2 倍以支援高解析度螢幕）
+DEFAULT_QUALITY = 80
+MAX_FRAMES = 3            # 評論列表最多顯示的縮圖數（與 dataAPI.js displayReviews 一致）
+SPRITE_SUFFIX = '_sprite.jpg'
+
+
+def render_sprite(source_paths, output_path, height, quality):
+    """將多張圖片縮放為相同高度後橫向拼接（行程池工作函式）；
+    返回 {'width', 'height', 'frames': [{'x', 'y', 'width', 'height'}]}"""
+    thumbnails = []
+    for path in source_paths:
+        with Image.open(path) as source:
+            # JPEG 以草稿模式直接解碼較小的版本（兩邊都不小於縮圖高度，旋轉後仍足夠）
+            source.draft('RGB', (height, height))
+            img = ImageOps.exif_transpose(source).convert('RGB')
+        width = max(1, round(img.width * height / img.height))
+        thumbnails.append(img.resize((width, height), Image.LANCZOS))
+
+    frames = []
+    x = 0
+    for thumbnail in thumbnails:
+        frames.append({'x': x, 'y': 0, 'width': thumbnail.width, 'height': height})
+        x += thumbnail.width
+
+    if not os.path.exists(output_path):
+        sprite = Image.new('RGB', (x, height))
+        for frame, thumbnail in zip(frames, thumbnails):
+            sprite.paste(thumbnail, (frame['x'], frame['y']))
+        temp_path = f"{output_path}.tmp"
+        sprite.save(temp_path, 'JPEG', quality=quality, optimize=True, progressive=True)
+        os.replace(temp_path, output_path)
+
+    return {'width': x, 'height': height, 'frames': frames}
+
+
+class SpriteBuilder:
+    """為每則評論產生並連結縮圖拼接圖"""
+
+    def __init__(self, images_root='../web/images', height=DEFAULT_HEIGHT, quality=DEFAULT_QUALITY,
+                 max_frames=MAX_FRAMES, workers=None):
+        """初始化產生器（拼接圖保存於 images_root/_store/sprites）"""
+        self.store = ImageStore(images_root)
+        self.height = height
+        self.quality = quality
+        self.max_frames = max_frames
+        self.workers = workers or os.cpu_count() or 2
+        self.root = os.path.join(self.store.root, SPRITES_DIRNAME)
+        self.index_path = os.path.join(self.root, 'index.json')
+        self.index = {}  # 拼接圖鍵值 -> {'file', 'width', 'height', 'frames'}
+
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    self.index = json.load(f)
+            except Exception as e:
+                print(f"載入拼接圖索引時發生錯誤，改用空索引: {e}")
+
+    def sprite_key(self, hashes):
+        """依組成圖片的內容與設定決定拼接圖名稱（相同內容可跨快照共用）"""
+        payload = json.dumps([hashes, self.height, self.quality])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def output_path(self, key):
+        """拼接圖在內容儲存中的路徑"""
+        return os.path.join(self.root, key[:2], f"{key}.jpg")
+
+    def lookup(self, key):
+        """查詢已產生且檔案仍存在的拼接圖，沒有時返回 None"""
+        entry = self.index.get(key)
+        if entry and os.path.exists(os.path.join(self.root, entry['file'])):
+            return entry
+        return None
+
+    def build(self, reviews):
+        """為評論產生拼接圖，並在評論資料加入 image_sprite（frames 與 images 的前幾張一一對應）"""
+        references = []  # (review, 快照目錄, 拼接圖鍵值)
+        pending = {}     # 拼接圖鍵值 -> 組成圖片路徑
+
+        for review in reviews:
+            review.pop('image_sprite', None)
+            if not review.get('image_directory') or not review.get('images'):
+                continue
+            directory = resolve_image_directory(self.store.images_root, review['image_directory'])
+            paths = [os.path.join(directory, name) for name in review['images'][:self.max_frames]]
+            if not all(os.path.exists(path) for path in paths):
+                continue
+            key = self.sprite_key([self.store.sha_for_path(path) for path in paths])
+            references.append((review, directory, key))
+            if key not in pending and self.lookup(key) is None:
+                pending[key] = paths
+
+        if pending:
+            print(f"正在以 {self.workers} 個行程產生 {len(pending)} 張拼接圖...")
+            self.render_pending(pending)
+
+        for review, directory, key in references:
+            entry = self.lookup(key)
+            if entry:
+                review['image_sprite'] = self.link_sprite(review, directory, entry)
+
+        self.save_index()
+        print(f"✅ 拼接圖完成: 新產生 {len(pending)} 張，共連結 {len(references)} 則評論")
+        return len(pending)
+
+    def render_pending(self, pending):
+        """以行程池產生拼接圖並更新索引"""
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = {}
+            for key, paths in pending.items():
+                os.makedirs(os.path.dirname(self.output_path(key)), exist_ok=True)
+                futures[key] = executor.submit(render_sprite, paths, self.output_path(key), self.height, self.quality)
+            for key, future in futures.items():
+                try:
+                    layout = future.result()
+                except Exception as e:
+                    print(f"產生拼接圖 {pending[key][0]} 等 {len(pending[key])} 張時發生錯誤: {e}")
+                    continue
+                layout['file'] = os.path.relpath(self.output_path(key), self.root).replace(os.sep, '/')
+                self.index[key] = layout
+
+    def link_sprite(self, review, directory, entry):
+        """將拼接圖連結到評論的快照目錄，返回寫入 JSON 的位置資訊"""
+        stem = os.path.splitext(review['images'][0])[0].split('_img_')[0]
+        filename = f"{stem}{SPRITE_SUFFIX}"
+        link_file(os.path.join(self.root, entry['file']), os.path.join(directory, filename))
+        return {'file': filename, 'width': entry['width'], 'height': entry['height'], 'frames': entry['frames']}
+
+    def save_index(self):
+        """以暫存檔 + 替換的方式寫入拼接圖索引"""
+        os.makedirs(self.root, exist_ok=True)
+        temp_path = f"{self.index_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.index_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='為評論 JSON 中的縮圖產生拼接圖')
+    parser.add_argument('json_files', nargs='+', help='評論 JSON 檔案')
+    parser.add_argument('--images-root', default='../web/images')
+    parser.add_argument('--height', type=int, default=DEFAULT_HEIGHT)
+    parser.add_argument('--quality', type=int, default=DEFAULT_QUALITY)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    builder = SpriteBuilder(args.images_root, args.height, args.quality, workers=args.workers)
+    for json_file in args.json_files:
+        with open(json_file, 'r', encoding='utf-8') as f:
+            reviews = json.load(f)
+        print(f"\n處理 {json_file} ({len(reviews)} 則評論)")
+        builder.build(reviews)
+
+        temp_path = f"{json_file}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(reviews, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, json_file)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Google Maps 評論圖片內容定址儲存
+功能: 以 SHA-256 為鍵保存唯一的圖片內容，各時間戳記目錄中的圖片改為硬連結（或符號連結）
+      指向同一份內容，並以 manifest 記錄內容與連結的對應
+
+使用方法（整理既有圖片庫並去重）:
+    python image_store.py migrate ../web/images --workers 8
+    python image_store.py report ../web/images
+"""
+
+import os
+import re
+import sys
+import json
+import shutil
+import hashlib
+import argparse
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # Windows 沒有 fcntl，寫入時仍會合併，只是不加跨行程鎖
+    fcntl = None
+
+STORE_DIRNAME = '_store'  # 底線開頭的目錄不會被 GitHub Pages (Jekyll) 發佈
+HASH_CHUNK_SIZE = 1024 * 1024
+DERIVATIVE_FILE_PATTERN = re.compile(r'(_w\d+\.(webp|avif)|_sprite\.jpg)$')  # image_derivatives 的衍生尺寸檔與 image_sprites 的拼接圖
+
+
+def hash_file(path):
+    """計算檔案的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def resolve_image_directory(images_root, image_directory):
+    """將評論的 image_directory 轉為本機路徑（新版為 ../web/images/...，舊版為相對於 web/ 的 images/...）"""
+    for prefix in ('../web/', 'web/'):
+        if image_directory.startswith(prefix):
+            image_directory = image_directory[len(prefix):]
+            break
+    return os.path.join(os.path.dirname(os.path.abspath(images_root)), image_directory)
+
+
+@contextmanager
+def file_lock(path):
+    """以 path.lock 取得跨行程的獨占鎖（fcntl.flock），保護「讀取 -> 合併 -> 替換」的整段過程"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(f"{path}.lock", 'a') as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def link_file(src, dest):
+    """讓 dest 指向 src：優先硬連結，其次符號連結，最後才複製（以暫存名稱 + 替換完成）"""
+    os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+    # 已指向同一份內容時不需處理（rename 兩個相同 inode 的硬連結不會移除暫存名稱）
+    if os.path.exists(dest) and os.path.samefile(src, dest):
+        return dest
+
+    temp_dest = f"{dest}.linktmp"
+    if os.path.lexists(temp_dest):
+        os.remove(temp_dest)
+    try:
+        os.link(src, temp_dest)
+    except OSError:
+        try:
+            os.symlink(os.path.relpath(src, os.path.dirname(os.path.abspath(dest))), temp_dest)
+        except OSError:
+            shutil.copy2(src, temp_dest)
+    os.replace(temp_dest, dest)
+    return dest
+
+
+class ImageStore:
+    """以 SHA-256 定址的圖片儲存"""
+
+    def __init__(self, images_root='../web/images'):
+        """初始化儲存（images_root 為各時間戳記目錄所在的圖片根目錄）"""
+        self.images_root = os.path.abspath(images_root)
+        self.root = os.path.join(self.images_root, STORE_DIRNAME)
+        self.manifest_path = os.path.join(self.root, 'manifest.json')
+        self.lock = threading.Lock()
+        self.manifest = self._read_manifest()
+        # 本行程新增或修改的項目，保存時只把這些合併進檔案（其他行程可能同時寫入同一份 manifest）
+        self.dirty_blobs = set()
+        self.dirty_links = set()
+
+    def _read_manifest(self, default=None):
+        """讀取 manifest 檔案，不存在或無法解析時返回 default（未指定時為空 manifest）"""
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"載入圖片 manifest 時發生錯誤，改用{'記憶體中的' if default else '空'} manifest: {e}")
+        return default or {'blobs': {}, 'links': {}}
+
+    def resolve(self, sha256):
+        """取得內容目前的 SHA-256（原圖經 image_optimizer 最佳化，或被解析度較高的近似內容取代後改由新內容取代）"""
+        seen = set()
+        while sha256 not in seen:
+            seen.add(sha256)
+            blob = self.manifest['blobs'].get(sha256, {})
+            replacement = blob.get('optimized_to') or blob.get('superseded_by')
+            if not replacement:
+                break
+            sha256 = replacement
+        return sha256
+
+    def blob_path(self, sha256):
+        """取得內容檔案的路徑"""
+        sha256 = self.resolve(sha256)
+        ext = self.manifest['blobs'].get(sha256, {}).get('ext', '.jpg')
+        return os.path.join(self.root, 'blobs', sha256[:2], f"{sha256}{ext}")
+
+    def has(self, sha256):
+        """內容是否已存在"""
+        return self.resolve(sha256) in self.manifest['blobs'] and os.path.exists(self.blob_path(sha256))
+
+    def relative_link(self, path):
+        """連結路徑相對於圖片根目錄的表示（manifest 使用）"""
+        return os.path.relpath(os.path.abspath(path), self.images_root).replace(os.sep, '/')
+
+    def put_file(self, path, sha256=None, move=False):
+        """將檔案內容存入儲存並返回 SHA-256；內容已存在時不重複保存"""
+        sha256 = sha256 or hash_file(path)
+        ext = os.path.splitext(path)[1].lower() or '.jpg'
+
+        with self.lock:
+            if sha256 not in self.manifest['blobs']:
+                self.manifest['blobs'][sha256] = {'size': os.path.getsize(path), 'ext': ext}
+                self.dirty_blobs.add(sha256)
+            blob = self.blob_path(sha256)
+            if not os.path.exists(blob):
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                if move:
+                    os.replace(path, blob)
+                else:
+                    shutil.copy2(path, blob)
+        return sha256
+
+    def link_into(self, sha256, dest):
+        """讓 dest 指向內容檔案，並記錄於 manifest"""
+        sha256 = self.resolve(sha256)
+        link_file(self.blob_path(sha256), dest)
+
+        with self.lock:
+            link = self.relative_link(dest)
+            self.manifest['links'][link] = sha256
+            self.dirty_links.add(link)
+        return dest
+
+    def store_and_link(self, path, sha256=None):
+        """將剛下載的檔案移入儲存，原位置改為連結，返回 SHA-256（下載時已計算雜湊可直接傳入）"""
+        sha256 = sha256 or hash_file(path)
+        if self.has(sha256):
+            os.remove(path)
+        else:
+            self.put_file(path, sha256, move=True)
+        self.link_into(sha256, path)
+        return sha256
+
+    def sha_for_path(self, path):
+        """查詢已連結檔案的 SHA-256（manifest 沒有記錄時重新計算）"""
+        sha256 = self.manifest['links'].get(self.relative_link(path))
+        return sha256 or hash_file(path)
+
+    def link_like(self, existing_path, dest):
+        """讓 dest 與 existing_path 指向同一份內容（取代 shutil.copy2 的去重複製）"""
+        sha256 = self.sha_for_path(existing_path)
+        if not self.has(sha256):
+            self.put_file(existing_path, sha256)
+        return self.link_into(sha256, dest)
+
+    def mark_optimized(self, sha256, optimized_sha256):
+        """記錄最佳化結果（optimized_sha256 為 None 表示已處理但沒有變小，保留原內容）"""
+        with self.lock:
+            blob = self.manifest['blobs'][sha256]
+            blob['optimized'] = optimized_sha256 is not None
+            self.dirty_blobs.add(sha256)
+            if optimized_sha256:
+                blob['optimized_to'] = optimized_sha256
+                self.manifest['blobs'][optimized_sha256]['optimized_from'] = sha256
+                self.dirty_blobs.add(optimized_sha256)
+
+    def supersede(self, sha256, new_sha256):
+        """以已存入的 new_sha256 取代近似的舊內容：舊內容的快照連結全部改指向新內容後刪除舊檔
+        （URL 索引等仍記錄舊 SHA-256 的地方經 resolve 取得新內容）"""
+        old_path = self.blob_path(sha256)
+        with self.lock:
+            self.manifest['blobs'][sha256]['superseded_by'] = new_sha256
+            self.dirty_blobs.add(sha256)
+
+        for link, linked_sha in list(self.manifest['links'].items()):
+            if linked_sha == sha256:
+                self.link_into(new_sha256, os.path.join(self.images_root, link))
+        if os.path.exists(old_path):
+            os.remove(old_path)
+
+    def save_manifest(self):
+        """在跨行程檔案鎖內重新讀取 manifest，合併本行程新增或修改的項目後以暫存檔 + 替換的方式寫入
+        （batch_crawl 的各工作行程與 server.py 的延遲取得可能同時保存），記憶體中的 manifest 同時更新為合併結果"""
+        with self.lock:
+            with file_lock(self.manifest_path):
+                merged = self._read_manifest(default=self.manifest)
+                for sha256 in self.dirty_blobs:
+                    merged['blobs'][sha256] = {**merged['blobs'].get(sha256, {}), **self.manifest['blobs'][sha256]}
+                for link in self.dirty_links:
+                    merged['links'][link] = self.manifest['links'][link]
+
+                temp_path = f"{self.manifest_path}.tmp"
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump(merged, f, ensure_ascii=False, indent=2)
+                os.replace(temp_path, self.manifest_path)
+            self.manifest = merged
+            self.dirty_blobs.clear()
+            self.dirty_links.clear()
+
+
+def iter_snapshot_images(images_root):
+    """列出各時間戳記目錄中的原始圖片檔案（略過儲存目錄本身、衍生尺寸檔與拼接圖）"""
+    for dirpath, dirnames, filenames in os.walk(images_root):
+        dirnames[:] = sorted(d for d in dirnames if d != STORE_DIRNAME)
+        for filename in sorted(filenames):
+            if DERIVATIVE_FILE_PATTERN.search(filename):
+                continue
+            if filename.lower().endswith(('.jpg', '.jpeg', '.png', '.webp', '.gif')):
+                yield os.path.join(dirpath, filename)
+
+
+def migrate(images_root, workers):
+    """並行計算既有圖片的雜湊，存入儲存並把原檔替換為連結"""
+    store = ImageStore(images_root)
+    paths = list(iter_snapshot_images(store.images_root))
+    print(f"找到 {len(paths)} 個圖片檔案，使用 {workers} 個執行緒計算雜湊...")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        hashes = list(executor.map(hash_file, paths))
+
+    total_bytes = 0
+    for path, sha256 in zip(paths, hashes):
+        total_bytes += os.path.getsize(path)
+        if not store.has(sha256):
+            store.put_file(path, sha256)
+        store.link_into(sha256, path)
+
+    store.save_manifest()
+    unique_bytes = sum(store.manifest['blobs'][sha]['size'] for sha in set(hashes))
+    print(f"✅ 遷移完成: {len(paths)} 個檔案 -> {len(set(hashes))} 份唯一內容")
+    print(f"   原始大小: {total_bytes / 1024 / 1024:.1f} MB，去重後: {unique_bytes / 1024 / 1024:.1f} MB")
+    return 0
+
+
+def report(images_root):
+    """顯示儲存的去重統計"""
+    store = ImageStore(images_root)
+    blobs = store.manifest['blobs']
+    links = store.manifest['links']
+    current = {sha: blob for sha, blob in blobs.items() if 'optimized_to' not in blob and 'superseded_by' not in blob}
+    unique_bytes = sum(blob['size'] for blob in current.values())
+    linked_bytes = sum(blobs[sha]['size'] for sha in links.values() if sha in blobs)
+    print(f"唯一內容: {len(current)} 份 ({unique_bytes / 1024 / 1024:.1f} MB)")
+    print(f"快照連結: {len(links)} 個 (若各自複製需 {linked_bytes / 1024 / 1024:.1f} MB)")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='評論圖片內容定址儲存')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    migrate_parser = subparsers.add_parser('migrate', help='整理既有圖片庫並去重')
+    migrate_parser.add_argument('images_root', nargs='?', default='../web/images')
+    migrate_parser.add_argument('--workers', type=int, default=os.cpu_count() or 4)
+    report_parser = subparsers.add_parser('report', help='顯示去重統計')
+    report_parser.add_argument('images_root', nargs='?', default='../web/images')
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        return migrate(args.images_root, args.workers)
+    return report(args.images_root)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Google Maps 評論圖片 URL 快取
+功能: 以 SQLite 跨執行記錄 圖片 URL -> 內容 SHA-256 與 ETag / Last-Modified，
+      新鮮期內直接沿用已保存的內容，過期後以條件式請求重新驗證
+"""
+
+import os
+import time
+import sqlite3
+import threading
+
+
+class ImageUrlCache:
+    """持久化的圖片 URL 索引"""
+
+    def __init__(self, db_path, freshness_seconds=7 * 24 * 3600):
+        """開啟（或建立）快取資料庫"""
+        self.db_path = db_path
+        self.freshness_seconds = freshness_seconds
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock, self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS image_urls (
+                    url TEXT PRIMARY KEY,
+                    sha256 TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    size INTEGER,
+                    content_type TEXT,
+                    fetched_at REAL,
+                    validated_at REAL
+                )
+            """)
+
+    def lookup(self, url):
+        """查詢 URL 的快取紀錄，沒有時返回 None"""
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM image_urls WHERE url = ?", (url,)).fetchone()
+        return dict(row) if row else None
+
+    def is_fresh(self, entry):
+        """紀錄是否仍在新鮮期內（可不發出任何請求直接沿用）"""
+        return entry is not None and time.time() - (entry['validated_at'] or 0) < self.freshness_seconds
+
+    def conditional_headers(self, entry):
+        """產生條件式請求的標頭"""
+        headers = {}
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def record(self, url, sha256, etag=None, last_modified=None, size=None, content_type=None):
+        """記錄（或更新）一次完整下載的結果"""
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute("""
+                INSERT INTO image_urls (url, sha256, etag, last_modified, size, content_type, fetched_at, validated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    sha256 = excluded.sha256, etag = excluded.etag, last_modified = excluded.last_modified,
+                    size = excluded.size, content_type = excluded.content_type,
+                    fetched_at = excluded.fetched_at, validated_at = excluded.validated_at
+            """, (url, sha256, etag, last_modified, size, content_type, now, now))
+
+    def touch(self, url):
+        """伺服器回應 304 時更新驗證時間"""
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE image_urls SET validated_at = ? WHERE url = ?", (time.time(), url))
+
+    def close(self):
+        """關閉資料庫連線"""
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Google Maps 評論網路擷取模組
+功能: 透過 Chrome DevTools Protocol 的 performance 日誌擷取載入評論列表的回應，
+      直接解析評論資料（含圖片 URL），不再依賴畫面上的 CSS 選擇器
+
+離線解析錄製好的回應檔案:
+    python network_capture.py payload_001.txt payload_002.txt
+
+以內附的匿名化樣本檢查 UGC_POST_PATHS 與解析結果（調整索引路徑後執行）:
+    python network_capture.py --self-check
+"""
+
+import os
+import sys
+import json
+
+# 載入評論列表的 RPC 端點
+REVIEW_ENDPOINT_PATTERNS = [
+    '/maps/rpc/listugcposts',
+]
+
+# Google 在 JSON 回應前加上的防 XSSI 前綴
+XSSI_PREFIX = ")]}'"
+
+# listugcposts 回應中各欄位的索引路徑（以單則評論 entry[0] 為起點）
+# Google 調整回應格式時只需修改這裡
+UGC_POST_PATHS = {
+    'dom_id': (0,),
+    'reviewer_name': (1, 4, 5, 0),
+    'review_date': (1, 6),
+    'rating': (2, 0, 0),
+    'review_text': (2, 15, 0, 0),
+    'photos': (2, 2),
+    'photo_url': (1, 6, 0),   # 以單張圖片為起點
+}
+
+# 匿名化的 listugcposts 回應樣本與預期解析結果（重複圖片去除、最多 3 張、缺少文字時使用預設值、無效項目略過）
+SAMPLE_PAYLOAD_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'listugcposts_sample.txt')
+SAMPLE_EXPECTED_RECORDS = [
+    {
+        'dom_id': 'Ci9DQUlRQUNvZEV4YW1wbGVSZXZpZXdJZDAx',
+        'reviewer_name': '評論者 A',
+        'rating': 5,
+        'review_text': '示範評論內容，已匿名化。',
+        'review_date': '2 週前',
+        'photo_urls': [
+            f"https://lh3.googleusercontent.com/geougc-cs/EXAMPLE_PHOTO_{n}=w600-h450-p" for n in (1, 2, 3)
+        ],
+    },
+    {
+        'dom_id': 'Ci9DQUlRQUNvZEV4YW1wbGVSZXZpZXdJZDAy',
+        'reviewer_name': '評論者 B',
+        'rating': 4,
+        'review_text': '無評論內容',
+        'review_date': '3 個月前',
+        'photo_urls': [],
+    },
+]
+
+
+def _dig(data, path):
+    """依索引路徑安全地取出巢狀列表中的值，路徑不存在時返回 None"""
+    for index in path:
+        if not isinstance(data, list) or index >= len(data):
+            return None
+        data = data[index]
+    return data
+
+
+def parse_review_payload(text, max_photos=3):
+    """解析一份 listugcposts 回應內容，返回與批次提取相同格式的評論紀錄列表"""
+    if text.startswith(XSSI_PREFIX):
+        text = text[len(XSSI_PREFIX):]
+
+    try:
+        data = json.loads(text)
+    except ValueError as e:
+        print(f"解析評論回應 JSON 時發生錯誤: {e}")
+        return []
+
+    entries = _dig(data, (2,)) or []
+    records = []
+
+    for entry in entries:
+        review = _dig(entry, (0,))
+        dom_id = _dig(review, UGC_POST_PATHS['dom_id'])
+        if not isinstance(dom_id, str):
+            continue
+
+        photo_urls = []
+        for photo in _dig(review, UGC_POST_PATHS['photos']) or []:
+            url = _dig(photo, UGC_POST_PATHS['photo_url'])
+            if isinstance(url, str) and url not in photo_urls:
+                photo_urls.append(url)
+            if len(photo_urls) >= max_photos:
+                break
+
+        rating = _dig(review, UGC_POST_PATHS['rating'])
+        records.append({
+            'dom_id': dom_id,
+            'reviewer_name': _dig(review, UGC_POST_PATHS['reviewer_name']) or 'Unknown Reviewer',
+            'rating': int(rating) if isinstance(rating, (int, float)) else 5,
+            'review_text': _dig(review, UGC_POST_PATHS['review_text']) or '無評論內容',
+            'review_date': _dig(review, UGC_POST_PATHS['review_date']) or '未知日期',
+            'photo_urls': photo_urls
+        })
+
+    return records
+
+
+class NetworkReviewCapture:
+    """從 Chrome performance 日誌擷取評論 RPC 回應並解析"""
+
+    def __init__(self, driver, dump_dir=None):
+        """初始化網路擷取器（dump_dir 設定時會保存原始回應，可作為離線解析的樣本）"""
+        self.driver = driver
+        self.dump_dir = dump_dir
+        self.pending_requests = {}  # requestId -> URL，等待 loadingFinished 後才能讀取內容
+        self.dump_count = 0
+        self.driver.execute_cdp_cmd('Network.enable', {})
+
+    @staticmethod
+    def enable_logging(options):
+        """在 Chrome Options 上開啟 performance 日誌（必須在建立 driver 前呼叫）"""
+        options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+
+    def is_review_response(self, url):
+        """判斷回應是否為評論列表的 RPC"""
+        return any(pattern in url for pattern in REVIEW_ENDPOINT_PATTERNS)
+
+    def collect(self):
+        """讀取自上次呼叫以來的網路事件，返回新擷取到的評論紀錄"""
+        records = []
+
+        try:
+            log_entries = self.driver.get_log('performance')
+        except Exception as e:
+            print(f"讀取 performance 日誌時發生錯誤: {e}")
+            return records
+
+        for log_entry in log_entries:
+            try:
+                message = json.loads(log_entry['message'])['message']
+                method = message.get('method')
+                params = message.get('params', {})
+
+                if method == 'Network.responseReceived':
+                    url = params.get('response', {}).get('url', '')
+                    if self.is_review_response(url):
+                        self.pending_requests[params['requestId']] = url
+
+                elif method == 'Network.loadingFinished' and params.get('requestId') in self.pending_requests:
+                    request_id = params['requestId']
+                    self.pending_requests.pop(request_id)
+                    body = self.driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': request_id})
+                    payload = body.get('body', '')
+                    self.dump_payload(payload)
+                    records.extend(parse_review_payload(payload))
+
+            except Exception as e:
+                print(f"處理網路事件時發生錯誤: {e}")
+                continue
+
+        if records:
+            print(f"從網路回應擷取到 {len(records)} 則評論")
+        return records
+
+    def dump_payload(self, payload):
+        """保存原始回應內容到 dump_dir"""
+        if not self.dump_dir:
+            return
+        try:
+            os.makedirs(self.dump_dir, exist_ok=True)
+            self.dump_count += 1
+            filepath = os.path.join(self.dump_dir, f"payload_{self.dump_count:03d}.txt")
+            with open(filepath, 'w', encoding='utf-8') as f:
+                f.write(payload)
+        except Exception as e:
+            print(f"保存網路回應時發生錯誤: {e}")
+
+
+def self_check():
+    """解析內附樣本並與預期結果逐欄比對，返回結束代碼"""
+    with open(SAMPLE_PAYLOAD_PATH, 'r', encoding='utf-8') as f:
+        records = parse_review_payload(f.read())
+
+    failures = []
+    if len(records) != len(SAMPLE_EXPECTED_RECORDS):
+        failures.append(f"評論數量 {len(records)}，預期 {len(SAMPLE_EXPECTED_RECORDS)}")
+    for index, (record, expected) in enumerate(zip(records, SAMPLE_EXPECTED_RECORDS)):
+        for field, value in expected.items():
+            if record.get(field) != value:
+                failures.append(f"第 {index + 1} 則 {field}: {record.get(field)!r}，預期 {value!r}")
+
+    for failure in failures:
+        print(f"❌ {failure}")
+    if failures:
+        return 1
+    print(f"✅ 樣本解析正確 ({len(records)} 則評論)")
+    return 0
+
+
+def main():
+    """離線解析錄製的回應檔案並輸出評論紀錄"""
+    if len(sys.argv) < 2:
+        print("使用方法: python network_capture.py <payload 檔案> [...] | --self-check")
+        return 1
+    if sys.argv[1] == '--self-check':
+        return self_check()
+
+    all_records = []
+    for filepath in sys.argv[1:]:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            records = parse_review_payload(f.read())
+        print(f"{filepath}: 解析出 {len(records)} 則評論", file=sys.stderr)
+        all_records.extend(records)
+
+    print(json.dumps(all_records, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Google Maps 頁面等待模組
+功能: 以事件驅動的方式等待頁面狀態（MutationObserver / WebDriverWait 條件輪詢），
+      頁面一就緒即返回，並保留可設定的最長等待時間
+"""
+
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
+
+# 評論節點與載入指示器的選擇器
+REVIEW_NODE_SELECTOR = "div[data-review-id]"
+SPINNER_SELECTORS = [".qjESne", "div[role='progressbar']", ".lXJj5c"]
+
+# 在瀏覽器內以 MutationObserver 等待評論節點數量增加
+# 若在寬限時間後仍沒有載入指示器，代表頁面沒有在載入新內容，提前返回
+WAIT_FOR_NEW_NODES_SCRIPT = r"""
+const [selector, spinnerSelector, previous, timeoutMs, graceMs, done] = arguments;
+const count = () => document.querySelectorAll(selector).length;
+const spinning = () => !!document.querySelector(spinnerSelector);
+if (count() > previous) { done(count()); return; }
+
+let finished = false;
+const finish = () => {
+    if (finished) return;
+    finished = true;
+    observer.disconnect();
+    clearTimeout(timer);
+    clearTimeout(graceTimer);
+    done(count());
+};
+const observer = new MutationObserver(() => { if (count() > previous) finish(); });
+observer.observe(document.body, {childList: true, subtree: true});
+const timer = setTimeout(finish, timeoutMs);
+const graceTimer = setTimeout(() => { if (!spinning()) finish(); }, graceMs);
+"""
+
+
+class PageWaiter:
+    def __init__(self, driver, max_wait=10, poll_interval=0.2, grace_period=0.5):
+        """初始化頁面等待器"""
+        self.driver = driver
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        self.grace_period = grace_period
+        # 非同步腳本的逾時必須大於 MutationObserver 的最長等待時間
+        self.driver.set_script_timeout(max_wait + 5)
+
+    def wait_until(self, condition, timeout=None):
+        """輪詢條件直到成立或逾時，逾時返回 False 而不拋出例外"""
+        timeout = self.max_wait if timeout is None else min(timeout, self.max_wait)
+        try:
+            return WebDriverWait(self.driver, timeout, poll_frequency=self.poll_interval).until(condition)
+        except TimeoutException:
+            return False
+
+    def wait_for_page_ready(self, timeout=None):
+        """等待文件解析完成且主要內容區域出現（不等待圖片等子資源，可搭配 eager 載入策略）"""
+        return self.wait_until(
+            lambda d: d.execute_script(
+                "return document.readyState !== 'loading' && !!document.querySelector(\"div[role='main']\")"
+            ),
+            timeout
+        )
+
+    def wait_for_clickable(self, element, timeout=None):
+        """等待元素可被點擊"""
+        return self.wait_until(EC.element_to_be_clickable(element), timeout)
+
+    def wait_for_element_gone(self, element, timeout=None):
+        """等待元素從頁面移除或隱藏（例如點擊後消失的展開按鈕）"""
+        return self.wait_until(
+            lambda d: EC.staleness_of(element)(d) or EC.invisibility_of_element(element)(d),
+            timeout
+        )
+
+    def wait_for_spinner_gone(self, timeout=None):
+        """等待評論列表的載入指示器消失"""
+        selector = ", ".join(SPINNER_SELECTORS)
+        return self.wait_until(
+            lambda d: not d.execute_script("return !!document.querySelector(arguments[0])", selector),
+            timeout
+        )
+
+    def get_review_count(self):
+        """取得目前頁面上的評論節點數量"""
+        try:
+            return self.driver.execute_script(
+                "return document.querySelectorAll(arguments[0]).length", REVIEW_NODE_SELECTOR
+            )
+        except Exception:
+            return 0
+
+    def wait_for_review_count_increase(self, previous_count, timeout=None):
+        """等待評論節點數量超過 previous_count，返回最新數量"""
+        timeout = self.max_wait if timeout is None else min(timeout, self.max_wait)
+        try:
+            return self.driver.execute_async_script(
+                WAIT_FOR_NEW_NODES_SCRIPT,
+                REVIEW_NODE_SELECTOR,
+                ", ".join(SPINNER_SELECTORS),
+                previous_count,
+                int(timeout * 1000),
+                int(min(self.grace_period, timeout) * 1000)
+            )
+        except Exception as e:
+            print(f"等待新評論載入時發生錯誤: {e}")
+            return self.get_review_count()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+依主機分組的請求速率限制模組
+功能: 每個主機分組（googleusercontent 圖片 / maps 頁面）一個權杖桶，允許短時間突發，
+      遇到 429 / 5xx 時依 Retry-After 或帶抖動的指數退避暫停整個分組並降低速率，
+      之後逐步恢復，讓所有下載執行緒共用同一份節流狀態；多個爬蟲行程可透過 RateLimiterManager
+      共用同一個限制器，總速率不會隨行程數倍增
+"""
+
+import time
+import random
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from multiprocessing.managers import BaseManager
+from urllib.parse import urlparse
+
+# 主機分組規則（依序比對主機名稱結尾，第一個符合的分組生效）
+HOST_GROUPS = [
+    ('googleusercontent.com', 'googleusercontent'),
+    ('ggpht.com', 'googleusercontent'),
+    ('google.com', 'maps'),
+    ('google.com.tw', 'maps'),
+]
+
+# 各分組的速率設定: 每秒補充的權杖數、桶容量（可突發的請求數）
+DEFAULT_LIMITS = {
+    'googleusercontent': {'rate': 8.0, 'burst': 16},
+    'maps': {'rate': 1.0, 'burst': 3},
+    'default': {'rate': 4.0, 'burst': 8},
+}
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+def host_group(url):
+    """取得 URL 所屬的主機分組"""
+    host = (urlparse(url).hostname or '').lower()
+    for suffix, group in HOST_GROUPS:
+        if host == suffix or host.endswith('.' + suffix):
+            return group
+    return 'default'
+
+
+class TokenBucket:
+    """可自適應調整速率的權杖桶"""
+
+    def __init__(self, rate, burst, min_rate=0.25, base_delay=1.0, max_delay=60.0):
+        """初始化權杖桶（桶一開始是滿的，可立即突發 burst 個請求）"""
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.burst = burst
+        self.tokens = float(burst)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.failures = 0  # 連續失敗次數
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        """依經過時間補充權杖"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self):
+        """取得一個權杖，必要時等待；返回實際等待的秒數"""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                if now < self.blocked_until:
+                    delay = self.blocked_until - now
+                else:
+                    delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def record_success(self):
+        """請求成功：清除連續失敗次數，並逐步把速率加回上限（加法增加）"""
+        with self.lock:
+            self.failures = 0
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.1)
+
+    def record_failure(self, retry_after=None):
+        """請求被限流或伺服器錯誤：速率減半（乘法減少），整個分組暫停一段時間；返回暫停秒數"""
+        with self.lock:
+            self.failures += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0.0
+            # 完整抖動的指數退避，避免多個執行緒同時重試
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** self.failures))
+            if retry_after is not None:
+                delay = max(delay, min(retry_after, self.max_delay))
+            now = time.monotonic()
+            self.blocked_until = max(self.blocked_until, now + delay)
+            return self.blocked_until - now
+
+
+class HostRateLimiter:
+    """依主機分組管理權杖桶（可由多個執行緒共用）"""
+
+    def __init__(self, limits=None):
+        """初始化限制器（limits 覆寫 DEFAULT_LIMITS 中的分組設定）"""
+        self.limits = dict(DEFAULT_LIMITS)
+        self.limits.update(limits or {})
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def bucket(self, url):
+        """取得 URL 所屬分組的權杖桶"""
+        group = host_group(url)
+        with self.lock:
+            if group not in self.buckets:
+                settings = self.limits.get(group, self.limits['default'])
+                self.buckets[group] = TokenBucket(settings['rate'], settings['burst'])
+            return self.buckets[group]
+
+    def acquire(self, url):
+        """發出請求前取得權杖"""
+        return self.bucket(url).acquire()
+
+    def record_response(self, url, status_code, retry_after=None):
+        """回報回應狀態；需要重試時返回分組暫停的秒數，否則返回 None"""
+        bucket = self.bucket(url)
+        if status_code in RETRYABLE_STATUS:
+            return bucket.record_failure(parse_retry_after(retry_after))
+        bucket.record_success()
+        return None
+
+    def record_error(self, url):
+        """回報連線錯誤（逾時、連線中斷），返回分組暫停的秒數"""
+        return self.bucket(url).record_failure()
+
+
+class RateLimiterManager(BaseManager):
+    """在管理行程中保存 HostRateLimiter，各工作行程以代理物件呼叫（每個執行緒各自連線，等待權杖時互不阻擋）"""
+
+
+RateLimiterManager.register(
+    'HostRateLimiter', HostRateLimiter, exposed=('acquire', 'record_response', 'record_error')
+)
+
+
+def parse_retry_after(value):
+    """解析 Retry-After 標頭（秒數或 HTTP 日期），無法解析返回 None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Google Maps 評論批次提取模組
+功能: 每個滾動循環只執行一次 execute_script，在瀏覽器內讀取所有評論欄位；
+      或取得一次 HTML 快照，交給背景執行緒以 lxml 解析
+"""
+
+import re
+from concurrent.futures import ThreadPoolExecutor
+from lxml import html as lxml_html
+
+# 已處理評論節點的標記屬性（增量游標：每次只向頁面索取尚未標記的節點）
+SEEN_MARKER_ATTRIBUTE = "data-scraper-seen"
+# 已點擊「更多」但尚未讀取的評論節點：展開可能非同步渲染，點擊後留到下個循環再讀取
+EXPAND_PENDING_ATTRIBUTE = "data-scraper-expanding"
+
+# 在瀏覽器內執行的提取腳本
+# 選擇器與備用規則對應 GoogleReviewsScraper.extract_reviewer_name / extract_rating /
+# extract_review_text / extract_review_date 以及 ReviewImageHandler.extract_image_urls
+BATCH_EXTRACT_SCRIPT = r"""
+const NAME_SELECTORS = [".d4r55", "[data-value='Name']", ".a-profile-name", ".TSUbDb",
+                        "div[style*='16px'] > div", "a[data-value]", "button[data-value]"];
+const RATING_SELECTORS = ["[role='img'][aria-label*='星']", "[aria-label*='star']", ".kvMYJc",
+                          "span[role='img']", "[title*='星']"];
+const TEXT_SELECTORS = [".wiI7pd", "[data-expandable-section]", ".MyEned", ".rsqaWe",
+                        "span[jsaction*='JIbuQc']", ".review-full-text"];
+const DATE_SELECTORS = [".rsqaWe", ".DU9Pgb", "span[style*='color']", "[data-value='Date']"];
+const DATE_KEYWORDS = ['前', '週', '月', '年', 'ago', 'week', 'month', 'year'];
+const EXPAND_SELECTOR = "button[jsaction*='expandReview'], button[aria-label*='更多'], button[aria-label*='More']";
+const MAX_PHOTOS = arguments[0];
+const SEEN_MARKER = arguments[1];
+const PENDING_MARKER = arguments[2];
+const PENDING_ONLY = arguments[3];  // 最後一次收集：只讀取已點擊展開的節點
+
+function textOf(el) {
+    return (el.innerText || '').trim();
+}
+
+function extractName(node) {
+    for (const sel of NAME_SELECTORS) {
+        const el = node.querySelector(sel);
+        if (el && textOf(el)) return textOf(el);
+    }
+    for (const el of node.querySelectorAll('button, a')) {
+        const text = textOf(el);
+        if (text && text.length < 50) return text;
+    }
+    return 'Unknown Reviewer';
+}
+
+function extractRating(node) {
+    for (const sel of RATING_SELECTORS) {
+        const el = node.querySelector(sel);
+        if (!el) continue;
+        const label = el.getAttribute('aria-label') || el.getAttribute('title') || '';
+        if (label.includes('星')) {
+            const match = label.match(/\d+/);
+            if (match) return parseInt(match[0], 10);
+        }
+    }
+    return 5;
+}
+
+function extractText(node) {
+    for (const sel of TEXT_SELECTORS) {
+        const el = node.querySelector(sel);
+        if (el && textOf(el).length > 10) return textOf(el);
+    }
+    let longest = '';
+    for (const line of textOf(node).split('\n')) {
+        const trimmed = line.trim();
+        if (trimmed.length > longest.length && trimmed.length > 20) longest = trimmed;
+    }
+    return longest || '無評論內容';
+}
+
+function extractDate(node) {
+    for (const sel of DATE_SELECTORS) {
+        for (const el of node.querySelectorAll(sel)) {
+            const text = textOf(el);
+            if (DATE_KEYWORDS.some(keyword => text.includes(keyword))) return text;
+        }
+    }
+    return '未知日期';
+}
+
+function extractPhotoUrls(node) {
+    const urls = [];
+    const keys = [];  // 去除尺寸參數後的 URL，同一張照片的不同尺寸只取一次
+    for (const button of node.querySelectorAll('button')) {
+        const jsaction = button.getAttribute('jsaction') || '';
+        if (!jsaction.includes('openPhoto') || jsaction.includes('showMorePhotos')) continue;
+        const match = (button.style.backgroundImage || '').match(/url\(["']?([^"')]+)["']?\)/);
+        if (!match || !match[1].includes('geougc')) continue;
+        const key = match[1].replace(/=[swh]\d+[^/]*$/, '');
+        if (!keys.includes(key)) {
+            keys.push(key);
+            urls.push(match[1]);
+        }
+        if (urls.length >= MAX_PHOTOS) break;
+    }
+    return urls;
+}
+
+const records = [];
+const seen = new Set();
+const pendingFilter = PENDING_ONLY ? `[${PENDING_MARKER}]` : '';
+for (const node of document.querySelectorAll(`div[data-review-id]${pendingFilter}:not([${SEEN_MARKER}])`)) {
+    const domId = node.getAttribute('data-review-id');
+    // 外層與內層節點共用同一個 data-review-id，只處理最先出現的外層節點
+    if (!domId || seen.has(domId)) continue;
+    seen.add(domId);
+
+    // 展開被截斷的評論內容：展開後的文字可能非同步渲染，這次只點擊，下個循環再讀取
+    if (!node.hasAttribute(PENDING_MARKER)) {
+        const expandButton = node.querySelector(EXPAND_SELECTOR);
+        if (expandButton && !(expandButton.getAttribute('jsaction') || '').includes('Photo')) {
+            try { expandButton.click(); } catch (e) {}
+            node.setAttribute(PENDING_MARKER, '1');
+            continue;
+        }
+    }
+
+    // 標記外層與內層節點，下個循環不再回傳
+    node.setAttribute(SEEN_MARKER, '1');
+    node.querySelectorAll('[data-review-id]').forEach(inner => inner.setAttribute(SEEN_MARKER, '1'));
+
+    records.push({
+        dom_id: domId,
+        reviewer_name: extractName(node),
+        rating: extractRating(node),
+        review_text: extractText(node),
+        review_date: extractDate(node),
+        photo_urls: extractPhotoUrls(node)
+    });
+}
+return records;
+"""
+
+
+class BatchReviewExtractor:
+    """批次評論提取器 - 一次 WebDriver 往返取得所有評論"""
+
+    def __init__(self, driver, max_photos=3):
+        """初始化批次提取器"""
+        self.driver = driver
+        self.max_photos = max_photos
+
+    def extract_visible_reviews(self, pending_only=False):
+        """提取頁面上尚未標記的 div[data-review-id] 評論，回傳結構化紀錄列表；
+        有「更多」按鈕的評論本次只展開，下次呼叫才讀取（pending_only=True 時只讀取這些已展開的評論）"""
+        try:
+            records = self.driver.execute_script(
+                BATCH_EXTRACT_SCRIPT, self.max_photos, SEEN_MARKER_ATTRIBUTE, EXPAND_PENDING_ATTRIBUTE, pending_only
+            )
+            return records or []
+        except Exception as e:
+            print(f"批次提取評論時發生錯誤: {e}")
+            return []
+
+
+# 展開並標記新評論節點，返回這些節點的 outerHTML（單次 WebDriver 往返；展開規則與 BATCH_EXTRACT_SCRIPT 相同）
+SNAPSHOT_SCRIPT = r"""
+const SEEN_MARKER = arguments[0];
+const PENDING_MARKER = arguments[1];
+const PENDING_ONLY = arguments[2];
+const EXPAND_SELECTOR = "button[jsaction*='expandReview'], button[aria-label*='更多'], button[aria-label*='More']";
+const parts = [];
+const seen = new Set();
+const pendingFilter = PENDING_ONLY ? `[${PENDING_MARKER}]` : '';
+for (const node of document.querySelectorAll(`div[data-review-id]${pendingFilter}:not([${SEEN_MARKER}])`)) {
+    const domId = node.getAttribute('data-review-id');
+    if (!domId || seen.has(domId)) continue;
+    seen.add(domId);
+
+    if (!node.hasAttribute(PENDING_MARKER)) {
+        const expandButton = node.querySelector(EXPAND_SELECTOR);
+        if (expandButton && !(expandButton.getAttribute('jsaction') || '').includes('Photo')) {
+            try { expandButton.click(); } catch (e) {}
+            node.setAttribute(PENDING_MARKER, '1');
+            continue;
+        }
+    }
+
+    node.setAttribute(SEEN_MARKER, '1');
+    node.querySelectorAll('[data-review-id]').forEach(inner => inner.setAttribute(SEEN_MARKER, '1'));
+    parts.push(node.outerHTML);
+}
+return parts.join('');
+"""
+
+
+def _has_class(cls):
+    """產生對應 CSS .class 選擇器的 XPath 條件"""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {cls} ')"
+
+
+# 與 BATCH_EXTRACT_SCRIPT 相同的選擇器（以 XPath 表示，lxml 不需額外安裝 cssselect）
+NAME_XPATHS = [
+    f".//*[{_has_class('d4r55')}]", ".//*[@data-value='Name']", f".//*[{_has_class('a-profile-name')}]",
+    f".//*[{_has_class('TSUbDb')}]", ".//div[contains(@style, '16px')]/div", ".//a[@data-value]",
+    ".//button[@data-value]"
+]
+RATING_XPATHS = [
+    ".//*[@role='img' and contains(@aria-label, '星')]", ".//*[contains(@aria-label, 'star')]",
+    f".//*[{_has_class('kvMYJc')}]", ".//span[@role='img']", ".//*[contains(@title, '星')]"
+]
+TEXT_XPATHS = [
+    f".//*[{_has_class('wiI7pd')}]", ".//*[@data-expandable-section]", f".//*[{_has_class('MyEned')}]",
+    f".//*[{_has_class('rsqaWe')}]", ".//span[contains(@jsaction, 'JIbuQc')]",
+    f".//*[{_has_class('review-full-text')}]"
+]
+DATE_XPATHS = [
+    f".//*[{_has_class('rsqaWe')}]", f".//*[{_has_class('DU9Pgb')}]", ".//span[contains(@style, 'color')]",
+    ".//*[@data-value='Date']"
+]
+PHOTO_BUTTON_XPATH = ".//button[contains(@jsaction, 'openPhoto') and not(contains(@jsaction, 'showMorePhotos'))]"
+PHOTO_SIZE_SUFFIX = re.compile(r'=[swh]\d+[^/]*$')  # googleusercontent 圖片 URL 的尺寸參數
+DATE_KEYWORDS = ['前', '週', '月', '年', 'ago', 'week', 'month', 'year']
+
+
+def _text_of(element):
+    """取得元素的文字內容"""
+    return element.text_content().strip()
+
+
+def _parse_review_node(node, max_photos):
+    """從單一評論節點解析欄位，備用規則與 BATCH_EXTRACT_SCRIPT 一致"""
+    reviewer_name = None
+    for xpath in NAME_XPATHS:
+        found = node.xpath(xpath)
+        if found and _text_of(found[0]):
+            reviewer_name = _text_of(found[0])
+            break
+    if not reviewer_name:
+        for element in node.xpath(".//button | .//a"):
+            text = _text_of(element)
+            if text and len(text) < 50:
+                reviewer_name = text
+                break
+
+    rating = 5
+    for xpath in RATING_XPATHS:
+        found = node.xpath(xpath)
+        if not found:
+            continue
+        label = found[0].get('aria-label') or found[0].get('title') or ''
+        match = re.search(r'\d+', label)
+        if '星' in label and match:
+            rating = int(match.group(0))
+            break
+
+    review_text = None
+    for xpath in TEXT_XPATHS:
+        found = node.xpath(xpath)
+        if found and len(_text_of(found[0])) > 10:
+            review_text = _text_of(found[0])
+            break
+    if not review_text:
+        lines = [line.strip() for line in node.itertext() if len(line.strip()) > 20]
+        review_text = max(lines, key=len) if lines else '無評論內容'
+
+    review_date = '未知日期'
+    for xpath in DATE_XPATHS:
+        texts = [_text_of(element) for element in node.xpath(xpath)]
+        matched = [text for text in texts if any(keyword in text for keyword in DATE_KEYWORDS)]
+        if matched:
+            review_date = matched[0]
+            break
+
+    photo_urls = []
+    photo_keys = set()  # 去除尺寸參數後的 URL，同一張照片的不同尺寸只取一次
+    for button in node.xpath(PHOTO_BUTTON_XPATH):
+        match = re.search(r'url\(["\']?([^"\')]+)["\']?\)', button.get('style') or '')
+        if match and 'geougc' in match.group(1):
+            key = PHOTO_SIZE_SUFFIX.sub('', match.group(1))
+            if key not in photo_keys:
+                photo_keys.add(key)
+                photo_urls.append(match.group(1))
+        if len(photo_urls) >= max_photos:
+            break
+
+    return {
+        'dom_id': node.get('data-review-id'),
+        'reviewer_name': reviewer_name or 'Unknown Reviewer',
+        'rating': rating,
+        'review_text': review_text,
+        'review_date': review_date,
+        'photo_urls': photo_urls
+    }
+
+
+def parse_review_html(html, max_photos=3):
+    """以 lxml 解析評論 HTML 片段，返回與批次提取相同格式的評論紀錄列表"""
+    if not html:
+        return []
+
+    root = lxml_html.fromstring(f"<div>{html}</div>")
+    records = []
+    seen = set()
+    for node in root.xpath(".//div[@data-review-id]"):
+        dom_id = node.get('data-review-id')
+        if dom_id in seen:
+            continue
+        seen.add(dom_id)
+        try:
+            records.append(_parse_review_node(node, max_photos))
+        except Exception as e:
+            print(f"解析評論節點 {dom_id} 時發生錯誤: {e}")
+    return records
+
+
+class SnapshotReviewExtractor:
+    """快照評論提取器 - 每循環取一次 HTML，於背景執行緒解析，與滾動重疊進行"""
+
+    def __init__(self, driver, max_photos=3):
+        """初始化快照提取器"""
+        self.driver = driver
+        self.max_photos = max_photos
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='review-parser')
+        self.pending = []  # 依提交順序排列的解析工作
+
+    def capture(self, pending_only=False):
+        """取得新評論節點的 HTML 快照並交給背景執行緒解析（pending_only=True 時只取已展開的評論）"""
+        try:
+            html = self.driver.execute_script(
+                SNAPSHOT_SCRIPT, SEEN_MARKER_ATTRIBUTE, EXPAND_PENDING_ATTRIBUTE, pending_only
+            )
+        except Exception as e:
+            print(f"取得評論 HTML 快照時發生錯誤: {e}")
+            return
+        if html:
+            self.pending.append(self.executor.submit(parse_review_html, html, self.max_photos))
+
+    def drain(self, wait=False, max_pending=None):
+        """收集已解析完成的紀錄（依提交順序）；wait=True 時等待所有解析工作完成，
+        指定 max_pending 時只等待到尚未完成的快照不超過該數量"""
+        records = []
+        while self.pending and (wait or self.pending[0].done()
+                                or (max_pending is not None and len(self.pending) > max_pending)):
+            future = self.pending.pop(0)
+            try:
+                records.extend(future.result())
+            except Exception as e:
+                print(f"背景解析評論快照時發生錯誤: {e}")
+        return records
+
+    def shutdown(self):
+        """關閉背景解析執行緒"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
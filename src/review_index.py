@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Google Maps 評論索引模組
+功能: 以跨執行穩定的評論識別碼記錄已保存過的評論，支援增量爬取
+"""
+
+import os
+import json
+import hashlib
+from datetime import datetime
+
+
+def content_digest(*parts):
+    """以評論內容產生跨執行穩定的摘要（取代每個行程都會加鹽的 hash()）"""
+    joined = "\n".join(part or "" for part in parts)
+    return hashlib.sha1(joined.encode('utf-8')).hexdigest()[:16]
+
+
+class SeenReviewIndex:
+    """已保存評論的持久索引（review_key -> 首次/最後出現時間與所在快照）"""
+
+    def __init__(self, path):
+        """載入索引檔案，不存在時建立空索引"""
+        self.path = path
+        self.data = {'latest_snapshot': None, 'reviews': {}}
+
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.data = json.load(f)
+                print(f"已載入評論索引: {len(self.data['reviews'])} 則已保存評論")
+            except Exception as e:
+                print(f"載入評論索引時發生錯誤，改用空索引: {e}")
+
+    def __contains__(self, review_key):
+        return review_key in self.data['reviews']
+
+    def __len__(self):
+        return len(self.data['reviews'])
+
+    @property
+    def latest_snapshot(self):
+        """最近一次寫入的快照檔案路徑"""
+        return self.data.get('latest_snapshot')
+
+    @property
+    def snapshots(self):
+        """索引中記錄過的所有快照檔案路徑"""
+        return sorted({entry['snapshot'] for entry in self.data['reviews'].values() if entry.get('snapshot')})
+
+    def record(self, reviews, snapshot):
+        """將已保存的評論加入索引"""
+        now = datetime.now().isoformat()
+        for review in reviews:
+            review_key = review.get('review_key')
+            if not review_key:
+                continue
+            entry = self.data['reviews'].setdefault(review_key, {'first_seen': now, 'snapshot': snapshot})
+            entry['last_seen'] = now
+        self.data['latest_snapshot'] = snapshot
+
+    def save(self):
+        """以暫存檔 + 替換的方式寫入索引，避免中斷時留下損壞的檔案"""
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, ensure_ascii=False, indent=2)
+            os.replace(temp_path, self.path)
+            print(f"評論索引已保存到 {self.path} (共 {len(self)} 則)")
+        except Exception as e:
+            print(f"保存評論索引時發生錯誤: {e}")
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Google Maps 評論資料庫
+功能: 以 SQLite 保存所有爬取過的評論（以跨執行穩定的 review_key 為主鍵），重複出現的評論以
+      upsert 更新內容並記錄首次 / 最後出現時間；依店家、評分、首次出現時間建立索引，
+      網站使用的 JSON 由資料庫依需求匯出，增量合併不必再重新解析整份快照檔。
+      使用 WAL 模式，多個爬蟲行程可同時讀取並輪流寫入同一個資料庫
+
+使用方法:
+    python review_store.py import ../web/data/*.json                       # 匯入既有的 JSON 快照
+    python review_store.py export ../web/data/20250101_120000.json --business 築宜系統傢俱 --min-rating 4
+"""
+
+import os
+import sys
+import json
+import sqlite3
+import argparse
+import threading
+from datetime import datetime
+from review_index import content_digest
+from review_writer import write_json_atomic
+
+BUSY_TIMEOUT_MS = 30000  # 其他行程正在寫入時等待的上限
+KEY_LOOKUP_CHUNK = 500   # 查詢既有評論時每次帶入的主鍵數
+
+
+class ReviewStore:
+    """SQLite 評論資料庫（同一行程內可由多個執行緒共用）"""
+
+    def __init__(self, db_path):
+        """開啟（或建立）評論資料庫"""
+        self.db_path = db_path
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=BUSY_TIMEOUT_MS / 1000)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock:
+            # WAL：讀取不會被寫入阻擋，多個行程的寫入依序進行；NORMAL 在 WAL 下仍不會損壞資料庫
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+            with self.conn:
+                self.conn.execute("""
+                    CREATE TABLE IF NOT EXISTS reviews (
+                        review_key TEXT PRIMARY KEY,
+                        business_name TEXT,
+                        location TEXT,
+                        reviewer_name TEXT,
+                        rating INTEGER,
+                        review_text TEXT,
+                        review_date TEXT,
+                        review_id INTEGER,
+                        first_seen TEXT NOT NULL,
+                        last_seen TEXT NOT NULL,
+                        data TEXT NOT NULL
+                    )
+                """)
+                # Google 只提供「1 週前」之類的相對日期，以首次出現時間作為可排序的日期
+                self.conn.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_reviews_place ON reviews (business_name, location, first_seen DESC)"
+                )
+                self.conn.execute("CREATE INDEX IF NOT EXISTS idx_reviews_rating ON reviews (rating)")
+                self.conn.execute("CREATE INDEX IF NOT EXISTS idx_reviews_first_seen ON reviews (first_seen DESC)")
+
+    def __contains__(self, review_key):
+        with self.lock:
+            row = self.conn.execute("SELECT 1 FROM reviews WHERE review_key = ?", (review_key,)).fetchone()
+        return row is not None
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM reviews").fetchone()[0]
+
+    def max_review_id(self, business_name, location):
+        """查詢店家已保存評論的最大序號（增量爬取接續編號），沒有評論時返回 0"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT MAX(review_id) FROM reviews WHERE business_name = ? AND location = ?",
+                (business_name, location)
+            ).fetchone()
+        return row[0] or 0
+
+    def upsert(self, reviews, seen_at=None):
+        """新增或更新評論（以單一交易寫入）；既有評論保留 first_seen，只更新內容與 last_seen，返回新增的則數"""
+        seen_at = seen_at or datetime.now().isoformat()
+        rows = [
+            (
+                review['review_key'], review.get('business_name'), review.get('location'),
+                review.get('reviewer_name'), review.get('rating'), review.get('review_text'),
+                review.get('review_date'), review.get('review_id'),
+                review.get('first_seen') or seen_at, seen_at, json.dumps(review, ensure_ascii=False)
+            )
+            for review in reviews if review.get('review_key')
+        ]
+        keys = list({row[0] for row in rows})
+        with self.lock, self.conn:
+            # 一開始就取得寫入鎖，避免多個行程同時由讀取升級為寫入而互相等待
+            self.conn.execute("BEGIN IMMEDIATE")
+            # 以主鍵索引查詢本批中已存在的評論（分段避免超過 SQL 參數數量上限）
+            existing = 0
+            for start in range(0, len(keys), KEY_LOOKUP_CHUNK):
+                chunk = keys[start:start + KEY_LOOKUP_CHUNK]
+                existing += self.conn.execute(
+                    f"SELECT COUNT(*) FROM reviews WHERE review_key IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchone()[0]
+            self.conn.executemany("""
+                INSERT INTO reviews (review_key, business_name, location, reviewer_name, rating, review_text,
+                                     review_date, review_id, first_seen, last_seen, data)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(review_key) DO UPDATE SET
+                    business_name = excluded.business_name, location = excluded.location,
+                    reviewer_name = excluded.reviewer_name, rating = excluded.rating,
+                    review_text = excluded.review_text, review_date = excluded.review_date,
+                    review_id = excluded.review_id, data = excluded.data,
+                    last_seen = MAX(reviews.last_seen, excluded.last_seen),
+                    first_seen = MIN(reviews.first_seen, excluded.first_seen)
+            """, rows)
+        added = len(keys) - existing
+        print(f"評論資料庫已更新: 新增 {added} 則、更新 {existing} 則")
+        return added
+
+    def query(self, business_name=None, location=None, min_rating=None, limit=None):
+        """依店家 / 最低評分查詢評論，最新出現的在前（同一次爬取依頁面順序），返回評論資料列表"""
+        conditions, params = [], []
+        if business_name is not None:
+            conditions.append("business_name = ?")
+            params.append(business_name)
+        if location is not None:
+            conditions.append("location = ?")
+            params.append(location)
+        if min_rating is not None:
+            conditions.append("rating >= ?")
+            params.append(min_rating)
+
+        sql = "SELECT data, first_seen, last_seen FROM reviews"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY first_seen DESC, review_id ASC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        reviews = []
+        for row in rows:
+            review = json.loads(row['data'])
+            review['first_seen'] = row['first_seen']
+            review['last_seen'] = row['last_seen']
+            reviews.append(review)
+        return reviews
+
+    def export_json(self, path, **filters):
+        """將查詢結果匯出為網站使用的 JSON（以暫存檔 + 替換寫入），返回匯出的則數"""
+        count = write_json_atomic(self.query(**filters), path)
+        print(f"已從評論資料庫匯出 {count} 則評論到 {path}")
+        return count
+
+    def import_json(self, json_files):
+        """匯入既有的 JSON 快照（依檔名時間由舊到新，首次出現時間取 scraped_at），返回新增的則數"""
+        added = 0
+        for json_file in sorted(json_files):
+            with open(json_file, 'r', encoding='utf-8') as f:
+                reviews = json.load(f)
+            for review in reviews:
+                review.setdefault('first_seen', review.get('scraped_at'))
+                if not review.get('review_key'):
+                    # 舊版快照沒有 review_key，以與爬蟲相同的內容摘要補上
+                    review['review_key'] = f"review_hash_{content_digest(review.get('reviewer_name'), review.get('review_text'))}"
+            added += self.upsert(reviews, max((r.get('scraped_at') or '' for r in reviews), default=None))
+        return added
+
+    def close(self):
+        """關閉資料庫連線"""
+        with self.lock:
+            self.conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='評論資料庫工具')
+    parser.add_argument('--db', default='../web/data/_store/reviews.sqlite3', help='資料庫路徑')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    import_parser = subparsers.add_parser('import', help='匯入既有的 JSON 快照')
+    import_parser.add_argument('json_files', nargs='+')
+    export_parser = subparsers.add_parser('export', help='匯出網站使用的 JSON')
+    export_parser.add_argument('output')
+    export_parser.add_argument('--business', default=None)
+    export_parser.add_argument('--location', default=None)
+    export_parser.add_argument('--min-rating', type=int, default=None)
+    export_parser.add_argument('--limit', type=int, default=None)
+    args = parser.parse_args()
+
+    store = ReviewStore(args.db)
+    if args.command == 'import':
+        store.import_json(args.json_files)
+    elif args.command == 'export':
+        store.export_json(args.output, business_name=args.business, location=args.location,
+                          min_rating=args.min_rating, limit=args.limit)
+    store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Google Maps 評論串流輸出模組
+功能: 爬取過程中每完成一則評論（圖片欄位已回填）就以一行 JSON 附加到 NDJSON 檔，分批 fsync，
+      中途當機時已完成的評論仍保留在檔案中，其他程式也可以邊爬邊讀取（tail -f）；
+      評論依頁面順序保留位置，圖片較晚下載完成的評論會讓後面已完成的評論稍候，檔案維持頁面順序；
+      網站使用的 JSON 一律由 NDJSON 逐批產生（每批先補上衍生圖片等欄位），以串流方式寫入暫存檔、
+      fsync 後再替換，不會留下寫到一半的檔案，記憶體中也只保留一批評論
+
+使用方法（由中斷的爬取結果產生網站 JSON，流程與爬取正常結束時相同）:
+    python review_writer.py finalize ../web/data/_store/20250101_120000.ndjson ../web/data/20250101_120000.json
+    python review_writer.py finalize ... --incremental   # 增量模式的爬取結果
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import textwrap
+import threading
+from collections import deque
+
+DEFAULT_FSYNC_BATCH = 20       # 每寫入幾則評論 fsync 一次
+DEFAULT_FSYNC_INTERVAL = 5.0   # 距上次 fsync 超過幾秒也會 fsync
+FINALIZE_BATCH_SIZE = 200      # 產生網站 JSON 時每批處理的評論數
+
+
+def public_fields(review):
+    """去除下載管線使用的暫存欄位（底線開頭）"""
+    return {key: value for key, value in review.items() if not key.startswith('_')}
+
+
+class NdjsonReviewWriter:
+    """以附加方式逐則寫入評論的 NDJSON 檔（可由多個執行緒呼叫，同一則評論只寫入一次）；
+    先以 reserve 依頁面順序保留位置的評論，會等前面保留的評論都完成後才依序寫入"""
+
+    def __init__(self, path, fsync_batch=DEFAULT_FSYNC_BATCH, fsync_interval=DEFAULT_FSYNC_INTERVAL):
+        """開啟（或接續）NDJSON 檔"""
+        self.path = path
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self.lock = threading.Lock()
+        self.written_keys = set()
+        self.order = deque()  # 依頁面順序等待寫入的位置（review_key，或未保留位置的評論各自的標記）
+        self.lines = {}       # 位置 -> 已完成評論的 JSON 行（尚未完成的為 None）
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+        self.count = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def reserve(self, review):
+        """依頁面順序為評論保留位置（圖片下載完成、呼叫 write 時才寫入）"""
+        review_key = review.get('review_key')
+        with self.lock:
+            if self.file is None or not review_key or review_key in self.written_keys or review_key in self.lines:
+                return
+            self.order.append(review_key)
+            self.lines[review_key] = None
+
+    def write(self, review):
+        """附加一則已完成的評論；前面還有保留位置的評論未完成時先暫存，已寫入過的 review_key 會略過，
+        返回是否有接受"""
+        review_key = review.get('review_key')
+        line = json.dumps(public_fields(review), ensure_ascii=False, separators=(',', ':')) + '\n'
+        with self.lock:
+            if self.file is None or (review_key and review_key in self.written_keys):
+                return False
+            if review_key:
+                self.written_keys.add(review_key)
+            slot = review_key if review_key in self.lines else object()
+            if slot is not review_key:
+                self.order.append(slot)  # 沒有保留位置的評論排在目前所有位置之後
+            self.lines[slot] = line
+            self._flush_ready()
+        return True
+
+    def _flush_ready(self):
+        """依序寫出前端已完成的評論（呼叫端需持有 self.lock）"""
+        written = 0
+        while self.order and self.lines[self.order[0]] is not None:
+            self.file.write(self.lines.pop(self.order.popleft()))
+            written += 1
+        if not written:
+            return
+        self.file.flush()  # 立即交給作業系統，讀取端不必等到 fsync
+        self.count += written
+        self.unsynced += written
+        if self.unsynced >= self.fsync_batch or time.monotonic() - self.last_sync >= self.fsync_interval:
+            self._sync()
+
+    def _sync(self):
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def close(self):
+        """寫出已完成但仍在等待前面評論的評論，fsync 尚未落盤的評論並關閉檔案"""
+        with self.lock:
+            if self.file is None:
+                return
+            unfinished = [slot for slot in self.order if self.lines[slot] is None]
+            if unfinished:
+                print(f"⚠️  {len(unfinished)} 則評論的圖片未完成，未寫入 NDJSON")
+                for slot in unfinished:
+                    self.order.remove(slot)
+                    del self.lines[slot]
+                self._flush_ready()
+            if self.unsynced:
+                self._sync()
+            self.file.close()
+            self.file = None
+        print(f"串流輸出完成: {self.count} 則評論 -> {self.path}")
+
+
+def read_ndjson(path):
+    """逐行讀取 NDJSON 評論（當機時最後一行可能不完整，無法解析的行會略過）"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                print(f"略過 {path} 第 {line_number} 行（不完整的紀錄）")
+
+
+def write_json_atomic(reviews, path):
+    """將評論以與 json.dump(indent=2) 相同的格式逐則寫入暫存檔，fsync 後替換目標檔案，返回寫入的則數"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.tmp"
+    count = 0
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write('[')
+        for review in reviews:
+            f.write(',\n' if count else '\n')
+            f.write(textwrap.indent(json.dumps(public_fields(review), ensure_ascii=False, indent=2), '  '))
+            count += 1
+        f.write('\n]' if count else ']')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+    return count
+
+
+def iter_review_batches(ndjson_path, batch_size=FINALIZE_BATCH_SIZE):
+    """逐批讀取 NDJSON 評論（同一 review_key 只保留第一筆），每批最多 batch_size 則"""
+    seen_keys = set()
+    batch = []
+    for review in read_ndjson(ndjson_path):
+        review_key = review.get('review_key')
+        if review_key in seen_keys:
+            continue
+        if review_key:
+            seen_keys.add(review_key)
+        batch.append(review)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def finalize(ndjson_path, json_path, process_batch=None, batch_size=FINALIZE_BATCH_SIZE):
+    """由 NDJSON 產生網站 JSON；每批評論寫入前先交給 process_batch（可就地補上欄位），返回寫入的則數"""
+
+    def processed_reviews():
+        for batch in iter_review_batches(ndjson_path, batch_size):
+            if process_batch:
+                process_batch(batch)
+            yield from batch
+
+    count = write_json_atomic(processed_reviews(), json_path)
+    print(f"已由 {ndjson_path} 產生 {json_path} ({count} 則評論)")
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='評論串流輸出工具')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    finalize_parser = subparsers.add_parser('finalize', help='由 NDJSON 產生網站使用的 JSON（與爬取正常結束時相同）')
+    finalize_parser.add_argument('ndjson_path')
+    finalize_parser.add_argument('json_path')
+    finalize_parser.add_argument('--incremental', action='store_true', help='增量模式：由評論資料庫匯出該店家的所有評論')
+    args = parser.parse_args()
+
+    if args.command == 'finalize':
+        # 與爬蟲及 batch_crawl.py 共用同一個輸出流程（衍生圖片、拼接圖、評論資料庫、已保存評論索引）
+        from google_reviews_scraper import finalize_run, ScrapingConfig, UserConfig
+        from review_index import SeenReviewIndex
+        review_index = SeenReviewIndex(ScrapingConfig.REVIEW_INDEX_PATH.value)
+        process_images = UserConfig.ENABLE_IMAGES.value and not ScrapingConfig.LAZY_IMAGES.value
+        finalize_run(args.ndjson_path, args.json_path, review_index=review_index,
+                     process_images=process_images, incremental=args.incremental)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
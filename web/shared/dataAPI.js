@@ -99,6 +99,9 @@ class DataAPI {
                 review_date: review.review_date || '',
                 relative_time_description: review.review_date || '', // 兼容舊版本
                 images: processedImages,
+                image_srcsets: this.processImageSrcsets(review),
+                image_sprite: this.processImageSprite(review),
+                image_meta: Array.isArray(review.image_meta) ? review.image_meta : [],
                 total_images: review.total_images || 0,
                 image_directory: review.image_directory || '',
                 scraped_at: review.scraped_at || '',
@@ -114,27 +117,63 @@ class DataAPI {
             return [];
         }
 
-        const imageDirectory = review.image_directory || '';
-        
-        return review.images.map(imageName => {
-            // 從 web/shared/ 到 web/images/ 的路徑（服務器根目錄是 web/）
-            if (imageDirectory) {
-                // 處理 imageDirectory 路徑：移除多餘的 "../web/" 前綴
-                let cleanImageDir = imageDirectory;
-                if (cleanImageDir.startsWith('../web/')) {
-                    cleanImageDir = cleanImageDir.replace('../web/', '');
-                } else if (cleanImageDir.startsWith('web/')) {
-                    cleanImageDir = cleanImageDir.replace('web/', '');
-                }
-                return `../${cleanImageDir}/${imageName}`;
-            } else {
-                // 如果沒有明確的目錄，嘗試從時間戳記推斷
-                const timestamp = this.extractTimestamp(this.latestJsonFile || '');
-                return `../images/${timestamp}/${imageName}`;
+        return review.images.map(imageName => this.resolveImagePath(review, imageName));
+    }
+
+    // 處理衍生圖片的 srcset（與 images 一一對應，沒有衍生圖片的位置為 null）
+    processImageSrcsets(review) {
+        if (!review.images || !Array.isArray(review.image_srcsets)) {
+            return [];
+        }
+
+        return review.image_srcsets.map(entry => {
+            if (!entry || !Array.isArray(entry.srcset) || entry.srcset.length === 0) {
+                return null;
             }
+            return {
+                type: entry.type || 'image/webp',
+                srcset: entry.srcset
+                    .map(variant => `${this.resolveImagePath(review, variant.file)} ${variant.width}w`)
+                    .join(', ')
+            };
         });
     }
 
+    // 處理縮圖拼接圖（frames 與 images 的前幾張一一對應），沒有時為 null
+    processImageSprite(review) {
+        const sprite = review.image_sprite;
+        if (!sprite || !sprite.file || !Array.isArray(sprite.frames) || sprite.frames.length === 0) {
+            return null;
+        }
+        return {
+            url: this.resolveImagePath(review, sprite.file),
+            width: sprite.width,
+            height: sprite.height,
+            frames: sprite.frames
+        };
+    }
+
+    // 將圖片檔名轉換為網頁路徑
+    resolveImagePath(review, imageName) {
+        const imageDirectory = review.image_directory || '';
+
+        // 從 web/shared/ 到 web/images/ 的路徑（服務器根目錄是 web/）
+        if (imageDirectory) {
+            // 處理 imageDirectory 路徑：移除多餘的 "../web/" 前綴
+            let cleanImageDir = imageDirectory;
+            if (cleanImageDir.startsWith('../web/')) {
+                cleanImageDir = cleanImageDir.replace('../web/', '');
+            } else if (cleanImageDir.startsWith('web/')) {
+                cleanImageDir = cleanImageDir.replace('web/', '');
+            }
+            return `../${cleanImageDir}/${imageName}`;
+        } else {
+            // 如果沒有明確的目錄，嘗試從時間戳記推斷
+            const timestamp = this.extractTimestamp(this.latestJsonFile || '');
+            return `../images/${timestamp}/${imageName}`;
+        }
+    }
+
     // 備用評論數據（當無法載入真實數據時使用）
     getFallbackReviews() {
         return [
@@ -198,6 +237,92 @@ class DataAPI {
     }
 }
 
+// BlurHash 解碼：把 JSON 中的佔位字串畫成小圖，在原圖載入前作為模糊預覽
+const BLURHASH_CHARS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~';
+const blurhashCache = new Map();
+const TRANSPARENT_PIXEL = 'data:image/gif;base64,R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7';
+
+function decodeBase83(str) {
+    return [...str].reduce((value, char) => value * 83 + BLURHASH_CHARS.indexOf(char), 0);
+}
+
+function srgbToLinear(value) {
+    const v = value / 255;
+    return v <= 0.04045 ? v / 12.92 : Math.pow((v + 0.055) / 1.055, 2.4);
+}
+
+function linearToSrgb(value) {
+    const v = Math.max(0, Math.min(1, value));
+    return v <= 0.0031308 ? Math.round(v * 12.92 * 255) : Math.round((1.055 * Math.pow(v, 1 / 2.4) - 0.055) * 255);
+}
+
+function signPow(value, exponent) {
+    return Math.sign(value) * Math.pow(Math.abs(value), exponent);
+}
+
+// 返回 data URL（無法解碼或不在瀏覽器環境時返回空字串）
+function decodeBlurhash(hash, width = 32, height = 32) {
+    if (!hash || hash.length < 6 || typeof document === 'undefined') {
+        return '';
+    }
+    if (blurhashCache.has(hash)) {
+        return blurhashCache.get(hash);
+    }
+
+    const sizeFlag = decodeBase83(hash[0]);
+    const numX = (sizeFlag % 9) + 1;
+    const numY = Math.floor(sizeFlag / 9) + 1;
+    if (hash.length !== 4 + 2 * numX * numY) {
+        return '';
+    }
+
+    const maxValue = (decodeBase83(hash[1]) + 1) / 166;
+    const colors = [];
+    for (let i = 0; i < numX * numY; i++) {
+        if (i === 0) {
+            const value = decodeBase83(hash.substring(2, 6));
+            colors.push([srgbToLinear(value >> 16), srgbToLinear((value >> 8) & 255), srgbToLinear(value & 255)]);
+        } else {
+            const value = decodeBase83(hash.substring(4 + i * 2, 6 + i * 2));
+            colors.push([
+                signPow((Math.floor(value / 361) - 9) / 9, 2) * maxValue,
+                signPow((Math.floor(value / 19) % 19 - 9) / 9, 2) * maxValue,
+                signPow((value % 19 - 9) / 9, 2) * maxValue
+            ]);
+        }
+    }
+
+    const canvas = document.createElement('canvas');
+    canvas.width = width;
+    canvas.height = height;
+    const context = canvas.getContext('2d');
+    const imageData = context.createImageData(width, height);
+    for (let y = 0; y < height; y++) {
+        for (let x = 0; x < width; x++) {
+            let r = 0, g = 0, b = 0;
+            for (let j = 0; j < numY; j++) {
+                for (let i = 0; i < numX; i++) {
+                    const basis = Math.cos(Math.PI * x * i / width) * Math.cos(Math.PI * y * j / height);
+                    const color = colors[i + j * numX];
+                    r += color[0] * basis;
+                    g += color[1] * basis;
+                    b += color[2] * basis;
+                }
+            }
+            const offset = 4 * (x + y * width);
+            imageData.data[offset] = linearToSrgb(r);
+            imageData.data[offset + 1] = linearToSrgb(g);
+            imageData.data[offset + 2] = linearToSrgb(b);
+            imageData.data[offset + 3] = 255;
+        }
+    }
+    context.putImageData(imageData, 0, 0);
+
+    const dataUrl = canvas.toDataURL();
+    blurhashCache.set(hash, dataUrl);
+    return dataUrl;
+}
+
 // 增強的 ReviewManager 類，使用 DataAPI
 class EnhancedReviewManager {
     constructor() {
@@ -243,10 +368,30 @@ class EnhancedReviewManager {
             let imageHtml = '';
             if (review.images && review.images.length > 0) {
                 const imagesToShow = review.images.slice(0, 3);
-                const imageElements = imagesToShow.map(imgSrc => `
-                    <img src="${imgSrc}" alt="評論圖片" style="max-width: 32%; height: auto; border-radius: 8px; display: inline-block;" 
-                         onerror="this.style.display='none'">
-                `).join('');
+                const srcsets = review.image_srcsets || [];
+                const imageMeta = review.image_meta || [];
+                const sprite = review.image_sprite;
+                const imageElements = imagesToShow.map((imgSrc, index) => {
+                    if (sprite && sprite.frames[index]) {
+                        return this.spriteTile(sprite, sprite.frames[index], imgSrc, imageMeta[index]);
+                    }
+                    const variant = srcsets[index];
+                    const placeholder = this.placeholderAttributes(imageMeta[index]);
+                    if (!variant) {
+                        return `
+                    <img src="${imgSrc}" alt="評論圖片" ${placeholder.size} style="max-width: 32%; height: auto; border-radius: 8px; display: inline-block;${placeholder.style}" 
+                         onload="this.style.background='none'" onerror="this.style.display='none'">
+                `;
+                    }
+                    // 有衍生圖片時由瀏覽器依顯示寬度挑選較小的檔案
+                    return `
+                    <picture style="max-width: 32%; display: inline-block;">
+                        <source type="${variant.type}" srcset="${variant.srcset}" sizes="(max-width: 768px) 32vw, 320px">
+                        <img src="${imgSrc}" alt="評論圖片" ${placeholder.size} style="width: 100%; height: auto; border-radius: 8px;${placeholder.style}" 
+                             loading="lazy" decoding="async" onload="this.style.background='none'" onerror="this.closest('picture').style.display='none'">
+                    </picture>
+                `;
+                }).join('');
 
                 imageHtml = `
                     <div class="review-image" style="margin-top: 15px; display: flex; gap: 2%; flex-wrap: wrap;">
@@ -283,6 +428,30 @@ class EnhancedReviewManager {
         }
     }
 
+    // 圖片的寬高屬性（保留版面）與主色 / BlurHash 背景（原圖載入前的預覽）
+    placeholderAttributes(meta) {
+        if (!meta || !meta.width || !meta.height) {
+            return { size: '', style: '' };
+        }
+        const preview = decodeBlurhash(meta.blurhash);
+        const background = preview
+            ? ` background: ${meta.color || '#ddd'} url(${preview}) center / cover no-repeat;`
+            : ` background: ${meta.color || '#ddd'};`;
+        return { size: `width="${meta.width}" height="${meta.height}"`, style: background };
+    }
+
+    // 以拼接圖的一格顯示縮圖（整則評論只需一個圖片請求），點擊時燈箱載入 data-full-src 的完整圖片
+    spriteTile(sprite, frame, fullSrc, meta) {
+        const sizeX = sprite.width / frame.width * 100;
+        const positionX = sprite.width > frame.width ? frame.x / (sprite.width - frame.width) * 100 : 0;
+        const positionY = sprite.height > frame.height ? frame.y / (sprite.height - frame.height) * 100 : 0;
+        const color = (meta && meta.color) || '#ddd';
+        return `
+                    <img src="${TRANSPARENT_PIXEL}" data-full-src="${fullSrc}" alt="評論圖片" 
+                         style="width: 32%; aspect-ratio: ${frame.width} / ${frame.height}; border-radius: 8px; display: inline-block; background: ${color} url(${sprite.url}) ${positionX}% ${positionY}% / ${sizeX}% auto no-repeat;">
+                `;
+    }
+
     showMoreReviews(containerId) {
         this.reviewsToShow += this.reviewsPerPage;
         this.displayReviews(containerId);
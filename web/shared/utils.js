@@ -202,6 +202,7 @@ function initializeLightbox() {
     let touchStartY = 0;
     let isDragging = false;
 
+    // 拼接圖縮圖的 src 是透明像素，完整圖片路徑在 data-full-src
     function openLightbox(src) {
         lightboxImg.src = src;
         lightbox.style.display = 'flex';
@@ -235,7 +236,7 @@ function initializeLightbox() {
         if (!isDragging && e.target.tagName === 'IMG' && (e.target.closest('.review-image') || e.target.closest('.review-images'))) {
             if (!e.target.closest('#lightbox')) {
                 e.preventDefault();
-                openLightbox(e.target.src);
+                openLightbox(e.target.dataset.fullSrc || e.target.src);
             }
         }
         // Reset
@@ -252,7 +253,7 @@ function initializeLightbox() {
         if (e.target.tagName === 'IMG' && (e.target.closest('.review-image') || e.target.closest('.review-images'))) {
             if (!e.target.closest('#lightbox')) {
                 e.preventDefault();
-                openLightbox(e.target.src);
+                openLightbox(e.target.dataset.fullSrc || e.target.src);
             }
         }
     });
@@ -13,9 +13,22 @@ import webbrowser
 import os
 import sys
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from image_pack import ImagePack
+
 PORT = 8000
 
 class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
+    image_pack = None  # 图片封装档（python src/image_pack.py build 产生），已封装的图片直接由封装档送出
+
+    def do_GET(self):
+        if self.image_pack is None or not self.image_pack.send(self, self.translate_path(self.path)):
+            super().do_GET()
+
+    def do_HEAD(self):
+        if self.image_pack is None or not self.image_pack.send(self, self.translate_path(self.path), head_only=True):
+            super().do_HEAD()
+
     def end_headers(self):
         # 添加 CORS 头，允许跨域请求
         self.send_header('Access-Control-Allow-Origin', '*')
@@ -26,6 +39,7 @@ class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
 if __name__ == "__main__":
     # 保持在 web 目录，这样 shared/ 下的文件可以直接访问
     # 同时通过相对路径访问上级目录的 data/ 和 images/
+    MyHTTPRequestHandler.image_pack = ImagePack('images')
 
     with socketserver.TCPServer(("", PORT), MyHTTPRequestHandler) as httpd:
         print(f"🚀 服务器启动成功！")